@@ -3,6 +3,21 @@ Programa para resolver problemas del Criterio de Kutzbach
 Calcula los grados de libertad (DOF) de un mecanismo
 """
 
+# Clasificación según M: M < 0, M == 0, M == 1, M > 1
+CLASIFICACIONES = ("indeterminado", "determinado", "desmodromico", "movil")
+
+
+def clasificar(M):
+    """Devuelve la clasificación del mecanismo según sus grados de libertad"""
+    if M < 0:
+        return "indeterminado"
+    elif M == 0:
+        return "determinado"
+    elif M == 1:
+        return "desmodromico"
+    else:
+        return "movil"
+
 
 class MecanismoKutzbach:
     """
@@ -93,11 +108,12 @@ class MecanismoKutzbach:
         M = self.calcular()
         print(f"\nGrados de libertad (M): {M}")
 
-        if M < 0:
+        clase = clasificar(M)
+        if clase == "indeterminado":
             print("⚠️  Mecanismo INDETERMINADO (estructura redundante)")
-        elif M == 0:
+        elif clase == "determinado":
             print("✓ Mecanismo DETERMINADO (estructura rígida)")
-        elif M == 1:
+        elif clase == "desmodromico":
             print("✓ Mecanismo DESMODRÓMICO (1 grado de libertad)")
         else:
             print(f"✓ Mecanismo con {M} grados de libertad")
@@ -0,0 +1,393 @@
+"""
+Criterio de Kutzbach por lotes: millones de mecanismos a la vez con NumPy
+
+Calcula M y la clasificación (indeterminado, determinado, desmodromico,
+movil) de muchos mecanismos en forma vectorizada, con los mismos
+resultados que MecanismoKutzbach, y procesa catálogos CSV o JSONL por
+tandas sin cargarlos enteros en memoria:
+
+    python kutzbach_lote.py catalogo.csv resultados.csv --verificar 100
+
+CSV: columnas n (o eslabones), j1..j5 y dimension ("2D"/"3D"); las
+columnas que falten valen 0 (pares) o "2D" (dimension), como en
+resolver_problema.
+JSONL: un objeto por línea, plano ({"n": 4, "j1": 4, "dimension": "2D"})
+o con el formato de resolver_problema ({"eslabones": 4, "pares": {"1": 4}}).
+La salida repite cada fila con dos campos más: M y clasificacion.
+
+Igual que la clase, son errores: n < 1, una dimensión que no sea
+exactamente "2D" o "3D", un tipo de par fuera de 1..5 y (porque el cálculo
+es con enteros) un n o una cantidad de pares que no sea entera. Con
+--invalidas marcar esas filas quedan con clasificacion "invalido" y se
+sigue. Una fila CSV con otra cantidad de columnas que el encabezado
+también es inválida; un JSONL que no se puede leer es siempre un error.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from kutzbach import CLASIFICACIONES, clasificar, resolver_problema
+
+# Coeficientes de j1..j5 en cada fórmula (en 2D solo cuentan j1 y j2)
+PESOS_2D = np.array([2, 1, 0, 0, 0], dtype=np.int64)
+PESOS_3D = np.array([5, 4, 3, 2, 1], dtype=np.int64)
+
+INVALIDO = -1
+
+# Tipos de par que acepta agregar_pares, como claves de JSON
+TIPOS = ("1", "2", "3", "4", "5")
+
+
+def dimension_3d(dimension):
+    """
+    Convierte las dimensiones a (es_3d, valida) como arreglos booleanos
+    Como en MecanismoKutzbach, solo valen exactamente "2D" y "3D"
+    """
+    dimension = np.asarray(dimension)
+    if dimension.dtype.kind != "U":
+        ninguna = np.zeros(dimension.shape, dtype=bool)
+        return ninguna, ninguna
+    es_3d = dimension == "3D"
+    return es_3d, es_3d | (dimension == "2D")
+
+
+def calcular_lote(n, pares, dimension, estricto=True, primera_fila=0, leidas=None):
+    """
+    Calcula los grados de libertad de muchos mecanismos a la vez
+    n: eslabones, forma (N,)
+    pares: cantidades j1..j5, forma (N, 5)
+    dimension: "2D"/"3D" por fila, forma (N,) o un solo valor
+    leidas: máscara opcional de filas que se pudieron leer (las demás son
+    inválidas de entrada)
+    Devuelve (M, codigos, validos): codigos indexa CLASIFICACIONES y vale
+    INVALIDO en las filas que la clase rechazaría. Con estricto=True esas
+    filas levantan ValueError, como MecanismoKutzbach (primera_fila es el
+    número de la primera fila en el archivo, para el mensaje).
+    """
+    n = np.asarray(n, dtype=np.int64).reshape(-1)
+    pares = np.asarray(pares, dtype=np.int64).reshape(len(n), 5)
+    es_3d, dimension_valida = dimension_3d(dimension)
+    es_3d = np.broadcast_to(es_3d, n.shape)
+    dimension_valida = np.broadcast_to(dimension_valida, n.shape)
+
+    base = n - 1
+    M = np.where(es_3d, 6 * base - pares @ PESOS_3D, 3 * base - pares @ PESOS_2D)
+    validos = (n >= 1) & dimension_valida
+    if leidas is not None:
+        validos &= leidas
+
+    if estricto and not validos.all():
+        i = int(np.argmin(validos))
+        ilegibles = {} if leidas is None or leidas[i] else {i: "no se pudo leer"}
+        raise ValueError(f"Fila {primera_fila + i}: {_motivo(i, n, ilegibles)}")
+
+    # M < 0, 0, 1, > 1  ->  0, 1, 2, 3 (el orden de CLASIFICACIONES)
+    codigos = (np.clip(M, -1, 2) + 1).astype(np.int8)
+    codigos[~validos] = INVALIDO
+    return M, codigos, validos
+
+
+def _motivo(i, n, ilegibles):
+    """Por qué la clase rechazaría la fila i (ilegibles: {fila: motivo} de la lectura)"""
+    if i in ilegibles:
+        return ilegibles[i]
+    if n[i] < 1:
+        return "el número de eslabones debe ser al menos 1"
+    return "dimensión debe ser '2D' o '3D'"
+
+
+def nombres_clasificacion(codigos):
+    """Códigos -> nombres ("invalido" para INVALIDO)"""
+    nombres = np.array(CLASIFICACIONES + ("invalido",), dtype=object)
+    return nombres[codigos]
+
+
+def verificar_contra_clase(n, pares, dimension, M, codigos, muestras, rng,
+                           lineas=None):
+    """
+    Recalcula `muestras` filas al azar con MecanismoKutzbach y compara
+    Levanta RuntimeError si alguna no coincide (lineas: número de línea en
+    el archivo de cada fila, para el mensaje)
+    """
+    es_3d, _validos = dimension_3d(dimension)
+    es_3d = np.broadcast_to(es_3d, np.shape(n))
+    validas = np.flatnonzero(codigos != INVALIDO)
+    if len(validas) == 0:
+        return 0
+    elegidas = rng.choice(validas, size=min(muestras, len(validas)), replace=False)
+    for i in elegidas:
+        problema = {
+            "dimension": "3D" if es_3d[i] else "2D",
+            "eslabones": int(n[i]),
+            "pares": {t + 1: int(c) for t, c in enumerate(pares[i])},
+        }
+        M_clase = resolver_problema(problema).calcular()
+        if M_clase != M[i] or clasificar(M_clase) != CLASIFICACIONES[codigos[i]]:
+            raise RuntimeError(
+                f"{_donde(i, lineas)}: la clase da M={M_clase} ({clasificar(M_clase)}) "
+                f"y el lote M={M[i]} ({CLASIFICACIONES[codigos[i]]})")
+    return len(elegidas)
+
+
+# ============= LECTURA Y ESCRITURA POR TANDAS =============
+
+def _donde(i, lineas):
+    return f"Línea {lineas[i]}" if lineas is not None else f"Fila {i}"
+
+
+def _rechazar_primera(validos, n, ilegibles, lineas):
+    """Con --invalidas error: ValueError por la primera fila inválida de la tanda"""
+    i = int(np.argmin(validos))
+    raise ValueError(f"{_donde(i, lineas)}: {_motivo(i, n, ilegibles)}")
+
+
+def _tandas(filas, tamano):
+    """Agrupa un iterable en listas de hasta `tamano` elementos"""
+    filas = iter(filas)
+    while True:
+        tanda = list(itertools.islice(filas, tamano))
+        if not tanda:
+            return
+        yield tanda
+
+
+def _enteros(valores, columna, ilegibles):
+    """
+    Lista de textos -> arreglo int64. Los que no son enteros quedan en 0 y
+    se anotan en ilegibles {fila: motivo} (si la fila no tenía ya otro)
+    """
+    try:
+        # int() por valor es varias veces más rápido que astype sobre textos
+        return np.fromiter(map(int, valores), np.int64, len(valores))
+    except (ValueError, OverflowError):
+        pass
+    enteros = np.zeros(len(valores), dtype=np.int64)
+    for k, v in enumerate(valores):
+        try:
+            enteros[k] = int(v)
+        except (ValueError, OverflowError):
+            ilegibles.setdefault(k, f"'{v}' no es un entero en la columna {columna}")
+    return enteros
+
+
+def _leidas(cantidad, ilegibles):
+    leidas = np.ones(cantidad, dtype=bool)
+    leidas[list(ilegibles)] = False
+    return leidas
+
+
+def _columnas_csv(encabezado):
+    """Posición de n, j1..j5 y dimension en el encabezado (None si falta)"""
+    posiciones = {nombre.strip().lower(): k for k, nombre in enumerate(encabezado)}
+    n = posiciones.get("n", posiciones.get("eslabones"))
+    if n is None:
+        raise ValueError("El CSV necesita una columna 'n' o 'eslabones'")
+    for nombre in posiciones:
+        if nombre[:1] == "j" and nombre[1:].isdigit() and nombre[1:] not in TIPOS:
+            raise ValueError(f"Columna {nombre}: el tipo de par debe estar entre 1 y 5")
+    pares = [posiciones.get(f"j{t}") for t in range(1, 6)]
+    return n, pares, posiciones.get("dimension")
+
+
+def procesar_csv(entrada, salida, tamano, estricto, al_lote):
+    """
+    Los errores citan la línea del archivo (el encabezado es la 1); con
+    estricto se informa la primera fila inválida de la tanda
+    """
+    lector = csv.reader(entrada)
+    # Las líneas en blanco no cuentan como filas
+    filas = ((lector.line_num, fila) for fila in lector if fila)
+    escritor = csv.writer(salida, lineterminator="\n")
+    _linea, encabezado = next(filas, (0, None))
+    if encabezado is None:
+        raise ValueError("El CSV está vacío: falta el encabezado")
+    col_n, col_pares, col_dim = _columnas_csv(encabezado)
+    ancho = len(encabezado)
+    escritor.writerow(encabezado + ["M", "clasificacion"])
+
+    total = 0
+    for tanda in _tandas(filas, tamano):
+        lineas = [linea for linea, _fila in tanda]
+        tanda = [fila for _linea, fila in tanda]
+        ilegibles = {}
+        parejas = tanda
+        for k, fila in enumerate(tanda):
+            if len(fila) != ancho:
+                ilegibles[k] = f"tiene {len(fila)} columnas y el encabezado {ancho}"
+                if parejas is tanda:
+                    parejas = list(tanda)
+                parejas[k] = ["0"] * ancho  # se completa para leer la tanda
+        columnas = list(zip(*parejas))
+
+        n = _enteros(columnas[col_n], "n", ilegibles)
+        pares = np.zeros((len(tanda), 5), dtype=np.int64)
+        for t, col in enumerate(col_pares):
+            if col is not None:
+                pares[:, t] = _enteros(columnas[col], f"j{t + 1}", ilegibles)
+        dimension = np.array(columnas[col_dim]) if col_dim is not None else "2D"
+
+        M, codigos, validos = calcular_lote(n, pares, dimension, estricto=False,
+                                            leidas=_leidas(len(tanda), ilegibles))
+        if estricto and not validos.all():
+            _rechazar_primera(validos, n, ilegibles, lineas)
+        al_lote(n, pares, dimension, M, codigos, lineas)
+        M_texto = [str(m) if v else "" for m, v in zip(M.tolist(), validos.tolist())]
+        escritor.writerows(fila + [m, c] for fila, m, c in zip(
+            tanda, M_texto, nombres_clasificacion(codigos).tolist()))
+        total += len(tanda)
+    return total
+
+
+def _leer_objeto(objeto):
+    """
+    (n, [j1..j5], dimension) de un objeto JSONL plano o de resolver_problema
+    Levanta ValueError con lo que la clase rechazaría: tipos de par fuera
+    de 1..5 y valores que no son enteros
+    """
+    n = objeto.get("n", objeto.get("eslabones"))
+    pares_dict = objeto.get("pares", {})
+    if not isinstance(pares_dict, dict):
+        raise ValueError("'pares' debe ser un objeto {tipo: cantidad}")
+    tipos = list(pares_dict) + [clave[1:] for clave in objeto
+                                if clave[:1] == "j" and clave[1:].isdigit()]
+    for tipo in tipos:
+        if tipo not in TIPOS:
+            raise ValueError(f"el tipo de par debe estar entre 1 y 5 (vino {tipo!r})")
+    pares = [objeto.get(f"j{t}", pares_dict.get(str(t), 0)) for t in range(1, 6)]
+    # bool es subclase de int pero no es una cantidad
+    for valor in [n] + pares:
+        if type(valor) is not int:
+            raise ValueError(f"{valor!r} no es un entero")
+    dimension = objeto.get("dimension", "2D")
+    return n, pares, dimension if isinstance(dimension, str) else repr(dimension)
+
+
+def procesar_jsonl(entrada, salida, tamano, estricto, al_lote):
+    """Como procesar_csv; las líneas se cuentan desde 1 (no hay encabezado)"""
+    total = 0
+    lineas = ((numero, linea) for numero, linea in enumerate(entrada, 1) if linea.strip())
+    for tanda in _tandas(lineas, tamano):
+        numeros = [numero for numero, _linea in tanda]
+        objetos = []
+        valores = []
+        ilegibles = {}
+        for k, (numero, linea) in enumerate(tanda):
+            try:
+                objeto = json.loads(linea)
+            except ValueError as e:
+                raise ValueError(f"Línea {numero}: JSON inválido ({e})")
+            if not isinstance(objeto, dict):
+                raise ValueError(f"Línea {numero}: se esperaba un objeto JSON")
+            try:
+                valores.append(_leer_objeto(objeto))
+            except ValueError as e:
+                valores.append((1, [0] * 5, ""))  # se lee como inválida
+                ilegibles[k] = str(e)
+            objetos.append(objeto)
+        n = np.array([v[0] for v in valores], dtype=np.int64)
+        pares = np.array([v[1] for v in valores], dtype=np.int64)
+        dimension = np.array([v[2] for v in valores], dtype=str)
+
+        M, codigos, validos = calcular_lote(n, pares, dimension, estricto=False,
+                                            leidas=_leidas(len(tanda), ilegibles))
+        if estricto and not validos.all():
+            _rechazar_primera(validos, n, ilegibles, numeros)
+        al_lote(n, pares, dimension, M, codigos, numeros)
+        for objeto, m, valido, clase in zip(objetos, M.tolist(), validos.tolist(),
+                                            nombres_clasificacion(codigos).tolist()):
+            objeto["M"] = m if valido else None
+            objeto["clasificacion"] = clase
+            salida.write(json.dumps(objeto, ensure_ascii=False) + "\n")
+        total += len(tanda)
+    return total
+
+
+def _formato(ruta, formato):
+    if formato:
+        return formato
+    if ruta.lower().endswith(".csv"):
+        return "csv"
+    if ruta.lower().endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise ValueError(f"No sé el formato de '{ruta}': use --formato csv|jsonl")
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Criterio de Kutzbach por lotes sobre archivos CSV o JSONL")
+    ap.add_argument("entrada", help="Archivo CSV/JSONL de mecanismos ('-' = stdin)")
+    ap.add_argument("salida", help="Archivo de resultados ('-' = stdout)")
+    ap.add_argument("--formato", choices=["csv", "jsonl"], default=None,
+                    help="Formato de entrada y salida (por defecto, según la extensión)")
+    ap.add_argument("--tanda", type=int, default=100_000,
+                    help="Filas procesadas por vez")
+    ap.add_argument("--invalidas", choices=["error", "marcar"], default="error",
+                    help="Qué hacer con filas que la clase rechazaría")
+    ap.add_argument("--verificar", type=int, default=0,
+                    help="Filas al azar por tanda recalculadas con MecanismoKutzbach")
+    args = ap.parse_args()
+
+    try:
+        formato = _formato(args.entrada if args.entrada != "-" else args.salida,
+                           args.formato)
+    except ValueError as e:
+        ap.error(str(e))
+
+    rng = np.random.default_rng(0)
+    conteo = np.zeros(len(CLASIFICACIONES) + 1, dtype=np.int64)
+    verificadas = 0
+
+    def al_lote(n, pares, dimension, M, codigos, lineas):
+        nonlocal verificadas
+        conteo[:] += np.bincount(codigos.astype(np.int64) + 1, minlength=len(conteo))
+        if args.verificar:
+            verificadas += verificar_contra_clase(n, pares, dimension, M, codigos,
+                                                  args.verificar, rng, lineas)
+
+    procesar = procesar_csv if formato == "csv" else procesar_jsonl
+    entrada = (sys.stdin if args.entrada == "-"
+               else open(args.entrada, newline="", encoding="utf-8"))
+    # Se escribe a un .tmp y se renombra al terminar: un error no deja a
+    # medias el archivo de resultados
+    tmp = None if args.salida == "-" else args.salida + ".tmp"
+    salida = sys.stdout if tmp is None else open(tmp, "w", newline="", encoding="utf-8")
+    t0 = time.perf_counter()
+    completo = False
+    try:
+        filas = procesar(entrada, salida, max(1, args.tanda),
+                         args.invalidas == "error", al_lote)
+        completo = True
+    except ValueError as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if entrada is not sys.stdin:
+            entrada.close()
+        if tmp is not None:
+            salida.close()
+            if completo:
+                os.replace(tmp, args.salida)
+            else:
+                os.remove(tmp)
+    segundos = time.perf_counter() - t0
+
+    # El resumen va a stderr para no mezclarse con la salida por stdout
+    print(f"{filas} mecanismos en {segundos:.2f} s "
+          f"({filas / max(segundos, 1e-9):,.0f} por segundo)", file=sys.stderr)
+    for nombre, cantidad in zip(("invalido",) + CLASIFICACIONES,
+                                [conteo[0]] + conteo[1:].tolist()):
+        if cantidad:
+            print(f"  {nombre}: {cantidad}", file=sys.stderr)
+    if args.verificar:
+        print(f"  verificadas con MecanismoKutzbach: {verificadas}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
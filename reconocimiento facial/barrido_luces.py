@@ -0,0 +1,200 @@
+"""
+Barrido de parámetros de color sobre un cache de detecciones.
+
+Usa las detecciones guardadas por pruebavideo.py --det-cache (no corre YOLO)
+y evalúa la etapa de luces de freno para cada combinación de una grilla:
+
+    python3 barrido_luces.py --input video.mp4 --dets cache/dets_xxx.npz \\
+        --s-min 70,85,100 --v-min 60,70,90 --min-area 40,60 --workers 4
+
+Las combinaciones se reparten entre procesos; cada proceso decodifica el
+video una sola vez y aplica todas sus combinaciones a cada frame.
+
+Por combinación se reporta: fracción de vehículos con luces, luces por
+vehículo, cambios encendido/apagado por cada 100 apariciones de un track
+(una luz de freno real no parpadea frame a frame, así que menos es mejor a
+igual detección) y el costo de la etapa de color.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+
+import cv2
+
+import pruebavideo as pv
+from cache_detecciones import Detecciones, huella_archivo
+from luces_freno import TABLAS_EN_MEMORIA
+
+# Parámetros de la etapa de color que se pueden barrer (nombre en args, tipo)
+PARAMETROS = [
+    ("bottom_frac", float),
+    ("s_min", int),
+    ("v_min", int),
+    ("min_area", int),
+    ("max_area_frac", float),
+    ("min_solidity", float),
+]
+
+
+class Resumen:
+    """Estadísticas de una combinación de parámetros."""
+
+    def __init__(self):
+        self.frames = 0
+        self.vehiculos = 0
+        self.con_luces = 0
+        self.luces = 0
+        self.cambios = 0
+        self.segundos = 0.0
+        self._encendida = {}  # track -> tenía luces en su última aparición
+
+    def agregar(self, vehiculos, segundos: float):
+        self.frames += 1
+        self.segundos += segundos
+        for det, light_boxes in vehiculos:
+            encendida = bool(light_boxes)
+            self.vehiculos += 1
+            self.con_luces += encendida
+            self.luces += len(light_boxes)
+            previa = self._encendida.get(det[4])
+            if previa is not None and previa != encendida:
+                self.cambios += 1
+            self._encendida[det[4]] = encendida
+
+    def resultado(self) -> dict:
+        n = max(self.vehiculos, 1)
+        return {
+            "frames": self.frames,
+            "vehiculos": self.vehiculos,
+            "con_luces": self.con_luces / n,
+            "luces_por_vehiculo": self.luces / n,
+            "cambios_100": 100.0 * self.cambios / n,
+            "ms_frame": 1000.0 * self.segundos / max(self.frames, 1),
+        }
+
+
+def grilla(args):
+    """Todas las combinaciones de los valores pedidos, como dicts."""
+    valores = [getattr(args, nombre) for nombre, _tipo in PARAMETROS]
+    return [dict(zip((nombre for nombre, _tipo in PARAMETROS), combinacion))
+            for combinacion in itertools.product(*valores)]
+
+
+def _evaluar_grupo(tarea):
+    """Proceso hijo: recorre el video una vez aplicando varias combinaciones."""
+    video, dets_path, base, combinaciones, hilos = tarea
+    cv2.setNumThreads(hilos)
+    detecciones = Detecciones(dets_path)
+    configs = [argparse.Namespace(**{**base, **comb}) for comb in combinaciones]
+    resumenes = [Resumen() for _ in configs]
+
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise RuntimeError(f"No pude abrir: {video}")
+    # Un cache grabado con --start/--end empieza en el frame `inicio` del
+    # video: hay que leer desde ahí para que cada frame tenga sus detecciones
+    inicio, fin = detecciones.clave.get("rango", [0, None])
+    if inicio > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, inicio)
+    frames = pv.leer_frames(cap)
+    if fin is not None:
+        frames = itertools.islice(frames, fin - inicio)
+    try:
+        for frame, dets in zip(frames, detecciones):
+            for cfg, resumen in zip(configs, resumenes):
+                t0 = time.perf_counter()
+                vehiculos, _mask = pv.analizar_vehiculos(
+                    frame, dets, cfg, escala=cfg.color_scale)
+                resumen.agregar(vehiculos, time.perf_counter() - t0)
+    finally:
+        cap.release()
+    return [{**comb, **r.resultado()} for comb, r in zip(combinaciones, resumenes)]
+
+
+def _lista(tipo):
+    def convertir(texto):
+        return [tipo(v) for v in texto.split(",") if v.strip()]
+    return convertir
+
+
+def construir_parser():
+    defaults = pv.construir_parser()
+    ap = argparse.ArgumentParser(
+        description="Barrido de parámetros de luces de freno desde un cache")
+    ap.add_argument("--input", required=True, help="Video de entrada .mp4")
+    ap.add_argument("--dets", required=True,
+                    help="Cache de detecciones (.npz de pruebavideo --det-cache)")
+    for nombre, tipo in PARAMETROS:
+        flag = "--" + nombre.replace("_", "-")
+        ap.add_argument(flag, type=_lista(tipo),
+                        default=[defaults.get_default(nombre)],
+                        help=f"Valores separados por coma "
+                             f"(por defecto {defaults.get_default(nombre)})")
+    ap.add_argument("--mask-engine", choices=["roi", "frame"], default="roi")
+    ap.add_argument("--red-lut", action="store_true",
+                    help="Clasifica el rojo con la tabla BGR en vez de HSV")
+    ap.add_argument("--color-scale", type=float, default=1.0,
+                    help="Factor de reducción para el análisis de color")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="Procesos (0 = uno por CPU)")
+    ap.add_argument("--json", default=None, help="Guarda la tabla en JSON")
+    return ap
+
+
+def main():
+    ap = construir_parser()
+    args = ap.parse_args()
+    if not 0 < args.color_scale <= 1:
+        ap.error("--color-scale debe estar en (0, 1]")
+
+    detecciones = Detecciones(args.dets)
+    if detecciones.clave["video"] != huella_archivo(args.input):
+        ap.error(f"El cache {args.dets} no corresponde a {args.input}")
+
+    combinaciones = grilla(args)
+    if args.red_lut and len(args.s_min) * len(args.v_min) > TABLAS_EN_MEMORIA:
+        # Cada proceso rearmaría las tablas en cada frame
+        ap.error(f"Con --red-lut se admiten hasta {TABLAS_EN_MEMORIA} pares "
+                 "(s_min, v_min) por barrido")
+    procesos = max(1, min(args.workers or os.cpu_count() or 1, len(combinaciones)))
+    hilos = max(1, (os.cpu_count() or 1) // procesos)
+    grupos = [combinaciones[k::procesos] for k in range(procesos)]
+    base = {"mask_engine": args.mask_engine, "red_lut": args.red_lut,
+            "color_scale": args.color_scale}
+    print(f"{len(combinaciones)} combinaciones, {len(detecciones)} frames, "
+          f"{procesos} procesos")
+
+    t0 = time.perf_counter()
+    tareas = [(args.input, args.dets, base, grupo, hilos) for grupo in grupos]
+    if procesos == 1:
+        partes = [_evaluar_grupo(t) for t in tareas]
+    else:
+        with mp.get_context("spawn").Pool(procesos) as pool:
+            partes = pool.map(_evaluar_grupo, tareas, chunksize=1)
+    # Devuelve las filas en el orden de la grilla
+    filas = [None] * len(combinaciones)
+    for k, parte in enumerate(partes):
+        filas[k::procesos] = parte
+    segundos = time.perf_counter() - t0
+
+    varian = [n for n, _t in PARAMETROS if len(getattr(args, n)) > 1] or ["s_min"]
+    print("".join(f"{n:>14}" for n in varian)
+          + f"{'con_luces':>11}{'luces/veh':>11}{'cambios/100':>13}{'ms/frame':>10}")
+    for f in filas:
+        print("".join(f"{f[n]:>14g}" for n in varian)
+              + f"{f['con_luces']:>11.3f}{f['luces_por_vehiculo']:>11.3f}"
+              f"{f['cambios_100']:>13.2f}{f['ms_frame']:>10.2f}")
+    print(f"Tiempo total: {segundos:.1f} s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"dets": args.dets, "clave": detecciones.clave,
+                       "filas": filas}, fh, indent=2, ensure_ascii=False)
+        print(f"Guardado: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
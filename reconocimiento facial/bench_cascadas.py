@@ -0,0 +1,342 @@
+"""
+Benchmark de velocidad y recall de los clasificadores Haar según sus parámetros.
+
+Corre cada cascada (por defecto haarcascade_frontalface_default.xml y
+cars.xml) sobre un conjunto de imágenes etiquetadas para cada combinación
+de una grilla de scaleFactor, minNeighbors, minSize, maxSize y escala de
+entrada, y reporta ms por frame, recall y precisión. Las combinaciones que
+ninguna otra supera a la vez en las tres cosas (frente de Pareto) se marcan
+con *.
+
+Imágenes etiquetadas, de alguna de estas fuentes:
+
+- Sin argumentos: imágenes sintéticas con muestras dibujadas en el código
+  (muestra_cara y muestra_auto, que las cascadas incluidas detectan) y
+  semilla fija, así que todas las corridas miden lo mismo:
+
+    python3 bench_cascadas.py --json bench.json
+
+- --labels etiquetas.json: lista de {"imagen": ruta, "cajas": {etiqueta:
+  [[x, y, w, h], ...]}} con rutas relativas al JSON. Una imagen sin cajas
+  de una etiqueta cuenta como negativa para esa cascada.
+- --synthetic muestra.png[:etiqueta]: igual que las sintéticas por defecto
+  pero con un recorte propio (una cara o un auto) como muestra.
+
+    python3 bench_cascadas.py --synthetic cara.png:cara --synthetic auto.png:auto \\
+        --scale-factor 1.05,1.1,1.2 --min-neighbors 3,4,6 --scale 1,0.5 --json bench.json
+
+Una detección es correcta si su IoU con una caja de la verdad de la misma
+etiqueta es >= --iou (cada caja se usa una sola vez). Con semilla fija los
+números son comparables entre commits, como en bench_luces_freno.py.
+"""
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from bench_luces_freno import commit_actual
+from detector_cascada import RUTA, DetectorCascada, cascadas_de_args
+
+CASCADAS_POR_DEFECTO = [f"cara={RUTA / 'haarcascade_frontalface_default.xml'}",
+                        f"auto={RUTA / 'cars.xml'}"]
+
+# Parámetros de la grilla: (nombre en args, tipo, valores por defecto)
+PARAMETROS = [
+    ("scale_factor", float, [1.05, 1.1, 1.2, 1.3]),
+    ("min_neighbors", int, [2, 4, 6]),
+    ("min_size", int, [0, 40]),
+    ("max_size", int, [0]),
+    ("scale", float, [1.0, 0.5]),
+]
+
+
+def _lista(tipo):
+    def convertir(texto):
+        return [tipo(v) for v in texto.split(",") if v.strip()]
+    return convertir
+
+
+def cargar_etiquetas(path):
+    """[(imagen BGR, {etiqueta: [caja, ...]}), ...] desde un JSON de etiquetas."""
+    path = Path(path)
+    with open(path, encoding="utf-8") as fh:
+        entradas = json.load(fh)
+    muestras = []
+    for entrada in entradas:
+        ruta = path.parent / entrada["imagen"]
+        imagen = cv2.imread(str(ruta))
+        if imagen is None:
+            raise RuntimeError(f"No pude leer: {ruta}")
+        cajas = {e: [tuple(int(v) for v in c) for c in lista]
+                 for e, lista in entrada.get("cajas", {}).items()}
+        muestras.append((imagen, cajas))
+    return muestras
+
+
+def muestra_cara(lado: int = 100):
+    """Cara frontal esquemática: óvalo de piel, cejas y ojos oscuros, nariz y boca."""
+    img = np.full((lado, lado, 3), 90, dtype=np.uint8)
+    s = lado / 100.0
+
+    def elipse(cx, cy, ax, ay, color):
+        cv2.ellipse(img, (int(cx * s), int(cy * s)),
+                    (max(1, int(ax * s)), max(1, int(ay * s))), 0, 0, 360, color, -1)
+
+    elipse(50, 52, 38, 48, (150, 175, 215))
+    for x in (33, 67):
+        elipse(x, 30, 12, 3, (50, 60, 80))  # cejas
+        elipse(x, 40, 9, 5, (60, 60, 70))  # ojos
+    elipse(50, 60, 5, 4, (110, 130, 170))  # nariz
+    elipse(50, 76, 14, 4, (80, 80, 140))  # boca
+    return cv2.GaussianBlur(img, (0, 0), 1.5 * s)
+
+
+def muestra_auto(lado: int = 100):
+    """Auto oscuro visto de atrás: carrocería, luneta con reflejo, sombra y ruedas."""
+    img = np.full((lado, lado, 3), 102, dtype=np.uint8)  # asfalto
+    s = lado / 100.0
+
+    def rect(x1, y1, x2, y2, gris):
+        cv2.rectangle(img, (int(x1 * s), int(y1 * s)), (int(x2 * s), int(y2 * s)),
+                      (gris, gris, gris), -1)
+
+    rect(26, 38, 73, 65, 65)  # carrocería
+    rect(36, 42, 63, 44, 231)  # reflejo de la luneta
+    rect(26, 65, 73, 71, 14)  # sombra
+    rect(28, 65, 40, 75, 24)  # ruedas
+    rect(59, 65, 71, 75, 24)
+    return cv2.GaussianBlur(img, (0, 0), s)
+
+
+# Muestras que se usan sin --labels ni --synthetic, por etiqueta de cascada
+MUESTRAS_DIBUJADAS = {"cara": muestra_cara, "auto": muestra_auto}
+
+
+def fondo_textura(rng, ancho: int, alto: int):
+    """Fondo con gradiente, rectángulos y ruido: da falsos positivos realistas."""
+    x = np.linspace(0, 1, ancho, dtype=np.float32)
+    y = np.linspace(0, 1, alto, dtype=np.float32)[:, None]
+    base = 60 + 120 * (rng.random() * x + rng.random() * y)
+    fondo = np.repeat(base[..., None], 3, axis=2).astype(np.uint8)
+    for _ in range(int(rng.integers(5, 15))):
+        x1, y1 = int(rng.integers(0, ancho)), int(rng.integers(0, alto))
+        x2, y2 = x1 + int(rng.integers(10, ancho // 3)), y1 + int(rng.integers(10, alto // 3))
+        color = [int(v) for v in rng.integers(0, 256, 3)]
+        cv2.rectangle(fondo, (x1, y1), (x2, y2), color, -1)
+    ruido = rng.normal(0, 10, fondo.shape)
+    return np.clip(fondo + ruido, 0, 255).astype(np.uint8)
+
+
+def generar_sinteticas(rng, muestras: dict, n: int, ancho: int = 640, alto: int = 480,
+                       lado_min: int = 40, lado_max: int = 200):
+    """
+    n imágenes por etiqueta: cada una con 0 a 3 copias de su muestra (ancho
+    entre lado_min y lado_max, sin superponerse). La verdad de las demás
+    etiquetas en esa imagen es vacía (negativa).
+    """
+    imagenes = []
+    for etiqueta, muestra in muestras.items():
+        for _ in range(n):
+            fondo = fondo_textura(rng, ancho, alto)
+            cajas = []
+            copias = int(rng.integers(0, 4))
+            for _intento in range(copias * 10):
+                if len(cajas) >= copias:
+                    break
+                w = int(rng.integers(lado_min, lado_max + 1))
+                h = max(1, int(round(w * muestra.shape[0] / muestra.shape[1])))
+                if w >= ancho or h >= alto:
+                    continue
+                x, y = int(rng.integers(0, ancho - w)), int(rng.integers(0, alto - h))
+                if any(x < cx + cw and cx < x + w and y < cy + ch and cy < y + h
+                       for cx, cy, cw, ch in cajas):
+                    continue
+                copia = cv2.resize(muestra, (w, h), interpolation=cv2.INTER_AREA)
+                brillo = rng.uniform(0.8, 1.2)
+                fondo[y:y + h, x:x + w] = np.clip(copia * brillo, 0, 255).astype(np.uint8)
+                cajas.append((x, y, w, h))
+            imagenes.append((fondo, {etiqueta: cajas}))
+    return imagenes
+
+
+def iou(a, b) -> float:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def emparejar(detectadas, verdad, umbral: float) -> int:
+    """Aciertos: pares detección-verdad con IoU >= umbral, de mayor a menor IoU."""
+    pares = sorted(((iou(d, v), i, j) for i, d in enumerate(detectadas)
+                    for j, v in enumerate(verdad)), reverse=True)
+    usadas_d, usadas_v = set(), set()
+    aciertos = 0
+    for valor, i, j in pares:
+        if valor < umbral:
+            break
+        if i in usadas_d or j in usadas_v:
+            continue
+        usadas_d.add(i)
+        usadas_v.add(j)
+        aciertos += 1
+    return aciertos
+
+
+def evaluar(xml, etiqueta, imagenes, combinacion: dict, umbral: float,
+            repeticiones: int) -> dict:
+    """ms/frame (mediana de las repeticiones), recall y precisión de una combinación."""
+    detector = DetectorCascada(
+        xml, escala=combinacion["scale"], scale_factor=combinacion["scale_factor"],
+        min_neighbors=combinacion["min_neighbors"], min_size=combinacion["min_size"],
+        max_size=combinacion["max_size"], etiqueta=etiqueta)
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        detecciones = [detector.detectar(detector.preparar(img)) for img, _v in imagenes]
+        tiempos.append(time.perf_counter() - t0)
+    verdad_total = detectadas_total = aciertos = 0
+    for (_img, verdad), cajas in zip(imagenes, detecciones):
+        cajas = detector.al_frame(cajas)
+        esperadas = verdad.get(etiqueta, [])
+        verdad_total += len(esperadas)
+        detectadas_total += len(cajas)
+        aciertos += emparejar(cajas, esperadas, umbral)
+    return {
+        "cascada": etiqueta,
+        **combinacion,
+        "ms_frame": 1000.0 * statistics.median(tiempos) / max(len(imagenes), 1),
+        "recall": aciertos / verdad_total if verdad_total else 0.0,
+        "precision": aciertos / detectadas_total if detectadas_total else 1.0,
+        "verdad": verdad_total,
+        "detectadas": detectadas_total,
+    }
+
+
+def marcar_pareto(filas):
+    """Marca "pareto" en las filas que ninguna otra de su cascada domina."""
+    for f in filas:
+        f["pareto"] = not any(
+            g is not f and g["cascada"] == f["cascada"]
+            and g["ms_frame"] <= f["ms_frame"] and g["recall"] >= f["recall"]
+            and g["precision"] >= f["precision"]
+            and (g["ms_frame"] < f["ms_frame"] or g["recall"] > f["recall"]
+                 or g["precision"] > f["precision"])
+            for g in filas)
+    return filas
+
+
+def construir_parser():
+    ap = argparse.ArgumentParser(
+        description="Velocidad vs recall/precisión de las cascadas Haar según parámetros")
+    ap.add_argument("--cascade", action="append", default=None,
+                    help="Clasificador Haar (.xml), o etiqueta=xml; repetible "
+                         "(por defecto: cara y auto)")
+    ap.add_argument("--labels", default=None, help="JSON de imágenes etiquetadas")
+    ap.add_argument("--synthetic", action="append", default=[],
+                    help="muestra.png[:etiqueta] para generar imágenes sintéticas")
+    ap.add_argument("--muestras", type=int, default=30,
+                    help="Imágenes sintéticas por etiqueta")
+    for nombre, tipo, valores in PARAMETROS:
+        ap.add_argument("--" + nombre.replace("_", "-"), type=_lista(tipo), default=valores,
+                        help="Valores separados por coma (por defecto "
+                             + ",".join(f"{v:g}" for v in valores) + ")")
+    ap.add_argument("--iou", type=float, default=0.5,
+                    help="IoU mínimo para contar una detección como correcta")
+    ap.add_argument("--repeticiones", type=int, default=3,
+                    help="Repeticiones por medición (se usa la mediana)")
+    ap.add_argument("--seed", type=int, default=1234, help="Semilla")
+    ap.add_argument("--solo-pareto", action="store_true",
+                    help="Muestra solo las combinaciones del frente de Pareto")
+    ap.add_argument("--json", default=None, help="Guarda la tabla en JSON")
+    return ap
+
+
+def main():
+    ap = construir_parser()
+    args = ap.parse_args()
+    if any(not 0 < s <= 1 for s in args.scale):
+        ap.error("--scale debe estar en (0, 1]")
+    if any(f <= 1 for f in args.scale_factor):
+        ap.error("--scale-factor debe ser mayor que 1")
+
+    cascadas = cascadas_de_args(args.cascade or CASCADAS_POR_DEFECTO, None)
+    cv2.setNumThreads(1)  # tiempos estables entre máquinas/corridas
+    rng = np.random.default_rng(args.seed)
+
+    imagenes = cargar_etiquetas(args.labels) if args.labels else []
+    sinteticas = {}
+    for texto in args.synthetic:
+        ruta, _sep, etiqueta = texto.partition(":")
+        muestra = cv2.imread(ruta)
+        if muestra is None:
+            ap.error(f"No pude leer la muestra: {ruta}")
+        etiqueta = etiqueta or next(iter(cascadas))
+        if etiqueta not in cascadas:
+            ap.error(f"La muestra {ruta} es de '{etiqueta}', que no es ninguna cascada")
+        sinteticas[etiqueta] = muestra
+    if not args.labels and not args.synthetic:
+        sinteticas = {e: MUESTRAS_DIBUJADAS[e]() for e in cascadas if e in MUESTRAS_DIBUJADAS}
+        if not sinteticas:
+            ap.error("Sin --labels ni --synthetic solo hay muestras dibujadas para "
+                     + ", ".join(MUESTRAS_DIBUJADAS))
+    imagenes += generar_sinteticas(rng, sinteticas, args.muestras)
+
+    con_verdad = {e for _img, v in imagenes for e, cajas in v.items() if cajas}
+    sin_verdad = [e for e in cascadas if e not in con_verdad]
+    if sin_verdad:
+        print(f"Sin cajas etiquetadas (se omiten): {', '.join(sin_verdad)}")
+    combinaciones = [dict(zip((n for n, _t, _v in PARAMETROS), valores))
+                     for valores in itertools.product(
+                         *(getattr(args, n) for n, _t, _v in PARAMETROS))]
+    # Con maxSize por debajo de minSize no se detecta nada
+    combinaciones = [c for c in combinaciones
+                     if not (c["max_size"] and c["max_size"] < c["min_size"])]
+    print(f"{len(imagenes)} imágenes, {len(combinaciones)} combinaciones por cascada")
+
+    filas = []
+    for etiqueta, xml in cascadas.items():
+        if etiqueta in sin_verdad:
+            continue
+        for combinacion in combinaciones:
+            filas.append(evaluar(xml, etiqueta, imagenes, combinacion,
+                                 args.iou, args.repeticiones))
+    marcar_pareto(filas)
+
+    print(f"{'cascada':>10}{'sf':>6}{'vecinos':>8}{'min':>6}{'max':>6}{'escala':>8}"
+          f"{'ms/frame':>10}{'recall':>8}{'prec':>7}{'pareto':>8}")
+    for f in sorted(filas, key=lambda f: (f["cascada"], f["ms_frame"])):
+        if args.solo_pareto and not f["pareto"]:
+            continue
+        print(f"{f['cascada']:>10}{f['scale_factor']:>6g}{f['min_neighbors']:>8}"
+              f"{f['min_size']:>6}{f['max_size']:>6}{f['scale']:>8g}"
+              f"{f['ms_frame']:>10.2f}{f['recall']:>8.2f}{f['precision']:>7.2f}"
+              f"{'*' if f['pareto'] else '':>8}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({
+                "commit": commit_actual(),
+                "seed": args.seed,
+                "imagenes": len(imagenes),
+                "iou": args.iou,
+                "opencv": cv2.__version__,
+                "python": platform.python_version(),
+                "maquina": platform.machine(),
+                "cascadas": {e: str(x) for e, x in cascadas.items()},
+                "filas": filas,
+            }, fh, indent=2, ensure_ascii=False)
+        print(f"\nGuardado: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
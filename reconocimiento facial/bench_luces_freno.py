@@ -0,0 +1,274 @@
+"""
+Benchmark del detector de luces de freno sobre imágenes sintéticas.
+
+No necesita modelo ni video: genera ROIs de vehículos (carrocería con ruido)
+con blobs rojos de tamaño y cantidad conocidos en la zona inferior, mide el
+tiempo de la máscara (red_mask_hsv, y red_mask_lut con la tabla BGR) y del
+filtrado de contornos (filtrar_blobs), y compara las detecciones contra la
+verdad conocida.
+
+También mide frames completos con muchos vehículos para comparar los motores
+"roi" y "frame" de luces_freno.
+
+Todo sale de una semilla fija, así los números son comparables entre commits:
+    python3 bench_luces_freno.py --json bench_antes.json
+    python3 bench_luces_freno.py --json bench_despues.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+import cv2
+import numpy as np
+
+from luces_freno import (filtrar_blobs, find_stop_light_boxes,
+                         find_stop_light_boxes_frame, red_mask_hsv,
+                         red_mask_lut, tabla_rojo, zona_inferior)
+
+# Mismos valores por defecto que pruebavideo.py
+PARAMS = dict(
+    bottom_frac=0.45,
+    s_min=85,
+    v_min=70,
+    min_area=60,
+    max_area_frac=0.08,
+    min_solidity=0.35,
+)
+
+# Ancho de la ROI del vehículo (px); 960 ~ auto cercano en 2.7K
+ANCHOS = [120, 240, 480, 960]
+CANTIDADES = [0, 2, 4]
+VEHICULOS_POR_FRAME = [5, 15, 30]
+
+
+def generar_vehiculo(rng, ancho: int, n_blobs: int):
+    """
+    ROI sintética de un vehículo (alto = 0.75 * ancho) con `n_blobs` luces
+    rojas separadas en la zona inferior. Devuelve (roi, cajas_verdad) con
+    las cajas en coordenadas de la ROI.
+    """
+    alto = int(ancho * 0.75)
+    # Carrocería gris/azulada: sin dominante roja para que la verdad sea limpia
+    gris = int(rng.integers(30, 140))
+    color = np.clip(gris + rng.integers(-8, 9, 3) + np.array([6, 0, -6]), 0, 255)
+    roi = np.empty((alto, ancho, 3), dtype=np.uint8)
+    roi[:] = color
+    ruido = rng.integers(-12, 13, roi.shape)
+    roi = np.clip(roi.astype(np.int16) + ruido, 0, 255).astype(np.uint8)
+
+    y_zona = zona_inferior(0, 0, ancho, alto, PARAMS["bottom_frac"])[1]
+    cajas = []
+    if n_blobs == 0:
+        return roi, cajas
+
+    # Un slot horizontal por blob para que no se toquen (el cierre morfológico
+    # uniría blobs a menos de ~8 px), y área de sobra sobre min_area.
+    slot = ancho // n_blobs
+    radio_max = max(6, min(slot // 3, (alto - y_zona) // 4))
+    area_min = 1.5 * PARAMS["min_area"]
+    for k in range(n_blobs):
+        rx = int(rng.integers(max(5, radio_max // 2), radio_max + 1))
+        ry_min = int(np.ceil(area_min / (np.pi * rx)))
+        ry = int(min(radio_max, max(ry_min, rx * rng.uniform(0.5, 1.0))))
+        cx = slot * k + slot // 2
+        cy = int(rng.integers(y_zona + ry + 2, alto - ry - 2))
+        rojo = (int(rng.integers(0, 50)), int(rng.integers(0, 50)),
+                int(rng.integers(180, 256)))
+        cv2.ellipse(roi, (cx, cy), (rx, ry), 0, 0, 360, rojo, -1)
+        cajas.append((cx - rx, cy - ry, cx + rx + 1, cy + ry + 1))
+    return roi, cajas
+
+
+def iou(a, b) -> float:
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def comparar(detectadas, verdad, umbral: float = 0.5):
+    """(verdaderos positivos, falsos positivos, falsos negativos)."""
+    libres = list(verdad)
+    tp = 0
+    for det in detectadas:
+        mejor = max(libres, key=lambda v: iou(det, v), default=None)
+        if mejor is not None and iou(det, mejor) >= umbral:
+            libres.remove(mejor)
+            tp += 1
+    return tp, len(detectadas) - tp, len(libres)
+
+
+def cronometrar(funcion, repeticiones: int) -> float:
+    """Mediana en microsegundos de `repeticiones` llamadas."""
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - t0)
+    return statistics.median(tiempos) * 1e6
+
+
+def bench_rois(rng, muestras: int, repeticiones: int):
+    filas = []
+    for ancho in ANCHOS:
+        for n_blobs in CANTIDADES:
+            t_mask, t_lut, t_blobs, t_total = [], [], [], []
+            lut_igual = True
+            tp = fp = fn = 0
+            for _ in range(muestras):
+                roi, verdad = generar_vehiculo(rng, ancho, n_blobs)
+                alto = roi.shape[0]
+                y0 = zona_inferior(0, 0, ancho, alto, PARAMS["bottom_frac"])[1]
+                zona = roi[y0:alto]
+                mask = red_mask_hsv(zona, PARAMS["s_min"], PARAMS["v_min"])
+
+                t_mask.append(cronometrar(
+                    lambda: red_mask_hsv(zona, PARAMS["s_min"], PARAMS["v_min"]),
+                    repeticiones))
+                t_lut.append(cronometrar(
+                    lambda: red_mask_lut(zona, PARAMS["s_min"], PARAMS["v_min"]),
+                    repeticiones))
+                lut_igual &= bool(np.array_equal(
+                    mask, red_mask_lut(zona, PARAMS["s_min"], PARAMS["v_min"])))
+                t_blobs.append(cronometrar(
+                    lambda: filtrar_blobs(mask, 0, y0, PARAMS["min_area"],
+                                          PARAMS["max_area_frac"],
+                                          PARAMS["min_solidity"]),
+                    repeticiones))
+                t_total.append(cronometrar(
+                    lambda: find_stop_light_boxes(roi, 0, 0, **PARAMS),
+                    repeticiones))
+
+                boxes, _ = find_stop_light_boxes(roi, 0, 0, **PARAMS)
+                a, b, c = comparar([bx[:4] for bx in boxes], verdad)
+                tp, fp, fn = tp + a, fp + b, fn + c
+
+            filas.append({
+                "ancho": ancho,
+                "blobs": n_blobs,
+                "mask_us": statistics.median(t_mask),
+                "mask_lut_us": statistics.median(t_lut),
+                "lut_igual": lut_igual,
+                "contornos_us": statistics.median(t_blobs),
+                "total_us": statistics.median(t_total),
+                "precision": tp / (tp + fp) if tp + fp else 1.0,
+                "recall": tp / (tp + fn) if tp + fn else 1.0,
+            })
+    return filas
+
+
+def generar_frame(rng, n_vehiculos: int, denso: bool = False,
+                  W: int = 2704, H: int = 1520):
+    """
+    Frame 2.7K con `n_vehiculos` ROIs sintéticas pegadas. Con `denso` todas
+    caen en una franja central y se solapan mucho (tráfico congestionado).
+    """
+    frame = np.full((H, W, 3), 90, dtype=np.uint8)
+    rects = []
+    for _ in range(n_vehiculos):
+        ancho = int(rng.choice(ANCHOS[:-1]))
+        roi, _cajas = generar_vehiculo(rng, ancho, int(rng.integers(0, 3)))
+        alto = roi.shape[0]
+        if denso:
+            x1 = int(rng.integers(W // 3, W // 2))
+            y1 = int(rng.integers(H // 3, H // 2))
+        else:
+            x1 = int(rng.integers(0, W - ancho))
+            y1 = int(rng.integers(0, H - alto))
+        frame[y1:y1 + alto, x1:x1 + ancho] = roi
+        rects.append((x1, y1, x1 + ancho, y1 + alto))
+    return frame, rects
+
+
+def bench_frames(rng, muestras: int, repeticiones: int):
+    filas = []
+    for denso, n in [(d, n) for d in (False, True) for n in VEHICULOS_POR_FRAME]:
+        t_roi, t_frame = [], []
+        iguales = True
+        for _ in range(muestras):
+            frame, rects = generar_frame(rng, n, denso)
+
+            def motor_roi():
+                return [find_stop_light_boxes(frame[y1:y2, x1:x2], x1, y1, **PARAMS)
+                        for x1, y1, x2, y2 in rects]
+
+            def motor_frame():
+                return find_stop_light_boxes_frame(frame, rects, **PARAMS)
+
+            t_roi.append(cronometrar(motor_roi, repeticiones))
+            t_frame.append(cronometrar(motor_frame, repeticiones))
+            iguales &= ([b for b, _m in motor_roi()]
+                        == [b for b, _m in motor_frame()])
+        filas.append({
+            "escena": "densa" if denso else "dispersa",
+            "vehiculos": n,
+            "roi_ms": statistics.median(t_roi) / 1000.0,
+            "frame_ms": statistics.median(t_frame) / 1000.0,
+            "iguales": iguales,
+        })
+    return filas
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seed", type=int, default=1234, help="Semilla")
+    ap.add_argument("--muestras", type=int, default=20,
+                    help="ROIs/frames sintéticos por escenario")
+    ap.add_argument("--repeticiones", type=int, default=5,
+                    help="Repeticiones por medición (se usa la mediana)")
+    ap.add_argument("--json", default=None,
+                    help="Guarda los resultados en JSON")
+    args = ap.parse_args()
+
+    cv2.setNumThreads(1)  # tiempos estables entre máquinas/corridas
+    rng = np.random.default_rng(args.seed)
+    t0 = time.perf_counter()
+    tabla_rojo(PARAMS["s_min"], PARAMS["v_min"])
+    print(f"Tabla BGR: {(time.perf_counter() - t0) * 1000:.0f} ms (una vez por corrida)")
+
+    rois = bench_rois(rng, args.muestras, args.repeticiones)
+    print(f"{'ancho':>6}{'blobs':>6}{'mask µs':>10}{'lut µs':>9}{'contornos µs':>14}"
+          f"{'total µs':>10}{'prec':>7}{'recall':>8}{'lut=hsv':>9}")
+    for f in rois:
+        print(f"{f['ancho']:>6}{f['blobs']:>6}{f['mask_us']:>10.1f}"
+              f"{f['mask_lut_us']:>9.1f}"
+              f"{f['contornos_us']:>14.1f}{f['total_us']:>10.1f}"
+              f"{f['precision']:>7.2f}{f['recall']:>8.2f}{str(f['lut_igual']):>9}")
+
+    frames = bench_frames(rng, max(1, args.muestras // 4), args.repeticiones)
+    print(f"\n{'escena':>9}{'vehículos':>10}{'roi ms':>10}{'frame ms':>10}{'iguales':>9}")
+    for f in frames:
+        print(f"{f['escena']:>9}{f['vehiculos']:>10}{f['roi_ms']:>10.2f}"
+              f"{f['frame_ms']:>10.2f}{str(f['iguales']):>9}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({
+                "commit": commit_actual(),
+                "seed": args.seed,
+                "muestras": args.muestras,
+                "opencv": cv2.__version__,
+                "python": platform.python_version(),
+                "maquina": platform.machine(),
+                "params": PARAMS,
+                "rois": rois,
+                "frames": frames,
+            }, fh, indent=2, ensure_ascii=False)
+        print(f"\nGuardado: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
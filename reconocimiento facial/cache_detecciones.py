@@ -0,0 +1,162 @@
+"""
+Cache en disco de la salida del tracker.
+
+Las detecciones (cajas, IDs, clases, confianzas) no dependen de los
+parámetros de color (--s-min, --v-min, --min-area, ...), así que se pueden
+guardar una vez y reusar para ajustar esos parámetros sin volver a correr
+YOLO. El archivo se identifica por una clave que sí cambia con todo lo que
+afecta al tracking: huella del video, modelo, tracker, conf, clases,
+escala de inferencia, compuerta de movimiento, rango de frames, región y
+runtime de inferencia (los exportados no dan cajas idénticas a PyTorch).
+
+Formato: un .npz comprimido con una fila por detección
+    frame (int32), cajas (int32 x4), ids (int32), clases (int16), conf (float32)
+más la cantidad de frames y un JSON con la clave y los nombres de clases.
+La confianza de YOLO ya es float32, así que no se pierde precisión.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+VERSION = 1
+
+# Bytes leídos del principio, medio y final del video para la huella
+_BLOQUE_HUELLA = 1 << 20
+
+
+def huella_archivo(path) -> str:
+    """
+    SHA-1 del tamaño y de tres bloques del archivo (inicio, medio, final).
+    Leer un video de varios GB completo tardaría más que el propio cache.
+    """
+    path = Path(path)
+    tam = path.stat().st_size
+    h = hashlib.sha1(str(tam).encode())
+    with open(path, "rb") as f:
+        for pos in (0, max(0, tam // 2 - _BLOQUE_HUELLA // 2),
+                    max(0, tam - _BLOQUE_HUELLA)):
+            f.seek(pos)
+            h.update(f.read(_BLOQUE_HUELLA))
+    return h.hexdigest()
+
+
+def _huella_si_existe(nombre) -> str:
+    """Huella del archivo si existe localmente; si no, el nombre tal cual
+    (ej: pesos o trackers que ultralytics resuelve por nombre)."""
+    if nombre and Path(nombre).is_file():
+        return huella_archivo(nombre)
+    return str(nombre)
+
+
+def clave_detecciones(video, model, tracker, conf: float, clases,
+                      escala: float, compuerta=None, rango=(0, None),
+                      region=None, runtime: str = "torch") -> dict:
+    """
+    Todo lo que determina la salida del tracker.
+    compuerta: CompuertaMovimiento usada para saltear frames, o None.
+    rango: (primer frame, final exclusivo o None) procesado.
+    region: RegionInteres, o None.
+    runtime: backend de inferencia ("torch", "onnx", "openvino-int8", ...).
+    """
+    return {
+        "version": VERSION,
+        "video": huella_archivo(video),
+        "model": Path(str(model)).name,
+        "model_huella": _huella_si_existe(model),
+        "runtime": runtime,
+        "tracker": Path(str(tracker)).name,
+        "tracker_huella": _huella_si_existe(tracker),
+        "conf": round(float(conf), 6),
+        "clases": sorted(int(c) for c in clases),
+        "escala": round(float(escala), 6),
+        "compuerta": None if compuerta is None else [
+            compuerta.umbral, compuerta.umbral_pixel, compuerta.cada, compuerta.lado],
+        "rango": list(rango),
+        "region": None if region is None else [list(p) for p in region.puntos],
+    }
+
+
+def ruta_cache(directorio, clave: dict) -> Path:
+    texto = json.dumps(clave, sort_keys=True)
+    nombre = hashlib.sha1(texto.encode()).hexdigest()[:16]
+    return Path(directorio) / f"dets_{nombre}.npz"
+
+
+class GrabadorDetecciones:
+    """
+    Acumula las detecciones frame a frame y las escribe al cerrar.
+    Se escribe a un temporal y se renombra, así un corte a mitad de camino
+    nunca deja un cache incompleto con el nombre bueno.
+    """
+
+    def __init__(self, path, clave: dict, names):
+        self.path = Path(path)
+        self.clave = clave
+        self.names = {int(k): str(v) for k, v in dict(names).items()}
+        self.frames = 0
+        self._filas = []
+
+    def agregar(self, dets):
+        """Registra las detecciones del siguiente frame (en orden)."""
+        for det in dets:
+            self._filas.append((self.frames, *det))
+        self.frames += 1
+
+    def cerrar(self):
+        filas = self._filas
+        n = len(filas)
+        datos = {
+            "frame": np.fromiter((f[0] for f in filas), np.int32, n),
+            "cajas": np.array([f[1:5] for f in filas], np.int32).reshape(n, 4),
+            "ids": np.fromiter((f[5] for f in filas), np.int32, n),
+            "conf": np.fromiter((f[6] for f in filas), np.float32, n),
+            "clases": np.fromiter((f[7] for f in filas), np.int16, n),
+        }
+        meta = {"clave": self.clave, "names": self.names, "frames": self.frames}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(meta)), **datos)
+        os.replace(tmp, self.path)
+
+
+class Detecciones:
+    """Detecciones leídas de un cache, para reproducir el tracking."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with np.load(self.path) as z:
+            meta = json.loads(str(z["meta"]))
+            if meta["clave"].get("version") != VERSION:
+                raise RuntimeError(f"Cache de otra versión: {self.path}")
+            self.clave = meta["clave"]
+            self.names = {int(k): v for k, v in meta["names"].items()}
+            self.total = int(meta["frames"])
+            frame = z["frame"]
+            cajas = z["cajas"]
+            ids = z["ids"]
+            conf = z["conf"]
+            clases = z["clases"]
+
+        # Índices [inicio, fin) de las filas de cada frame
+        cortes = np.searchsorted(frame, np.arange(self.total + 1))
+        self._cortes = cortes.tolist()
+        self._filas = [
+            (int(x1), int(y1), int(x2), int(y2), int(tid), float(cf), int(c))
+            for (x1, y1, x2, y2), tid, cf, c in zip(cajas.tolist(), ids.tolist(),
+                                                    conf.tolist(), clases.tolist())
+        ]
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, i):
+        """Detecciones del frame i: [(x1, y1, x2, y2, tid, conf, cls_id), ...]."""
+        return self._filas[self._cortes[i]:self._cortes[i + 1]]
+
+    def __iter__(self):
+        for i in range(self.total):
+            yield self[i]
@@ -0,0 +1,457 @@
+"""
+Detección en tiempo real con clasificadores Haar (caras, autos, ...).
+
+Lo comparten reconocimentofacial.py y carros.py:
+
+- CapturaHilo: un hilo lee la cámara sin parar y se queda solo con el
+  último frame. El bucle de detección nunca procesa frames viejos ni deja
+  que el buffer del driver se llene (que es lo que produce el retraso).
+- DetectorCascada: detectMultiScale sobre una copia en gris reducida por
+  `escala` (el costo baja con el cuadrado de la escala).
+- DetectorMultiCascada: varias cascadas (caras, autos, ...) sobre el mismo
+  frame. Solo se comparten la conversión a gris y la pirámide de escalas;
+  cada cascada sigue recorriendo todos los niveles, así que N cascadas
+  cuestan casi lo mismo que N DetectorCascada (ver la clase). Da los
+  mismos candidatos que DetectorCascada.
+- SeguidorPlantillas: entre dos detecciones completas (cada N frames) las
+  cajas se mueven buscando su propia plantilla con matchTemplate en una
+  ventana alrededor de la posición anterior; cuesta una fracción de la
+  cascada y no necesita opencv-contrib.
+- ejecutar(): el bucle de las dos apps. Muestra el frame una sola vez con
+  las cajas, los FPS y la latencia de la última detección.
+"""
+import argparse
+import threading
+from abc import ABC, abstractmethod
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+
+RUTA = Path(__file__).resolve().parent
+
+
+class CapturaHilo:
+    """
+    Lee `fuente` (índice de cámara o archivo) en un hilo y guarda solo el
+    último frame. Los archivos se leen a su fps, como si fueran una cámara.
+    """
+
+    def __init__(self, fuente):
+        self.fuente = fuente
+        self.cap = cv2.VideoCapture(fuente)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"No pude abrir: {fuente}")
+        self.es_archivo = not isinstance(fuente, int)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.cond = threading.Condition()
+        self.frame = None
+        self.numero = 0  # frames leídos hasta ahora
+        self.descartados = 0  # frames reemplazados sin que nadie los usara
+        self._usado = True
+        self.terminado = False
+        self.hilo = threading.Thread(target=self._leer, daemon=True)
+
+    def iniciar(self):
+        self.hilo.start()
+        return self
+
+    def _leer(self):
+        t0 = time.monotonic()
+        while not self.terminado:
+            ok, frame = self.cap.read()
+            with self.cond:
+                if not ok:
+                    self.terminado = True
+                    self.cond.notify_all()
+                    return
+                if not self._usado:
+                    self.descartados += 1
+                self.frame = frame
+                self.numero += 1
+                self._usado = False
+                self.cond.notify_all()
+            if self.es_archivo:
+                espera = t0 + self.numero / self.fps - time.monotonic()
+                if espera > 0:
+                    time.sleep(espera)
+
+    def leer(self, ultimo: int = 0, timeout: float = 1.0):
+        """
+        (numero, frame) con el frame más nuevo posterior a `ultimo`.
+        Devuelve frame None si no llegó ninguno en `timeout` o si terminó.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.numero > ultimo or self.terminado,
+                               timeout)
+            if self.numero <= ultimo:
+                return ultimo, None
+            self._usado = True
+            return self.numero, self.frame
+
+    def cerrar(self):
+        with self.cond:
+            self.terminado = True
+        self.hilo.join(timeout=2.0)
+        self.cap.release()
+
+
+def cargar_cascada(xml):
+    cascada = cv2.CascadeClassifier(str(xml))
+    if cascada.empty():
+        raise RuntimeError(f"No pude cargar el clasificador: {xml}")
+    return cascada
+
+
+def etiqueta_de(xml) -> str:
+    """"haarcascade_frontalface_default.xml" -> "frontalface_default"."""
+    nombre = Path(str(xml)).stem
+    return nombre[len("haarcascade_"):] if nombre.startswith("haarcascade_") else nombre
+
+
+class DetectorReducido(ABC):
+    """
+    Base abstracta de los detectores: trabajan sobre una copia en gris del
+    frame reducida por `escala` y devuelven detecciones [(etiqueta, caja),
+    ...] con detectar_etiquetadas(), que cada subclase implementa. min_size
+    y max_size están en píxeles del frame original (0 = sin límite).
+    """
+
+    def __init__(self, escala: float = 0.5, scale_factor: float = 1.1,
+                 min_neighbors: int = 4, min_size: int = 0, max_size: int = 0):
+        self.escala = min(max(escala, 0.05), 1.0)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        lado = int(round(min_size * self.escala))
+        self.min_size = (lado, lado) if lado > 0 else None
+        lado = int(round(max_size * self.escala))
+        self.max_size = (lado, lado) if lado > 0 else None
+
+    def preparar(self, frame):
+        """Gris reducido: se achica primero (3 canales -> menos píxeles a convertir)."""
+        if self.escala != 1.0:
+            h, w = frame.shape[:2]
+            frame = cv2.resize(frame, (max(1, int(w * self.escala)),
+                                       max(1, int(h * self.escala))),
+                               interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    @abstractmethod
+    def detectar_etiquetadas(self, gris):
+        """[(etiqueta, (x, y, w, h)), ...] en coordenadas de `gris`."""
+
+    def al_frame(self, cajas):
+        """Cajas de la imagen reducida a coordenadas del frame original."""
+        if self.escala == 1.0:
+            return cajas
+        f = 1.0 / self.escala
+        return [(int(x * f), int(y * f), int(w * f), int(h * f))
+                for x, y, w, h in cajas]
+
+    def cerrar(self):
+        pass
+
+
+class DetectorCascada(DetectorReducido):
+    """detectMultiScale de una cascada sobre el frame en gris reducido por `escala`."""
+
+    def __init__(self, xml, escala: float = 0.5, scale_factor: float = 1.1,
+                 min_neighbors: int = 4, min_size: int = 0, etiqueta=None,
+                 max_size: int = 0):
+        super().__init__(escala, scale_factor, min_neighbors, min_size, max_size)
+        self.cascada = cargar_cascada(xml)
+        self.etiqueta = etiqueta or etiqueta_de(xml)
+
+    def detectar(self, gris):
+        """Cajas (x, y, w, h) en coordenadas de `gris`."""
+        opciones = {}
+        if self.min_size is not None:
+            opciones["minSize"] = self.min_size
+        if self.max_size is not None:
+            opciones["maxSize"] = self.max_size
+        cajas = self.cascada.detectMultiScale(gris, self.scale_factor,
+                                              self.min_neighbors, **opciones)
+        return [tuple(int(v) for v in caja) for caja in cajas]
+
+    def detectar_etiquetadas(self, gris):
+        return [(self.etiqueta, caja) for caja in self.detectar(gris)]
+
+
+def piramide(gris, scale_factor: float, ventana_min, usar=None):
+    """
+    Niveles [(factor, imagen), ...] de `gris` reducida por scale_factor**k
+    hasta que no entra la ventana más chica. usar(factor) -> False saltea
+    un nivel sin calcularlo (ej: fuera de minSize/maxSize).
+    """
+    H, W = gris.shape[:2]
+    niveles = []
+    factor = 1.0
+    while W / factor >= ventana_min[0] and H / factor >= ventana_min[1]:
+        if usar is None or usar(factor):
+            if factor == 1.0:
+                nivel = gris
+            else:
+                tam = (int(round(W / factor)), int(round(H / factor)))
+                nivel = cv2.resize(gris, tam, interpolation=cv2.INTER_LINEAR)
+            niveles.append((factor, nivel))
+        factor *= scale_factor
+    return niveles
+
+
+# Con paso 2, estos cuatro recorridos juntos visitan cada posición una vez
+_CORRIMIENTOS_PASO_1 = ((0, 0), (1, 0), (0, 1), (1, 1))
+
+
+class DetectorMultiCascada(DetectorReducido):
+    """
+    Varias cascadas sobre una sola pirámide por frame.
+
+    detectMultiScale arma su propia pirámide en cada llamada, así que aquí
+    se la arma una vez y cada cascada se corre sobre cada nivel con
+    minSize = maxSize = su ventana (una sola escala por llamada y sin
+    agrupar). Los candidatos se llevan a la escala del frame y se agrupan
+    por cascada con groupRectangles(min_neighbors, 0.2), como al final de
+    detectMultiScale.
+
+    detectMultiScale recorre con paso 1 píxel los niveles con factor >= 2
+    y con paso 2 el resto, pero en una llamada sobre un nivel ya reducido
+    ve factor 1 y usaría siempre paso 2. Por eso esos niveles se recorren
+    4 veces corridos (0/1, 0/1) píxeles, que juntos cubren todas las
+    posiciones. Así los candidatos son los mismos que los de
+    DetectorCascada; las cajas pueden diferir en algún píxel por redondeo.
+
+    Lo único que se ahorra es la conversión a gris y la pirámide repetidas:
+    cada cascada evalúa las mismas ventanas que en su propio
+    detectMultiScale. Medido con caras + autos sobre caras.avi (1280x720,
+    escala 1, un hilo de OpenCV), dos DetectorCascada tardan 797 ms/frame
+    y este detector 821 ms (152 y 162 con min_size=100): no es más rápido.
+    Sin los recorridos corridos tardaba 444 ms, pero perdía caras.
+
+    Con `hilos` > 1 las cascadas se evalúan en paralelo (OpenCV suelta el
+    GIL); cada hilo usa una cascada distinta porque un CascadeClassifier no
+    se puede usar desde dos hilos a la vez.
+
+    cascadas: {etiqueta: xml} o lista de xml (la etiqueta sale del nombre).
+    """
+
+    def __init__(self, cascadas, escala: float = 0.5, scale_factor: float = 1.1,
+                 min_neighbors: int = 4, min_size: int = 0, hilos: int = 0,
+                 max_size: int = 0):
+        super().__init__(escala, scale_factor, min_neighbors, min_size, max_size)
+        if not isinstance(cascadas, dict):
+            cascadas = {etiqueta_de(xml): xml for xml in cascadas}
+        if not cascadas:
+            raise ValueError("Hace falta al menos una cascada")
+        self.cascadas = {etiqueta: cargar_cascada(xml)
+                         for etiqueta, xml in cascadas.items()}
+        self.ventanas = {etiqueta: c.getOriginalWindowSize()
+                         for etiqueta, c in self.cascadas.items()}
+        self.ventana_min = (min(w for w, _h in self.ventanas.values()),
+                            min(h for _w, h in self.ventanas.values()))
+        self.pool = ThreadPoolExecutor(hilos) if hilos > 1 else None
+
+    def _usa(self, ventana, factor) -> bool:
+        """Si la ventana en este nivel respeta min_size/max_size (como detectMultiScale)."""
+        w, h = ventana[0] * factor, ventana[1] * factor
+        if self.min_size is not None and (w < self.min_size[0] or h < self.min_size[1]):
+            return False
+        if self.max_size is not None and (w > self.max_size[0] or h > self.max_size[1]):
+            return False
+        return True
+
+    def _evaluar(self, etiqueta, niveles):
+        cascada = self.cascadas[etiqueta]
+        ventana = self.ventanas[etiqueta]
+        candidatos = []
+        for factor, nivel in niveles:
+            if (nivel.shape[1] < ventana[0] or nivel.shape[0] < ventana[1]
+                    or not self._usa(ventana, factor)):
+                continue
+            corrimientos = _CORRIMIENTOS_PASO_1 if factor >= 2 else ((0, 0),)
+            for dx, dy in corrimientos:
+                for x, y, w, h in cascada.detectMultiScale(
+                        nivel[dy:, dx:], self.scale_factor, 0,
+                        minSize=ventana, maxSize=ventana):
+                    candidatos.append([int(round((x + dx) * factor)),
+                                       int(round((y + dy) * factor)),
+                                       int(round(w * factor)), int(round(h * factor))])
+        if not candidatos:
+            return []
+        if self.min_neighbors <= 0:
+            return [tuple(c) for c in candidatos]
+        cajas, _pesos = cv2.groupRectangles(candidatos, self.min_neighbors, 0.2)
+        return [tuple(int(v) for v in caja) for caja in cajas]
+
+    def detectar_etiquetadas(self, gris):
+        """[(etiqueta, (x, y, w, h)), ...] de todas las cascadas en coordenadas de `gris`."""
+        niveles = piramide(gris, self.scale_factor, self.ventana_min,
+                           lambda f: any(self._usa(v, f) for v in self.ventanas.values()))
+        etiquetas = list(self.cascadas)
+        if self.pool is not None:
+            resultados = list(self.pool.map(lambda e: self._evaluar(e, niveles), etiquetas))
+        else:
+            resultados = [self._evaluar(e, niveles) for e in etiquetas]
+        return [(etiqueta, caja)
+                for etiqueta, cajas in zip(etiquetas, resultados) for caja in cajas]
+
+    def cerrar(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+class SeguidorPlantillas:
+    """
+    Sigue cada caja buscando su plantilla (el recorte del momento de la
+    detección) en una ventana `margen` veces su tamaño alrededor de la
+    posición anterior. Si la coincidencia cae debajo de `umbral` la caja
+    se pierde hasta la próxima detección.
+    """
+
+    def __init__(self, margen: float = 0.5, umbral: float = 0.5):
+        self.margen = margen
+        self.umbral = umbral
+        self.objetos = []  # [(etiqueta, caja, plantilla), ...]
+
+    def reiniciar(self, gris, detecciones):
+        """detecciones: [(etiqueta, (x, y, w, h)), ...] recién detectadas en `gris`."""
+        self.objetos = [(etiqueta, (x, y, w, h), gris[y:y + h, x:x + w].copy())
+                        for etiqueta, (x, y, w, h) in detecciones if w > 0 and h > 0]
+
+    def actualizar(self, gris):
+        """Nuevas posiciones [(etiqueta, caja), ...] en `gris`."""
+        H, W = gris.shape[:2]
+        seguidos = []
+        for etiqueta, (x, y, w, h), plantilla in self.objetos:
+            dx, dy = int(w * self.margen), int(h * self.margen)
+            x1, y1 = max(0, x - dx), max(0, y - dy)
+            x2, y2 = min(W, x + w + dx), min(H, y + h + dy)
+            if x2 - x1 < w or y2 - y1 < h:
+                continue
+            res = cv2.matchTemplate(gris[y1:y2, x1:x2], plantilla, cv2.TM_CCOEFF_NORMED)
+            _min, maximo, _pmin, (px, py) = cv2.minMaxLoc(res)
+            if maximo >= self.umbral:
+                seguidos.append((etiqueta, (x1 + px, y1 + py, w, h), plantilla))
+        self.objetos = seguidos
+        return [(etiqueta, caja) for etiqueta, caja, _plantilla in seguidos]
+
+
+# Un color por cascada (BGR); la primera conserva el azul de siempre
+COLORES = [(255, 0, 0), (0, 200, 0), (0, 0, 255), (0, 200, 255), (255, 0, 255)]
+
+
+def dibujar(frame, detecciones, fps: float, latencia_ms: float, etiquetas=()):
+    """
+    detecciones: [(etiqueta, (x, y, w, h)), ...] en coordenadas del frame.
+    etiquetas: orden de las cascadas (define el color); con más de una se
+    escribe la etiqueta sobre cada caja.
+    """
+    colores = {e: COLORES[i % len(COLORES)] for i, e in enumerate(etiquetas)}
+    for etiqueta, (x, y, w, h) in detecciones:
+        color = colores.get(etiqueta, COLORES[0])
+        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+        if len(colores) > 1:
+            cv2.putText(frame, etiqueta, (x, max(12, y - 6)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2, cv2.LINE_AA)
+    texto = f"{fps:5.1f} FPS  deteccion {latencia_ms:5.1f} ms"
+    cv2.putText(frame, texto, (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                (0, 0, 0), 4, cv2.LINE_AA)
+    cv2.putText(frame, texto, (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                (0, 255, 255), 2, cv2.LINE_AA)
+    return frame
+
+
+def fuente_de_texto(texto: str):
+    """"0" -> cámara 0; cualquier otra cosa es un archivo o URL."""
+    return int(texto) if texto.isdigit() else texto
+
+
+def construir_parser(cascada, camara: int, descripcion: str):
+    ap = argparse.ArgumentParser(description=descripcion)
+    ap.add_argument("--source", default=str(camara),
+                    help="Índice de la cámara, o un archivo/URL de video")
+    ap.add_argument("--cascade", action="append", default=None,
+                    help="Clasificador Haar (.xml), o etiqueta=xml; repetir para "
+                         "correr varios sobre la misma pirámide (por defecto: "
+                         f"{cascada})")
+    ap.add_argument("--scale", type=float, default=0.5,
+                    help="Reducción del frame antes de detectar (1 = original)")
+    ap.add_argument("--every", type=int, default=5,
+                    help="Detección completa cada N frames; en el medio se siguen las cajas")
+    ap.add_argument("--scale-factor", type=float, default=1.1,
+                    help="scaleFactor de detectMultiScale")
+    ap.add_argument("--min-neighbors", type=int, default=4,
+                    help="minNeighbors de detectMultiScale")
+    ap.add_argument("--min-size", type=int, default=0,
+                    help="Tamaño mínimo del objeto en píxeles del frame (0 = sin mínimo)")
+    ap.add_argument("--threads", type=int, default=0,
+                    help="Con varias cascadas, hilos para evaluarlas en paralelo (0 = ninguno)")
+    ap.add_argument("--window", default="img", help="Título de la ventana")
+    return ap
+
+
+def cascadas_de_args(lista, por_defecto):
+    """{etiqueta: xml} de los --cascade ("xml" o "etiqueta=xml")."""
+    cascadas = {}
+    for texto in lista or [str(RUTA / por_defecto)]:
+        etiqueta, igual, xml = texto.partition("=")
+        if not igual:
+            etiqueta, xml = etiqueta_de(texto), texto
+        cascadas[etiqueta] = xml
+    return cascadas
+
+
+def ejecutar(cascada, camara: int = 0, descripcion: str = ""):
+    """Bucle en vivo: captura en hilo, detección cada N frames y seguimiento."""
+    args = construir_parser(cascada, camara, descripcion).parse_args()
+    cascadas = cascadas_de_args(args.cascade, cascada)
+    opciones = dict(escala=args.scale, scale_factor=args.scale_factor,
+                    min_neighbors=args.min_neighbors, min_size=args.min_size)
+    if len(cascadas) == 1:
+        (etiqueta, xml), = cascadas.items()
+        detector = DetectorCascada(xml, etiqueta=etiqueta, **opciones)
+    else:
+        detector = DetectorMultiCascada(cascadas, hilos=args.threads, **opciones)
+    seguidor = SeguidorPlantillas()
+    captura = CapturaHilo(fuente_de_texto(args.source)).iniciar()
+    cada = max(1, args.every)
+
+    ultimo = 0
+    procesados = 0
+    fps = 0.0
+    latencia_ms = 0.0
+    t_anterior = time.perf_counter()
+    try:
+        while True:
+            ultimo, frame = captura.leer(ultimo)
+            if frame is None:
+                if captura.terminado:
+                    break
+                continue
+            gris = detector.preparar(frame)
+            if procesados % cada == 0:
+                t0 = time.perf_counter()
+                detecciones = detector.detectar_etiquetadas(gris)
+                latencia_ms = 1000.0 * (time.perf_counter() - t0)
+                seguidor.reiniciar(gris, detecciones)
+            else:
+                detecciones = seguidor.actualizar(gris)
+            procesados += 1
+
+            ahora = time.perf_counter()
+            instantaneo = 1.0 / max(ahora - t_anterior, 1e-6)
+            fps = instantaneo if fps == 0.0 else 0.9 * fps + 0.1 * instantaneo
+            t_anterior = ahora
+
+            cajas = detector.al_frame([caja for _e, caja in detecciones])
+            en_frame = [(e, caja) for (e, _c), caja in zip(detecciones, cajas)]
+            cv2.imshow(args.window, dibujar(frame, en_frame, fps, latencia_ms,
+                                            list(cascadas)))
+            if cv2.waitKey(1) & 0xFF == 27:
+                break
+    finally:
+        captura.cerrar()
+        detector.cerrar()
+        cv2.destroyAllWindows()
+    print(f"{procesados} frames mostrados, {captura.descartados} descartados "
+          f"por llegar uno más nuevo")
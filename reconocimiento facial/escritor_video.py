@@ -0,0 +1,150 @@
+"""
+Escritores de video intercambiables.
+
+Ambos exponen la misma interfaz que cv2.VideoWriter (write / release /
+isOpened), así el resto del código no cambia según el backend:
+
+- EscritorFFmpeg: manda los frames crudos (BGR) por un pipe a un proceso
+  ffmpeg que codifica en paralelo (libx264 por defecto, preset/CRF/hilos
+  configurables). Mucho más rápido y con archivos más chicos que mp4v.
+- EscritorOpenCV: el cv2.VideoWriter de siempre con mp4v.
+
+crear_escritor() elige ffmpeg si está instalado y tiene el codec pedido
+(ffmpeg -encoders); si no, cae a OpenCV.
+"""
+import functools
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+
+class EscritorOpenCV:
+    def __init__(self, path, fps: float, size, fourcc: str = "mp4v"):
+        self.path = str(path)
+        self.writer = cv2.VideoWriter(
+            self.path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+
+    def isOpened(self) -> bool:
+        return self.writer.isOpened()
+
+    def write(self, frame: np.ndarray):
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+
+class EscritorFFmpeg:
+    def __init__(self, path, fps: float, size, ffmpeg: str = "ffmpeg",
+                 codec: str = "libx264", preset: str = "veryfast",
+                 crf: int = 23, threads: int = 0):
+        self.path = str(path)
+        self.size = tuple(size)
+        w, h = self.size
+        cmd = [
+            ffmpeg, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "-s", f"{w}x{h}", "-r", f"{fps:.6f}", "-i", "-",
+            "-an", "-c:v", codec,
+        ]
+        if codec in ("libx264", "libx265"):
+            cmd += ["-preset", preset, "-crf", str(crf)]
+        cmd += ["-threads", str(threads), "-pix_fmt", "yuv420p", self.path]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def isOpened(self) -> bool:
+        return self.proc.poll() is None
+
+    def write(self, frame: np.ndarray):
+        if frame.shape[1::-1] != self.size:
+            raise ValueError(
+                f"Frame de {frame.shape[1]}x{frame.shape[0]}, se esperaba "
+                f"{self.size[0]}x{self.size[1]}")
+        try:
+            self.proc.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError as exc:
+            raise RuntimeError(
+                f"ffmpeg terminó antes de tiempo (código {self.proc.poll()})") from exc
+
+    def release(self):
+        if self.proc.stdin and not self.proc.stdin.closed:
+            self.proc.stdin.close()
+        codigo = self.proc.wait()
+        if codigo != 0:
+            raise RuntimeError(f"ffmpeg terminó con código {codigo}")
+
+
+def buscar_ffmpeg(preferido=None):
+    """Ruta al ejecutable de ffmpeg, o None si no está."""
+    if preferido:
+        return shutil.which(preferido)
+    return shutil.which("ffmpeg")
+
+
+@functools.lru_cache(maxsize=None)
+def encoders_ffmpeg(exe) -> frozenset:
+    """Nombres de los encoders que trae este ffmpeg (vacío si no responde)."""
+    try:
+        salida = subprocess.run([exe, "-hide_banner", "-encoders"],
+                                capture_output=True, text=True, timeout=10,
+                                check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return frozenset()
+    # Líneas del tipo " V....D libx264   libx264 H.264 / AVC ..."; la
+    # leyenda de arriba termina en " ------"
+    nombres = set()
+    listado = False
+    for linea in salida.splitlines():
+        partes = linea.split()
+        if not listado:
+            listado = partes[:1] == ["------"]
+            continue
+        if len(partes) >= 2:
+            nombres.add(partes[1])
+    return frozenset(nombres)
+
+
+def crear_escritor(path, fps: float, size, backend: str = "auto",
+                   codec: str = "libx264", preset: str = "veryfast",
+                   crf: int = 23, threads: int = 0, ffmpeg=None):
+    """
+    backend: "auto" (ffmpeg si existe, si no OpenCV), "ffmpeg" u "opencv".
+    Si ffmpeg no está instalado o no tiene el codec se usa OpenCV (con
+    aviso si se pidió ffmpeg o si falta el codec).
+    """
+    if backend in ("auto", "ffmpeg"):
+        exe = buscar_ffmpeg(ffmpeg)
+        if exe and codec in encoders_ffmpeg(exe):
+            return EscritorFFmpeg(path, fps, size, ffmpeg=exe, codec=codec,
+                                  preset=preset, crf=crf, threads=threads)
+        if exe:
+            print(f"ffmpeg ({exe}) no tiene el encoder {codec}, uso OpenCV (mp4v)")
+        elif backend == "ffmpeg":
+            print("ffmpeg no encontrado, uso OpenCV (mp4v)")
+    return EscritorOpenCV(path, fps, size)
+
+
+def argumentos_escritor(ap):
+    """Agrega al parser las opciones del encoder."""
+    ap.add_argument("--encoder", choices=["auto", "ffmpeg", "opencv"],
+                    default="auto",
+                    help="auto: ffmpeg si está instalado, si no OpenCV mp4v")
+    ap.add_argument("--codec", default="libx264",
+                    help="Codec de ffmpeg (libx264, libx265, h264_nvenc, ...)")
+    ap.add_argument("--crf", type=int, default=23,
+                    help="Calidad constante de x264/x265 (menor = mejor)")
+    ap.add_argument("--preset", default="veryfast",
+                    help="Preset de x264/x265 (ultrafast ... veryslow)")
+    ap.add_argument("--enc-threads", type=int, default=0,
+                    help="Hilos del encoder ffmpeg (0 = automático)")
+    ap.add_argument("--ffmpeg", default=None,
+                    help="Ruta al ejecutable de ffmpeg")
+
+
+def escritor_desde_args(args, path, fps: float, size):
+    return crear_escritor(path, fps, size, backend=args.encoder,
+                          codec=args.codec, preset=args.preset,
+                          crf=args.crf, threads=args.enc_threads,
+                          ffmpeg=args.ffmpeg)
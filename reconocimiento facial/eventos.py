@@ -0,0 +1,108 @@
+"""
+Salida de eventos por frame y por track (sin video).
+
+Cada registro es un vehículo en un frame:
+    frame, t, track_id, clase, conf, x1, y1, x2, y2, luces, area_luces
+donde `luces` es la lista de cajas de luces de freno [x1, y1, x2, y2, area].
+
+Los registros se juntan en bloques de `chunk` filas y se escriben a disco
+al llenarse el bloque, así la memoria no crece con la duración del video.
+El formato sale de la extensión: .jsonl (por defecto) o .parquet
+(requiere pyarrow).
+"""
+import json
+from pathlib import Path
+
+
+def _schema_parquet(pa):
+    caja = pa.struct([
+        ("x1", pa.int32()), ("y1", pa.int32()),
+        ("x2", pa.int32()), ("y2", pa.int32()),
+        ("area", pa.int32()),
+    ])
+    return pa.schema([
+        ("frame", pa.int64()),
+        ("t", pa.float64()),
+        ("track_id", pa.int64()),
+        ("clase", pa.string()),
+        ("conf", pa.float32()),
+        ("x1", pa.int32()), ("y1", pa.int32()),
+        ("x2", pa.int32()), ("y2", pa.int32()),
+        ("luces", pa.list_(caja)),
+        ("area_luces", pa.int64()),
+    ])
+
+
+class EscritorEventos:
+    """
+    inicio: índice del primer frame registrado (con --start los frames y
+    tiempos siguen siendo los del video completo).
+    """
+
+    def __init__(self, path, fps: float, names, chunk: int = 1000, inicio: int = 0):
+        self.path = Path(path)
+        self.fps = fps or 30.0
+        self.names = names
+        self.chunk = max(chunk, 1)
+        self.frame = inicio
+        self.filas = []
+        self.total = 0
+        self.parquet = self.path.suffix.lower() == ".parquet"
+
+        if self.parquet:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as exc:
+                raise RuntimeError(
+                    "Para escribir .parquet instala pyarrow (pip install pyarrow)") from exc
+            self._pa = pa
+            self._schema = _schema_parquet(pa)
+            self._archivo = pq.ParquetWriter(str(self.path), self._schema)
+        else:
+            self._archivo = open(self.path, "w", encoding="utf-8")
+
+    def agregar(self, vehiculos):
+        """Registra los vehículos del siguiente frame (en orden)."""
+        t = self.frame / self.fps
+        for (x1, y1, x2, y2, tid, cf, cls_id), light_boxes in vehiculos:
+            luces = [{"x1": int(lx1), "y1": int(ly1), "x2": int(lx2),
+                      "y2": int(ly2), "area": int(area)}
+                     for lx1, ly1, lx2, ly2, area in light_boxes]
+            self.filas.append({
+                "frame": self.frame,
+                "t": round(t, 4),
+                "track_id": int(tid),
+                "clase": self.names.get(int(cls_id), str(int(cls_id))),
+                "conf": round(float(cf), 4),
+                "x1": int(x1), "y1": int(y1), "x2": int(x2), "y2": int(y2),
+                "luces": luces,
+                "area_luces": sum(luz["area"] for luz in luces),
+            })
+        self.frame += 1
+        if len(self.filas) >= self.chunk:
+            self.vaciar()
+
+    def vaciar(self):
+        """Escribe a disco el bloque pendiente."""
+        if not self.filas:
+            return
+        if self.parquet:
+            tabla = self._pa.Table.from_pylist(self.filas, schema=self._schema)
+            self._archivo.write_table(tabla)
+        else:
+            self._archivo.writelines(
+                json.dumps(fila, ensure_ascii=False) + "\n" for fila in self.filas)
+            self._archivo.flush()
+        self.total += len(self.filas)
+        self.filas = []
+
+    def cerrar(self):
+        self.vaciar()
+        self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
@@ -1,11 +1,15 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import subprocess
-import threading
 from pathlib import Path
 import os
 import sys
 
+from trabajador_videos import ColaTrabajos
+
+# Modelo que los procesos de trabajo cargan al arrancar (el de pruebavideo.py)
+MODELO = "yolo12n.pt"
+
 
 def abrir_archivo(path: Path):
     """Abre un archivo con la app por defecto (Windows/Mac/Linux)."""
@@ -34,83 +38,142 @@ def abrir_carpeta(path: Path):
         messagebox.showerror("Error", f"No se pudo abrir la carpeta.\n{exc}")
 
 
-def procesar_video(video_path: str, ventana: tk.Tk):
-    input_p = Path(video_path)
-    output_path = input_p.with_name(input_p.stem + "_processed.mp4")
-
-    # UI refs
-    progress_bar = ventana._progress_bar
-    boton_seleccionar = ventana._boton_seleccionar
-    boton_abrir = ventana._boton_abrir
-    boton_carpeta = ventana._boton_carpeta
-    salida_var = ventana._salida_var
-
-    # Preparar UI
-    boton_seleccionar.config(state="disabled")
-    boton_abrir.config(state="disabled")
-    boton_carpeta.config(state="disabled")
-    salida_var.set(f"Procesando...\nSalida: {output_path.name}")
-
-    progress_bar.configure(mode="indeterminate")
-    progress_bar.start(12)
-
-    def finish_ui():
-        progress_bar.stop()
-        progress_bar.configure(mode="determinate", value=0)
-        boton_seleccionar.config(state="normal")
-
-    def run_subprocess():
-        try:
-            subprocess.run(
-                ["python3", "pruebavideo.py", "--input",
-                    str(input_p), "--output", str(output_path)],
-                check=True,
-            )
-
-            # Guardar última salida y habilitar botones (en hilo principal)
-            def on_success():
-                ventana._last_output_path = output_path
-                salida_var.set(f"Listo.\nSalida: {output_path}")
-                boton_abrir.config(state="normal")
-                boton_carpeta.config(state="normal")
-                messagebox.showinfo(
-                    "Éxito", f"Video procesado.\nGuardado en:\n{output_path}")
-
-            ventana.after(0, on_success)
-
-        except subprocess.CalledProcessError as exc:
-            ventana.after(0, lambda: messagebox.showerror(
-                "Error", f"Error al procesar.\n{exc}"))
-            ventana.after(0, lambda: salida_var.set(
-                "Error al procesar. Revisa la consola/logs."))
-        except Exception as exc:
-            ventana.after(0, lambda: messagebox.showerror(
-                "Error", f"Error inesperado.\n{exc}"))
-            ventana.after(0, lambda: salida_var.set("Error inesperado."))
-        finally:
-            ventana.after(0, finish_ui)
-
-    threading.Thread(target=run_subprocess, daemon=True).start()
-
-
-def seleccionar_video(ventana: tk.Tk):
-    video_path = filedialog.askopenfilename(
-        title="Seleccionar video",
+def formato_eta(segundos) -> str:
+    if segundos is None:
+        return ""
+    segundos = int(round(segundos))
+    return f"{segundos // 60}:{segundos % 60:02d}"
+
+
+def actualizar_total(ventana: tk.Tk):
+    """Barra general (frames hechos / frames totales) y resumen de la cola."""
+    trabajos = [t for t in ventana._trabajos.values() if t["estado"] != "cancelado"]
+    total = sum(t["total"] for t in trabajos)
+    hechos = sum(t["total"] if t["estado"] == "listo" else t["hechos"] for t in trabajos)
+    ventana._progress_bar.configure(value=100.0 * hechos / total if total else 0)
+
+    activos = sum(t["estado"] in ("en cola", "procesando") for t in trabajos)
+    listos = sum(t["estado"] == "listo" for t in trabajos)
+    errores = sum(t["estado"] == "error" for t in trabajos)
+    if activos:
+        ventana._salida_var.set(f"Procesando: {activos} en curso o en cola, "
+                                f"{listos} listos, {errores} con error")
+    elif trabajos:
+        ventana._salida_var.set(f"Terminado: {listos} listos, {errores} con error")
+
+
+def mostrar_trabajo(ventana: tk.Tk, trabajo_id: int):
+    t = ventana._trabajos[trabajo_id]
+    if t["estado"] == "procesando" and t["total"]:
+        progreso = f"{100.0 * t['hechos'] / t['total']:.0f}%"
+    elif t["estado"] == "listo":
+        progreso = "100%"
+    else:
+        progreso = ""
+    fps = f"{t['fps']:.1f}" if t["fps"] else ""
+    ventana._tabla.item(str(trabajo_id), values=(
+        t["entrada"].name, t["estado"], progreso, fps, formato_eta(t["eta"])))
+
+
+def al_evento(ventana: tk.Tk, msg: dict):
+    """Mensaje de un proceso de trabajo (se llama en el hilo de la UI)."""
+    t = ventana._trabajos.get(msg.get("id"))
+    if t is None:
+        return
+    if msg["tipo"] == "inicio":
+        t.update(estado="procesando", total=msg["total"])
+    elif msg["tipo"] == "progreso":
+        t.update(hechos=msg["hechos"], total=msg["total"], fps=msg["fps"],
+                 eta=msg["eta"])
+    elif msg["tipo"] == "fin":
+        estados = {"ok": "listo", "cancelado": "cancelado", "error": "error"}
+        t.update(estado=estados[msg["estado"]], eta=None)
+        if msg["estado"] == "ok":
+            ventana._last_output_path = t["salida"]
+        elif msg["estado"] == "error":
+            messagebox.showerror(
+                "Error", f"Error al procesar {t['entrada'].name}.\n{msg['mensaje']}")
+        actualizar_botones(ventana)
+    mostrar_trabajo(ventana, msg["id"])
+    actualizar_total(ventana)
+
+
+def actualizar_botones(ventana: tk.Tk):
+    """
+    Abrir/carpeta según haya un resultado elegido, y cancelar según haya
+    en la selección algún trabajo que todavía no terminó.
+    """
+    resultado = "normal" if ventana._last_output_path else "disabled"
+    ventana._boton_abrir.config(state=resultado)
+    ventana._boton_carpeta.config(state=resultado)
+    pendientes = any(ventana._trabajos[int(iid)]["estado"] in ("en cola", "procesando")
+                     for iid in ventana._tabla.selection())
+    ventana._boton_cancelar.config(state="normal" if pendientes else "disabled")
+
+
+def procesar_videos(video_paths, ventana: tk.Tk):
+    """Encola los videos en los procesos de trabajo (ya tienen el modelo cargado)."""
+    for video_path in video_paths:
+        input_p = Path(video_path)
+        output_path = input_p.with_name(input_p.stem + "_processed.mp4")
+        trabajo_id = ventana._cola.agregar(
+            ["--input", str(input_p), "--output", str(output_path),
+             "--model", MODELO])
+        ventana._trabajos[trabajo_id] = {
+            "entrada": input_p, "salida": output_path, "estado": "en cola",
+            "hechos": 0, "total": 0, "fps": None, "eta": None,
+        }
+        ventana._tabla.insert("", "end", iid=str(trabajo_id))
+        mostrar_trabajo(ventana, trabajo_id)
+    actualizar_total(ventana)
+
+
+def seleccionar_videos(ventana: tk.Tk):
+    video_paths = filedialog.askopenfilenames(
+        title="Seleccionar videos",
         filetypes=[("Archivos de video", "*.mp4 *.avi *.mov *.mkv")],
     )
-    if video_path:
-        procesar_video(video_path, ventana)
+    if video_paths:
+        procesar_videos(video_paths, ventana)
+
+
+def cancelar_seleccion(ventana: tk.Tk):
+    for iid in ventana._tabla.selection():
+        trabajo_id = int(iid)
+        if ventana._trabajos[trabajo_id]["estado"] in ("en cola", "procesando"):
+            ventana._cola.cancelar(trabajo_id)
+
+
+def al_seleccionar(ventana: tk.Tk):
+    """Los botones de abrir apuntan al trabajo seleccionado si ya terminó."""
+    for iid in ventana._tabla.selection():
+        t = ventana._trabajos[int(iid)]
+        if t["estado"] == "listo":
+            ventana._last_output_path = t["salida"]
+    actualizar_botones(ventana)
+
+
+def cerrar(ventana: tk.Tk):
+    ventana._cola.cerrar()
+    ventana.destroy()
 
 
 def main():
     ventana = tk.Tk()
     ventana.title("Procesador de Videos")
-    ventana.geometry("520x320")
+    ventana.geometry("720x480")
     ventana.resizable(False, False)
 
     ventana._last_output_path = None  # type: ignore[attr-defined]
+    ventana._trabajos = {}  # type: ignore[attr-defined]
     ventana._salida_var = tk.StringVar(
-        value="Selecciona un video para procesar")  # type: ignore[attr-defined]
+        value="Selecciona uno o más videos para procesar")  # type: ignore[attr-defined]
+
+    # Los procesos de trabajo arrancan ya y cargan el modelo mientras se
+    # eligen los videos; los mensajes llegan desde sus hilos lectores
+    ventana._cola = ColaTrabajos(  # type: ignore[attr-defined]
+        lambda msg: ventana.after(0, lambda: al_evento(ventana, msg)),
+        concurrencia=1, modelo=MODELO)
 
     etiqueta = tk.Label(
         ventana, text="Procesador de Videos", font=("Arial", 16))
@@ -118,37 +181,66 @@ def main():
 
     estado = tk.Label(ventana, textvariable=ventana._salida_var,
                       font=("Arial", 10), justify="left")
-    estado.pack(pady=8)
+    estado.pack(pady=4)
+
+    columnas = ("video", "estado", "progreso", "fps", "eta")
+    ventana._tabla = ttk.Treeview(  # type: ignore[attr-defined]
+        ventana, columns=columnas, show="headings", height=10)
+    for col, titulo, ancho in zip(columnas,
+                                  ("Video", "Estado", "Progreso", "FPS", "ETA"),
+                                  (300, 110, 90, 70, 70)):
+        ventana._tabla.heading(col, text=titulo)
+        ventana._tabla.column(col, width=ancho, anchor="w" if col == "video" else "center")
+    ventana._tabla.bind("<<TreeviewSelect>>", lambda _e: al_seleccionar(ventana))
+    ventana._tabla.pack(padx=10, pady=4)
 
     ventana._progress_bar = ttk.Progressbar(
-        ventana, orient="horizontal", length=420, mode="determinate")  # type: ignore[attr-defined]
-    ventana._progress_bar.pack(pady=10)
+        ventana, orient="horizontal", length=660, mode="determinate")  # type: ignore[attr-defined]
+    ventana._progress_bar.pack(pady=8)
 
     frame_btns = tk.Frame(ventana)
-    frame_btns.pack(pady=10)
+    frame_btns.pack(pady=6)
 
     ventana._boton_seleccionar = tk.Button(  # type: ignore[attr-defined]
-        frame_btns, text="Seleccionar Video", font=("Arial", 12), width=16,
-        command=lambda: seleccionar_video(ventana)
+        frame_btns, text="Agregar Videos", font=("Arial", 12), width=14,
+        command=lambda: seleccionar_videos(ventana)
     )
     ventana._boton_seleccionar.grid(row=0, column=0, padx=6)
 
+    ventana._boton_cancelar = tk.Button(  # type: ignore[attr-defined]
+        frame_btns, text="Cancelar", font=("Arial", 12), width=10,
+        state="disabled",
+        command=lambda: cancelar_seleccion(ventana)
+    )
+    ventana._boton_cancelar.grid(row=0, column=1, padx=6)
+
     ventana._boton_abrir = tk.Button(  # type: ignore[attr-defined]
-        frame_btns, text="Abrir resultado", font=("Arial", 12), width=16,
+        frame_btns, text="Abrir resultado", font=("Arial", 12), width=14,
         state="disabled",
         command=lambda: abrir_archivo(
             ventana._last_output_path) if ventana._last_output_path else None
     )
-    ventana._boton_abrir.grid(row=0, column=1, padx=6)
+    ventana._boton_abrir.grid(row=0, column=2, padx=6)
 
     ventana._boton_carpeta = tk.Button(  # type: ignore[attr-defined]
-        frame_btns, text="Abrir carpeta", font=("Arial", 12), width=16,
+        frame_btns, text="Abrir carpeta", font=("Arial", 12), width=14,
         state="disabled",
         command=lambda: abrir_carpeta(
             ventana._last_output_path) if ventana._last_output_path else None
     )
-    ventana._boton_carpeta.grid(row=0, column=2, padx=6)
-
+    ventana._boton_carpeta.grid(row=0, column=3, padx=6)
+
+    frame_conc = tk.Frame(ventana)
+    frame_conc.pack(pady=4)
+    tk.Label(frame_conc, text="Videos en paralelo:",
+             font=("Arial", 10)).pack(side="left")
+    ventana._concurrencia = tk.IntVar(value=1)  # type: ignore[attr-defined]
+    tk.Spinbox(frame_conc, from_=1, to=max(1, os.cpu_count() or 1), width=4,
+               textvariable=ventana._concurrencia, state="readonly",
+               command=lambda: ventana._cola.ajustar(ventana._concurrencia.get())
+               ).pack(side="left", padx=6)
+
+    ventana.protocol("WM_DELETE_WINDOW", lambda: cerrar(ventana))
     ventana.mainloop()
 
 
@@ -0,0 +1,83 @@
+"""
+Procesamiento con salto de frames (--stride N).
+
+El video se parte en tramos de N frames: el primero de cada tramo es el
+keyframe, que pasa por el tracker y por la etapa de color; en los demás las
+cajas de los vehículos se interpolan linealmente entre ese keyframe y el
+siguiente, y las luces de freno del keyframe se arrastran moviéndose con
+la caja del vehículo. Así el video de salida tiene anotaciones en todos los
+frames con 1/N del cómputo.
+"""
+
+
+def reubicar_luces(luces, origen, destino):
+    """Mueve las cajas de luces de la caja `origen` del vehículo a `destino`."""
+    ox1, oy1, ox2, oy2 = origen
+    dx1, dy1, dx2, dy2 = destino
+    sx = (dx2 - dx1) / float(max(ox2 - ox1, 1))
+    sy = (dy2 - dy1) / float(max(oy2 - oy1, 1))
+    return [(dx1 + int(round((lx1 - ox1) * sx)), dy1 + int(round((ly1 - oy1) * sy)),
+             dx1 + int(round((lx2 - ox1) * sx)), dy1 + int(round((ly2 - oy1) * sy)),
+             int(area * sx * sy))
+            for lx1, ly1, lx2, ly2, area in luces]
+
+
+def interpolar_vehiculos(vehiculos, siguientes, t: float):
+    """
+    Vehículos en la fracción `t` (0..1) entre un keyframe y el siguiente.
+
+    vehiculos: [(det, light_boxes), ...] del keyframe actual
+    siguientes: detecciones del keyframe siguiente, o None si no hay
+    Los tracks que están en los dos keyframes se interpolan; los que solo
+    están en uno se muestran en la mitad del tramo más cercana a ese
+    keyframe (los nuevos, sin luces hasta que se analicen).
+    """
+    if siguientes is None:
+        return vehiculos
+    por_id = {det[4]: det for det in siguientes}
+    salida = []
+    for det, luces in vehiculos:
+        sig = por_id.get(det[4])
+        if sig is None:
+            if t < 0.5:
+                salida.append((det, luces))
+            continue
+        caja = tuple(int(round(a + (b - a) * t)) for a, b in zip(det[:4], sig[:4]))
+        salida.append(((*caja, *det[4:]), reubicar_luces(luces, det[:4], caja)))
+    if t >= 0.5:
+        actuales = {det[4] for det, _luces in vehiculos}
+        salida.extend((det, []) for det in siguientes if det[4] not in actuales)
+    return salida
+
+
+class Tramos:
+    """
+    Retiene cada tramo hasta conocer las detecciones del keyframe siguiente.
+    Con paso 1 no hay nada que interpolar y los tramos salen sin demora.
+    """
+
+    def __init__(self, paso: int):
+        self.paso = paso
+        self.pendiente = None
+
+    def agregar(self, rastreados):
+        """
+        rastreados: [(frames_del_tramo, dets_del_keyframe), ...] en orden.
+        Devuelve [(frames, dets, dets_siguientes), ...] listos para anotar.
+        """
+        if self.paso == 1:
+            return [(frames, dets, None) for frames, dets in rastreados]
+        listos = []
+        for frames, dets in rastreados:
+            if self.pendiente is not None:
+                listos.append((*self.pendiente, dets))
+            self.pendiente = (frames, dets)
+        return listos
+
+    def terminar(self):
+        """El último tramo (sin keyframe siguiente: las cajas quedan fijas)."""
+        if self.pendiente is None:
+            return []
+        frames, dets = self.pendiente
+        self.pendiente = None
+        return [(frames, dets, None)]
@@ -0,0 +1,386 @@
+"""
+Detección con clasificadores Haar sobre carpetas enteras de imágenes y videos.
+
+    python3 lote_cascadas.py /archivo/fotos --index detecciones.sqlite --workers 8
+
+Recorre el árbol, reparte los archivos entre procesos (cada uno carga sus
+cascadas una sola vez) y guarda las cajas en un índice SQLite. Cada archivo
+queda registrado con su mtime, tamaño y la configuración usada, así que al
+volver a correr solo se procesan los archivos nuevos, modificados o
+analizados con otros parámetros; un corte a mitad de camino no pierde lo ya
+guardado.
+
+Tablas del índice:
+    archivos(ruta, mtime_ns, tam, config, frames, segundos, error)
+    detecciones(ruta, frame, etiqueta, x, y, w, h)
+Las cajas están en píxeles del archivo original; en imágenes frame = 0.
+
+Las imágenes se decodifican directamente en gris y reducidas
+(IMREAD_REDUCED_GRAYSCALE_*) cuando --scale lo permite: en JPEG eso evita
+decodificar la mitad o más de los píxeles.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import cv2
+
+from cache_detecciones import huella_archivo
+from detector_cascada import (RUTA, DetectorCascada, DetectorMultiCascada,
+                              cascadas_de_args)
+
+EXT_IMAGENES = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp", ".pgm", ".ppm"}
+EXT_VIDEOS = {".mp4", ".avi", ".mov", ".mkv", ".m4v", ".wmv", ".mpg", ".mpeg"}
+
+CASCADAS_POR_DEFECTO = [f"cara={RUTA / 'haarcascade_frontalface_default.xml'}",
+                        f"auto={RUTA / 'cars.xml'}"]
+
+# Lecturas reducidas de imread: (divisor, bandera)
+_REDUCCIONES = [(8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)]
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS archivos (
+    ruta TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    tam INTEGER NOT NULL,
+    config TEXT NOT NULL,
+    frames INTEGER NOT NULL,
+    segundos REAL NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS detecciones (
+    ruta TEXT NOT NULL,
+    frame INTEGER NOT NULL,
+    etiqueta TEXT NOT NULL,
+    x INTEGER NOT NULL, y INTEGER NOT NULL, w INTEGER NOT NULL, h INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS detecciones_ruta ON detecciones (ruta);
+"""
+
+
+class IndiceDetecciones:
+    """
+    Índice SQLite de archivos procesados y sus detecciones. Solo lo usa el
+    proceso principal (un único escritor); las escrituras se confirman por
+    tandas para no pagar un fsync por archivo.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.con = sqlite3.connect(str(self.path))
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        self.con.executescript(_ESQUEMA)
+        self.pendientes = 0
+
+    def conocidos(self) -> dict:
+        """{ruta: (mtime_ns, tam, config, error)} de lo ya indexado."""
+        filas = self.con.execute(
+            "SELECT ruta, mtime_ns, tam, config, error FROM archivos")
+        return {ruta: (mtime, tam, config, error)
+                for ruta, mtime, tam, config, error in filas}
+
+    def guardar(self, ruta, mtime_ns, tam, config, frames, segundos, dets, error=None):
+        """Reemplaza lo guardado para `ruta`. dets: [(frame, etiqueta, (x, y, w, h)), ...]."""
+        self.con.execute("DELETE FROM detecciones WHERE ruta = ?", (ruta,))
+        self.con.execute(
+            "INSERT OR REPLACE INTO archivos VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (ruta, mtime_ns, tam, config, frames, segundos, error))
+        self.con.executemany(
+            "INSERT INTO detecciones VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(ruta, frame, etiqueta, *caja) for frame, etiqueta, caja in dets])
+        self.pendientes += 1
+
+    def quitar(self, rutas):
+        for ruta in rutas:
+            self.con.execute("DELETE FROM detecciones WHERE ruta = ?", (ruta,))
+            self.con.execute("DELETE FROM archivos WHERE ruta = ?", (ruta,))
+
+    def confirmar(self):
+        self.con.commit()
+        self.pendientes = 0
+
+    def cerrar(self):
+        self.confirmar()
+        self.con.close()
+
+
+def huella_config(cascadas: dict, escala, scale_factor, min_neighbors,
+                  min_size, video_cada) -> str:
+    """Identifica los parámetros que cambian las detecciones."""
+    config = {
+        "cascadas": {e: huella_archivo(xml) for e, xml in sorted(cascadas.items())},
+        "escala": round(float(escala), 6),
+        "scale_factor": round(float(scale_factor), 6),
+        "min_neighbors": int(min_neighbors),
+        "min_size": int(min_size),
+        "video_cada": int(video_cada),
+    }
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def buscar_archivos(raiz, videos: bool = True):
+    """Rutas absolutas de imágenes (y videos) bajo `raiz`, en orden estable."""
+    extensiones = EXT_IMAGENES | (EXT_VIDEOS if videos else set())
+    for carpeta, subcarpetas, nombres in os.walk(raiz):
+        subcarpetas.sort()
+        for nombre in sorted(nombres):
+            if os.path.splitext(nombre)[1].lower() in extensiones:
+                yield os.path.abspath(os.path.join(carpeta, nombre))
+
+
+# --- proceso hijo --------------------------------------------------------
+
+_detector = None
+_video_cada = 1
+
+
+def _iniciar_trabajador(cascadas, opciones, video_cada):
+    """Una vez por proceso: carga las cascadas y deja OpenCV en un hilo."""
+    global _detector, _video_cada
+    cv2.setNumThreads(1)
+    if len(cascadas) == 1:
+        (etiqueta, xml), = cascadas.items()
+        _detector = DetectorCascada(xml, etiqueta=etiqueta, **opciones)
+    else:
+        _detector = DetectorMultiCascada(cascadas, **opciones)
+    _video_cada = max(1, video_cada)
+
+
+def leer_imagen_gris(ruta, escala: float):
+    """
+    Imagen en gris a `escala` de su tamaño. Usa la lectura reducida de
+    imread con el divisor más grande que no achique de más y completa con
+    resize. None si no se pudo leer.
+    """
+    for divisor, bandera in _REDUCCIONES:
+        if 1.0 / divisor >= escala:
+            gris = cv2.imread(ruta, bandera)
+            resto = escala * divisor
+            break
+    else:
+        gris = cv2.imread(ruta, cv2.IMREAD_GRAYSCALE)
+        resto = escala
+    if gris is None:
+        return None
+    if resto != 1.0:
+        h, w = gris.shape[:2]
+        gris = cv2.resize(gris, (max(1, int(w * resto)), max(1, int(h * resto))),
+                          interpolation=cv2.INTER_AREA)
+    return gris
+
+
+def _detectar(gris, frame):
+    dets = _detector.detectar_etiquetadas(gris)
+    cajas = _detector.al_frame([caja for _e, caja in dets])
+    return [(frame, etiqueta, caja) for (etiqueta, _c), caja in zip(dets, cajas)]
+
+
+def _analizar(tarea):
+    """(ruta, mtime_ns, tam) -> (tarea, frames, segundos, dets, error)."""
+    ruta = tarea[0]
+    t0 = time.perf_counter()
+    dets = []
+    frames = 0
+    try:
+        if os.path.splitext(ruta)[1].lower() in EXT_VIDEOS:
+            cap = cv2.VideoCapture(ruta)
+            if not cap.isOpened():
+                raise RuntimeError("no se pudo abrir")
+            try:
+                numero = 0
+                while True:
+                    # Los frames salteados se decodifican (grab) pero no se convierten ni se copian
+                    if numero % _video_cada:
+                        if not cap.grab():
+                            break
+                    else:
+                        ok, frame = cap.read()
+                        if not ok:
+                            break
+                        dets.extend(_detectar(_detector.preparar(frame), numero))
+                        frames += 1
+                    numero += 1
+            finally:
+                cap.release()
+        else:
+            gris = leer_imagen_gris(ruta, _detector.escala)
+            if gris is None:
+                raise RuntimeError("no se pudo leer la imagen")
+            dets = _detectar(gris, 0)
+            frames = 1
+    except Exception as e:  # un archivo roto no corta el lote
+        return tarea, frames, time.perf_counter() - t0, [], f"{type(e).__name__}: {e}"
+    return tarea, frames, time.perf_counter() - t0, dets, None
+
+
+# --- proceso principal ---------------------------------------------------
+
+def pendientes(rutas, conocidos: dict, config: str, reintentar: bool = False):
+    """Tareas (ruta, mtime_ns, tam) que no están en el índice tal como están en disco."""
+    tareas = []
+    for ruta in rutas:
+        try:
+            st = os.stat(ruta)
+        except OSError:
+            continue
+        previo = conocidos.get(ruta)
+        if (previo is not None and previo[:3] == (st.st_mtime_ns, st.st_size, config)
+                and not (reintentar and previo[3])):
+            continue
+        tareas.append((ruta, st.st_mtime_ns, st.st_size))
+    return tareas
+
+
+class Avance:
+    """Throughput del lote: archivos y frames por segundo, cada `cada` segundos."""
+
+    def __init__(self, total: int, cada: float = 5.0):
+        self.total = total
+        self.cada = cada
+        self.t0 = time.perf_counter()
+        self.ultimo = self.t0
+        self.archivos = 0
+        self.frames = 0
+        self.detecciones = 0
+        self.errores = 0
+        self.segundos_detector = 0.0
+
+    def agregar(self, frames: int, dets: int, segundos: float, error):
+        self.archivos += 1
+        self.frames += frames
+        self.detecciones += dets
+        self.segundos_detector += segundos
+        self.errores += error is not None
+        ahora = time.perf_counter()
+        if ahora - self.ultimo >= self.cada:
+            self.ultimo = ahora
+            print(self.linea(ahora), flush=True)
+
+    def linea(self, ahora=None) -> str:
+        t = max((ahora or time.perf_counter()) - self.t0, 1e-9)
+        restantes = self.total - self.archivos
+        eta = restantes * t / self.archivos if self.archivos else 0.0
+        return (f"{self.archivos}/{self.total} archivos  "
+                f"{self.archivos / t:.1f} arch/s  {self.frames / t:.1f} frames/s  "
+                f"{self.detecciones} detecciones  {self.errores} errores  "
+                f"ETA {eta / 60:.1f} min")
+
+
+def construir_parser():
+    ap = argparse.ArgumentParser(
+        description="Detección Haar por lotes sobre carpetas de imágenes y videos")
+    ap.add_argument("carpetas", nargs="+", help="Carpetas (o archivos) a recorrer")
+    ap.add_argument("--index", default="detecciones.sqlite",
+                    help="Índice SQLite donde se guardan las detecciones")
+    ap.add_argument("--cascade", action="append", default=None,
+                    help="Clasificador Haar (.xml), o etiqueta=xml; repetible "
+                         "(por defecto: caras y autos)")
+    ap.add_argument("--scale", type=float, default=0.5,
+                    help="Escala de la imagen para detectar (1 = tamaño original)")
+    ap.add_argument("--scale-factor", type=float, default=1.1,
+                    help="scaleFactor de detectMultiScale")
+    ap.add_argument("--min-neighbors", type=int, default=4,
+                    help="minNeighbors de detectMultiScale")
+    ap.add_argument("--min-size", type=int, default=0,
+                    help="Lado mínimo del objeto en píxeles del original (0 = sin límite)")
+    ap.add_argument("--video-every", type=int, default=1,
+                    help="En videos, detectar 1 de cada N frames")
+    ap.add_argument("--no-videos", action="store_true", help="Solo imágenes")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="Procesos (0 = uno por CPU)")
+    ap.add_argument("--retry-errors", action="store_true",
+                    help="Vuelve a intentar los archivos que fallaron antes")
+    ap.add_argument("--prune", action="store_true",
+                    help="Quita del índice los archivos que ya no existen")
+    ap.add_argument("--commit-every", type=int, default=500,
+                    help="Archivos por transacción del índice")
+    return ap
+
+
+def main():
+    ap = construir_parser()
+    args = ap.parse_args()
+    if not 0 < args.scale <= 1:
+        ap.error("--scale debe estar en (0, 1]")
+    if args.scale_factor <= 1:
+        ap.error("--scale-factor debe ser mayor que 1")
+    if args.video_every < 1:
+        ap.error("--video-every debe ser >= 1")
+
+    cascadas = cascadas_de_args(args.cascade or CASCADAS_POR_DEFECTO, None)
+    for xml in cascadas.values():
+        if not Path(xml).is_file():
+            ap.error(f"No existe el clasificador: {xml}")
+    opciones = dict(escala=args.scale, scale_factor=args.scale_factor,
+                    min_neighbors=args.min_neighbors, min_size=args.min_size)
+    config = huella_config(cascadas, video_cada=args.video_every, **opciones)
+
+    rutas = []
+    for carpeta in args.carpetas:
+        if os.path.isfile(carpeta):
+            rutas.append(os.path.abspath(carpeta))
+        else:
+            rutas.extend(buscar_archivos(carpeta, videos=not args.no_videos))
+
+    indice = IndiceDetecciones(args.index)
+    conocidos = indice.conocidos()
+    if args.prune:
+        en_disco = set(rutas)
+        borrados = [r for r in conocidos if r not in en_disco and not os.path.exists(r)]
+        indice.quitar(borrados)
+        indice.confirmar()
+        print(f"Quitados del índice: {len(borrados)}")
+    tareas = pendientes(rutas, conocidos, config, args.retry_errors)
+    del conocidos
+    procesos = max(1, min(args.workers or os.cpu_count() or 1, len(tareas) or 1))
+    print(f"{len(rutas)} archivos, {len(rutas) - len(tareas)} sin cambios, "
+          f"{len(tareas)} a procesar con {procesos} procesos")
+
+    avance = Avance(len(tareas))
+    inicializar = (cascadas, opciones, args.video_every)
+    pool = None
+    try:
+        if procesos == 1:
+            _iniciar_trabajador(*inicializar)
+            resultados = map(_analizar, tareas)
+        else:
+            # spawn: cada proceso arranca limpio, como en segmentos.py
+            pool = mp.get_context("spawn").Pool(
+                procesos, initializer=_iniciar_trabajador, initargs=inicializar)
+            # Tandas chicas: los videos tardan mucho más que las fotos
+            resultados = pool.imap_unordered(
+                _analizar, tareas, chunksize=max(1, min(64, len(tareas) // (procesos * 8))))
+        for (ruta, mtime_ns, tam), frames, segundos, dets, error in resultados:
+            indice.guardar(ruta, mtime_ns, tam, config, frames, segundos, dets, error)
+            if indice.pendientes >= args.commit_every:
+                indice.confirmar()
+            avance.agregar(frames, len(dets), segundos, error)
+            if error:
+                print(f"Error en {ruta}: {error}", flush=True)
+        if pool is not None:
+            pool.close()
+            pool.join()
+    except KeyboardInterrupt:
+        print("Interrumpido: lo procesado hasta aquí queda en el índice")
+    finally:
+        if pool is not None:
+            pool.terminate()
+        indice.cerrar()
+
+    print(avance.linea())
+    if avance.frames:
+        print(f"Detector: {1000.0 * avance.segundos_detector / avance.frames:.1f} ms/frame "
+              f"por proceso")
+    print(f"Índice: {args.index}")
+
+
+if __name__ == "__main__":
+    main()
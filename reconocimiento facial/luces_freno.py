@@ -0,0 +1,370 @@
+"""
+Detección de luces de freno (blobs rojos) en la parte inferior de cada vehículo.
+
+Hay dos motores que dan exactamente el mismo resultado:
+- "roi": el original, convierte a HSV cada ROI por separado.
+- "frame": convierte a HSV y umbraliza una sola vez los píxeles de las zonas
+  inferiores de todos los vehículos del frame, y de ahí recorta cada ROI.
+
+Con `lut=True` cualquiera de los dos clasifica el rojo con una tabla BGR
+precalculada (tabla_rojo) en vez de convertir a HSV.
+"""
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+# Tamaño mínimo (alto/ancho) de un vehículo para analizarlo
+MIN_LADO_VEHICULO = 8
+
+KERNEL_MORFOLOGIA = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+
+# Tablas BGR (16 MB cada una) que se mantienen en memoria a la vez
+TABLAS_EN_MEMORIA = 16
+
+
+def rango_rojo_hsv(hsv: np.ndarray, s_min: int, v_min: int) -> np.ndarray:
+    """Umbral de rojo sobre una imagen ya en HSV (rojo se parte en dos rangos)."""
+    lower1 = np.array([0,   s_min, v_min], dtype=np.uint8)
+    upper1 = np.array([10,  255,   255], dtype=np.uint8)
+    lower2 = np.array([170, s_min, v_min], dtype=np.uint8)
+    upper2 = np.array([180, 255,   255], dtype=np.uint8)
+
+    m1 = cv2.inRange(hsv, lower1, upper1)
+    m2 = cv2.inRange(hsv, lower2, upper2)
+    return cv2.bitwise_or(m1, m2)
+
+
+@lru_cache(maxsize=TABLAS_EN_MEMORIA)
+def tabla_rojo(s_min: int, v_min: int) -> np.ndarray:
+    """
+    Resultado de rango_rojo_hsv para los 2^24 colores BGR posibles (16 MB),
+    indexado por B + 256*G + 65536*R. Se arma una vez por (s_min, v_min)
+    pasando todos los colores por el mismo cvtColor + inRange, así que
+    clasifica exactamente igual que el camino HSV.
+    """
+    tabla = np.empty(1 << 24, dtype=np.uint8)
+    bg = np.empty((256, 256, 3), dtype=np.uint8)
+    bg[..., 0] = np.arange(256, dtype=np.uint8)[None, :]  # B (columnas)
+    bg[..., 1] = np.arange(256, dtype=np.uint8)[:, None]  # G (filas)
+    bloque = np.empty((16, 256, 256, 3), dtype=np.uint8)
+    bloque[:] = bg
+    for r0 in range(0, 256, 16):
+        bloque[..., 2] = np.arange(r0, r0 + 16, dtype=np.uint8)[:, None, None]
+        hsv = cv2.cvtColor(bloque.reshape(16 * 256, 256, 3), cv2.COLOR_BGR2HSV)
+        tabla[r0 << 16:(r0 + 16) << 16] = rango_rojo_hsv(hsv, s_min, v_min).reshape(-1)
+    tabla.flags.writeable = False
+    return tabla
+
+
+def rango_rojo_lut(bgr: np.ndarray, s_min: int, v_min: int) -> np.ndarray:
+    """Mismo umbral que rango_rojo_hsv pero con una lectura de tabla por píxel."""
+    # BGRA visto como uint32 (little endian) es B | G<<8 | R<<16 | A<<24
+    codigos = cv2.cvtColor(bgr, cv2.COLOR_BGR2BGRA).view(np.uint32)[..., 0]
+    np.bitwise_and(codigos, 0xFFFFFF, out=codigos)
+    return np.take(tabla_rojo(s_min, v_min), codigos)
+
+
+def limpiar_mascara(mask: np.ndarray) -> np.ndarray:
+    """Apertura + cierre para quitar ruido y unir blobs cercanos."""
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, KERNEL_MORFOLOGIA, iterations=1)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, KERNEL_MORFOLOGIA, iterations=2)
+    return mask
+
+
+def red_mask_hsv(bgr: np.ndarray, s_min: int, v_min: int) -> np.ndarray:
+    """Máscara de rojo en HSV (rojo se parte en dos rangos)."""
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    return limpiar_mascara(rango_rojo_hsv(hsv, s_min, v_min))
+
+
+def red_mask_lut(bgr: np.ndarray, s_min: int, v_min: int) -> np.ndarray:
+    """Igual que red_mask_hsv pero con la tabla BGR precalculada."""
+    return limpiar_mascara(rango_rojo_lut(bgr, s_min, v_min))
+
+
+def rango_rojo(bgr: np.ndarray, s_min: int, v_min: int, lut: bool = False) -> np.ndarray:
+    """Umbral de rojo (sin morfología) por el camino pedido."""
+    if lut:
+        return rango_rojo_lut(bgr, s_min, v_min)
+    return rango_rojo_hsv(cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV), s_min, v_min)
+
+
+def filtrar_blobs(mask: np.ndarray, ox: int, oy: int,
+                  min_area: int, max_area_frac: float, min_solidity: float):
+    """
+    Filtra los contornos de `mask` por área, solidity y aspecto.
+    (ox, oy) es la esquina de la máscara en coordenadas del frame.
+    """
+    contours, _ = cv2.findContours(
+        mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    max_area = int(mask.shape[0] * mask.shape[1] * max_area_frac)
+
+    boxes = []
+    for cnt in contours:
+        area = float(cv2.contourArea(cnt))
+        if area < min_area or area > max_area:
+            continue
+
+        hull = cv2.convexHull(cnt)
+        hull_area = float(cv2.contourArea(hull)) if hull is not None else 0.0
+        if hull_area > 0:
+            solidity = area / hull_area
+            if solidity < min_solidity:
+                continue
+
+        x, y, bw, bh = cv2.boundingRect(cnt)
+        if bw <= 0 or bh <= 0:
+            continue
+
+        aspect = bw / float(bh)
+        if aspect < 0.3 or aspect > 10.0:
+            continue
+
+        gx1 = ox + x
+        gy1 = oy + y
+        gx2 = gx1 + bw
+        gy2 = gy1 + bh
+        boxes.append((gx1, gy1, gx2, gy2, int(area)))
+
+    return boxes
+
+
+def zona_inferior(x1: int, y1: int, x2: int, y2: int, bottom_frac: float):
+    """
+    Rectángulo (x1, y1, x2, y2) del % inferior del vehículo que se analiza,
+    o None si el vehículo es demasiado chico.
+    """
+    h, w = y2 - y1, x2 - x1
+    if h < MIN_LADO_VEHICULO or w < MIN_LADO_VEHICULO:
+        return None
+    y_start = int(h * (1.0 - bottom_frac))
+    if y_start >= h:
+        return None
+    return x1, y1 + y_start, x2, y2
+
+
+def find_stop_light_boxes(vehicle_roi: np.ndarray,
+                          x0: int, y0: int,
+                          bottom_frac: float,
+                          s_min: int, v_min: int,
+                          min_area: int,
+                          max_area_frac: float,
+                          min_solidity: float,
+                          lut: bool = False):
+    """Busca blobs rojos en el % inferior del vehículo."""
+    h, w = vehicle_roi.shape[:2]
+    zona = zona_inferior(0, 0, w, h, bottom_frac)
+    if zona is None:
+        return [], None
+
+    y_start = zona[1]
+    roi = vehicle_roi[y_start:h, 0:w]
+    mask = limpiar_mascara(rango_rojo(roi, s_min, v_min, lut))
+    boxes = filtrar_blobs(mask, x0, y0 + y_start,
+                          min_area, max_area_frac, min_solidity)
+    return boxes, mask
+
+
+def cobertura(zonas):
+    """
+    Rectángulos disjuntos cuya unión es exactamente la unión de las zonas.
+    Se comprimen las coordenadas en los bordes de las zonas, se marcan las
+    celdas cubiertas, se unen las celdas contiguas de cada franja y las
+    franjas con el mismo tramo. Así cada píxel se convierte una sola vez y
+    no se convierte ninguno fuera de las zonas.
+    """
+    xs = sorted({x for z in zonas for x in (z[0], z[2])})
+    ys = sorted({y for z in zonas for y in (z[1], z[3])})
+    ix = {x: i for i, x in enumerate(xs)}
+    iy = {y: i for i, y in enumerate(ys)}
+    grilla = np.zeros((len(ys) - 1, len(xs)), dtype=bool)  # última col: centinela
+    for zx1, zy1, zx2, zy2 in zonas:
+        grilla[iy[zy1]:iy[zy2], ix[zx1]:ix[zx2]] = True
+
+    rects = []
+    abiertos = {}  # (c0, c1) -> índice en rects del tramo que sigue abierto
+    for f in range(len(ys) - 1):
+        cambios = np.flatnonzero(np.diff(grilla[f].astype(np.int8), prepend=0))
+        siguientes = {}
+        for c0, c1 in zip(cambios[0::2].tolist(), cambios[1::2].tolist()):
+            if (c0, c1) in abiertos:
+                i = abiertos[(c0, c1)]
+                rects[i][3] = ys[f + 1]
+            else:
+                i = len(rects)
+                rects.append([xs[c0], ys[f], xs[c1], ys[f + 1]])
+            siguientes[(c0, c1)] = i
+        abiertos = siguientes
+    return [tuple(r) for r in rects]
+
+
+def find_stop_light_boxes_frame(frame: np.ndarray, rects,
+                                bottom_frac: float,
+                                s_min: int, v_min: int,
+                                min_area: int,
+                                max_area_frac: float,
+                                min_solidity: float,
+                                lut: bool = False):
+    """
+    Igual que find_stop_light_boxes() pero para todos los vehículos de un
+    frame a la vez. rects: [(x1, y1, x2, y2), ...] en coordenadas del frame.
+    Devuelve [(light_boxes, mask), ...] en el mismo orden que rects.
+
+    HSV y los inRange se calculan una sola vez por píxel de las zonas
+    inferiores (operaciones por píxel, así que recortar antes o después da
+    lo mismo, y las zonas solapadas no se convierten dos veces). La
+    morfología se hace por zona para respetar los bordes de cada ROI igual
+    que el motor original, y zonas idénticas se reutilizan.
+    """
+    zonas = [zona_inferior(*rect[:4], bottom_frac) for rect in rects]
+    validas = [z for z in zonas if z is not None]
+    if not validas:
+        return [([], None) for _ in zonas]
+
+    ux1 = min(z[0] for z in validas)
+    uy1 = min(z[1] for z in validas)
+    ux2 = max(z[2] for z in validas)
+    uy2 = max(z[3] for z in validas)
+    # Solo se escriben (y luego se leen) los píxeles cubiertos
+    crudo = np.empty((uy2 - uy1, ux2 - ux1), dtype=np.uint8)
+    for cx1, cy1, cx2, cy2 in cobertura(set(validas)):
+        crudo[cy1 - uy1:cy2 - uy1, cx1 - ux1:cx2 - ux1] = \
+            rango_rojo(frame[cy1:cy2, cx1:cx2], s_min, v_min, lut)
+
+    hechos = {}
+    salida = []
+    for zona in zonas:
+        if zona is None:
+            salida.append(([], None))
+            continue
+        if zona not in hechos:
+            zx1, zy1, zx2, zy2 = zona
+            mask = limpiar_mascara(
+                crudo[zy1 - uy1:zy2 - uy1, zx1 - ux1:zx2 - ux1])
+            boxes = filtrar_blobs(mask, zx1, zy1,
+                                  min_area, max_area_frac, min_solidity)
+            hechos[zona] = (boxes, mask)
+        boxes, mask = hechos[zona]
+        salida.append((list(boxes), mask))
+    return salida
+
+
+class ValidacionLut:
+    """
+    Compara píxel a píxel la clasificación de la tabla contra HSV en las
+    zonas analizadas (antes de la morfología) y cuenta los desacuerdos.
+    """
+
+    def __init__(self, s_min: int, v_min: int):
+        self.s_min = s_min
+        self.v_min = v_min
+        self.pixeles = 0
+        self.distintos = 0
+        self.zonas = 0
+        self.zonas_distintas = 0
+
+    def agregar(self, bgr: np.ndarray):
+        hsv = rango_rojo(bgr, self.s_min, self.v_min, lut=False)
+        tabla = rango_rojo(bgr, self.s_min, self.v_min, lut=True)
+        distintos = int(np.count_nonzero(hsv != tabla))
+        self.pixeles += hsv.size
+        self.distintos += distintos
+        self.zonas += 1
+        self.zonas_distintas += distintos > 0
+
+    def resumen(self) -> str:
+        frac = self.distintos / max(self.pixeles, 1)
+        return (f"Validación LUT vs HSV: {self.distintos}/{self.pixeles} píxeles "
+                f"distintos ({frac:.2e}), {self.zonas_distintas}/{self.zonas} zonas")
+
+
+def estadistica_roja(frame: np.ndarray, zona) -> float:
+    """Indicador barato de rojo de una zona: R medio menos promedio de B y G."""
+    zx1, zy1, zx2, zy2 = zona
+    b, g, r, _ = cv2.mean(frame[zy1:zy2, zx1:zx2])
+    return r - (b + g) / 2.0
+
+
+class CacheLuces:
+    """
+    Cache por ID de track de las luces de freno detectadas.
+
+    Guarda las cajas relativas a la caja del vehículo y solo vuelve a
+    analizar el color cuando:
+    - pasaron `cada` frames desde el último análisis,
+    - la caja se movió o cambió de tamaño más de `umbral_mov` (fracción
+      del ancho/alto del vehículo), o
+    - el rojo medio de la zona inferior cambió más de `umbral_rojo`.
+
+    `paso` es cuántos frames de video avanza cada nuevo_frame() (con
+    --stride solo se analizan los keyframes), así `cada` sigue contando
+    frames de video. aciertos/fallos cuentan análisis, uno por vehículo
+    en cada frame analizado.
+    """
+
+    def __init__(self, cada: int = 5, umbral_mov: float = 0.1,
+                 umbral_rojo: float = 6.0, paso: int = 1):
+        self.cada = cada
+        self.paso = paso
+        self.umbral_mov = umbral_mov
+        self.umbral_rojo = umbral_rojo
+        self.frame = 0
+        self.entradas = {}
+        self.aciertos = 0
+        self.fallos = 0
+
+    def nuevo_frame(self):
+        self.frame += self.paso
+
+    def _se_movio(self, antes, ahora) -> bool:
+        ax1, ay1, ax2, ay2 = antes
+        bx1, by1, bx2, by2 = ahora
+        w, h = max(ax2 - ax1, 1), max(ay2 - ay1, 1)
+        return (abs(bx1 - ax1) > self.umbral_mov * w
+                or abs(bx2 - ax2) > self.umbral_mov * w
+                or abs(by1 - ay1) > self.umbral_mov * h
+                or abs(by2 - ay2) > self.umbral_mov * h)
+
+    def buscar(self, tid: int, rect, rojo: float):
+        """Cajas de luces reubicadas en `rect`, o None si hay que recalcular."""
+        entrada = self.entradas.get(tid)
+        if (entrada is None
+                or self.frame - entrada["frame"] >= self.cada
+                or self._se_movio(entrada["rect"], rect)
+                or abs(rojo - entrada["rojo"]) > self.umbral_rojo):
+            self.fallos += 1
+            return None
+
+        self.aciertos += 1
+        x1, y1, x2, y2 = rect
+        w, h = x2 - x1, y2 - y1
+        escala_area = (w * h) / entrada["area_vehiculo"]
+        return [(x1 + int(round(fx1 * w)), y1 + int(round(fy1 * h)),
+                 x1 + int(round(fx2 * w)), y1 + int(round(fy2 * h)),
+                 int(area * escala_area))
+                for fx1, fy1, fx2, fy2, area in entrada["relativas"]]
+
+    def guardar(self, tid: int, rect, rojo: float, boxes):
+        x1, y1, x2, y2 = rect
+        w, h = float(x2 - x1), float(y2 - y1)
+        relativas = [((lx1 - x1) / w, (ly1 - y1) / h,
+                      (lx2 - x1) / w, (ly2 - y1) / h, area)
+                     for lx1, ly1, lx2, ly2, area in boxes]
+        self.entradas[tid] = {
+            "frame": self.frame,
+            "rect": tuple(rect),
+            "rojo": rojo,
+            "area_vehiculo": w * h,
+            "relativas": relativas,
+        }
+
+    def retener(self):
+        """
+        Olvida las entradas con `cada` frames de video o más, que buscar()
+        ya no usaría. Un track que falta en algunos frames (oclusión, baja
+        confianza) conserva sus luces hasta entonces.
+        """
+        for tid, entrada in list(self.entradas.items()):
+            if self.frame - entrada["frame"] >= self.cada:
+                del self.entradas[tid]
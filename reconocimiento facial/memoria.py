@@ -0,0 +1,49 @@
+"""
+Reuso de buffers de frames y medición de memoria.
+
+Sin reuso, cada frame decodificado es un arreglo nuevo (a 2.7K son ~12 MB)
+y dibujar sobre una copia suma otro tanto: decenas de MB pedidos y
+liberados por frame. Con ReservaFrames el decoder escribe sobre buffers ya
+usados (cap.read(buffer)) que vuelven a la reserva cuando el frame se
+terminó de escribir al video. La reserva crece sola hasta la cantidad de
+frames en vuelo (lote, tramo retenido por --stride y colas del pipeline) y
+de ahí en adelante no se pide más memoria.
+"""
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def rss_pico_mb():
+    """Pico de memoria residente del proceso en MB, o None si no se puede medir."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo informa en KB y macOS en bytes
+    return pico / float(1 << 20) if sys.platform == "darwin" else pico / 1024.0
+
+
+class ReservaFrames:
+    """
+    Buffers de frames libres para reusar. list.pop/append son atómicos,
+    así el hilo que decodifica y el que escribe pueden compartirla.
+    """
+
+    def __init__(self):
+        self.libres = []
+        self.creados = 0
+
+    def tomar(self):
+        """Un buffer libre, o None para que cap.read() cree uno nuevo."""
+        try:
+            return self.libres.pop()
+        except IndexError:
+            self.creados += 1
+            return None
+
+    def devolver(self, frame):
+        """El frame ya no se usa: su buffer queda libre para otro."""
+        self.libres.append(frame)
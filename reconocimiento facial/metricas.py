@@ -0,0 +1,186 @@
+"""
+Instrumentación por etapas del procesamiento de video.
+
+Cada etapa (decode, track, color, draw, encode, ...) registra su latencia en
+un histograma de buckets logarítmicos de tamaño fijo, así la memoria no
+depende de la duración del video. Al final se imprime un resumen con
+p50/p95/p99, FPS efectivo, vehículos por frame, profundidad de colas y pico
+de memoria residente (al empezar a procesar, con el modelo ya cargado, y al
+terminar), y opcionalmente se guarda como JSON.
+
+Desactivado, `medir()` devuelve siempre el mismo contexto vacío y el costo
+es despreciable.
+"""
+import json
+import math
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+from memoria import rss_pico_mb
+
+# Buckets de 1 µs a 100 s, 20 por década
+_MIN_S = 1e-6
+_POR_DECADA = 20
+_N_BUCKETS = 8 * _POR_DECADA + 1
+
+_NADA = nullcontext()
+
+
+class Histograma:
+    """Histograma logarítmico con count/sum/min/max exactos."""
+
+    def __init__(self):
+        self.buckets = [0] * _N_BUCKETS
+        self.n = 0
+        self.suma = 0.0
+        self.minimo = math.inf
+        self.maximo = 0.0
+
+    def agregar(self, valor: float):
+        self.n += 1
+        self.suma += valor
+        self.minimo = min(self.minimo, valor)
+        self.maximo = max(self.maximo, valor)
+        if valor <= _MIN_S:
+            i = 0
+        else:
+            i = int(math.log10(valor / _MIN_S) * _POR_DECADA) + 1
+        self.buckets[min(i, _N_BUCKETS - 1)] += 1
+
+    def percentil(self, p: float) -> float:
+        """Percentil aproximado (límite superior del bucket)."""
+        if self.n == 0:
+            return 0.0
+        objetivo = p / 100.0 * self.n
+        acumulado = 0
+        for i, cuenta in enumerate(self.buckets):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                limite = _MIN_S * 10 ** (i / _POR_DECADA)
+                return min(max(limite, self.minimo), self.maximo)
+        return self.maximo
+
+    def resumen(self, factor: float = 1.0) -> dict:
+        if self.n == 0:
+            return {"n": 0}
+        return {
+            "n": self.n,
+            "media": self.suma / self.n * factor,
+            "p50": self.percentil(50) * factor,
+            "p95": self.percentil(95) * factor,
+            "p99": self.percentil(99) * factor,
+            "max": self.maximo * factor,
+        }
+
+
+class Metricas:
+    def __init__(self, activo: bool = False):
+        self.activo = activo
+        self.etapas = {}
+        self.vehiculos = Counter()  # vehículos en el frame -> frames
+        self.colas = {}
+        self.frames = 0
+        self.inicio = time.perf_counter()
+        self.fin = None
+        self.rss_inicio = None
+        self.rss_fin = None
+
+    def _histograma(self, nombre: str) -> Histograma:
+        hist = self.etapas.get(nombre)
+        if hist is None:
+            hist = self.etapas.setdefault(nombre, Histograma())
+        return hist
+
+    def medir(self, nombre: str):
+        """Context manager que registra la duración del bloque en `nombre`."""
+        if not self.activo:
+            return _NADA
+        return self._medir(nombre)
+
+    @contextmanager
+    def _medir(self, nombre: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._histograma(nombre).agregar(time.perf_counter() - t0)
+
+    def registrar(self, nombre: str, segundos: float):
+        if self.activo:
+            self._histograma(nombre).agregar(segundos)
+
+    def frame(self, n_vehiculos: int, colas=None):
+        """
+        Cuenta un frame terminado con sus vehículos y la ocupación de colas
+        (colas: {etapa que consume la cola: items esperando}).
+        """
+        if not self.activo:
+            return
+        self.frames += 1
+        self.vehiculos[n_vehiculos] += 1
+        for nombre, profundidad in (colas or {}).items():
+            c = self.colas.setdefault(nombre, {"suma": 0, "max": 0, "n": 0})
+            c["suma"] += profundidad
+            c["max"] = max(c["max"], profundidad)
+            c["n"] += 1
+
+    def empezar(self):
+        """Marca el inicio del procesamiento (para no contar la carga del modelo)."""
+        self.inicio = time.perf_counter()
+        self.rss_inicio = rss_pico_mb()
+
+    def terminar(self):
+        self.fin = time.perf_counter()
+        self.rss_fin = rss_pico_mb()
+
+    def reporte(self) -> dict:
+        duracion = (self.fin or time.perf_counter()) - self.inicio
+        n = sum(self.vehiculos.values())
+        p95 = 0
+        acumulado = 0
+        for cantidad in sorted(self.vehiculos):
+            acumulado += self.vehiculos[cantidad]
+            if acumulado >= 0.95 * n:
+                p95 = cantidad
+                break
+        return {
+            "frames": self.frames,
+            "segundos": duracion,
+            "fps": self.frames / duracion if duracion > 0 else 0.0,
+            "etapas_ms": {nombre: hist.resumen(1000.0)
+                          for nombre, hist in self.etapas.items()},
+            "vehiculos_por_frame": {
+                "media": sum(k * v for k, v in self.vehiculos.items()) / n if n else 0.0,
+                "p95": p95,
+                "max": max(self.vehiculos, default=0),
+            },
+            "colas": {nombre: {"media": c["suma"] / c["n"], "max": c["max"]}
+                      for nombre, c in self.colas.items()},
+            "rss_pico_mb": {"inicio": self.rss_inicio, "fin": self.rss_fin},
+        }
+
+    def imprimir(self):
+        rep = self.reporte()
+        print("\n" + "=" * 64)
+        print(f"Frames: {rep['frames']}   Tiempo: {rep['segundos']:.1f} s   "
+              f"FPS: {rep['fps']:.2f}")
+        print(f"{'etapa':<10}{'n':>8}{'media':>9}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+        for nombre, r in rep["etapas_ms"].items():
+            if r["n"] == 0:
+                continue
+            print(f"{nombre:<10}{r['n']:>8}{r['media']:>9.2f}{r['p50']:>9.2f}"
+                  f"{r['p95']:>9.2f}{r['p99']:>9.2f}")
+        v = rep["vehiculos_por_frame"]
+        print(f"Vehículos/frame: media {v['media']:.1f}  p95 {v['p95']}  max {v['max']}")
+        for nombre, c in rep["colas"].items():
+            print(f"Cola -> {nombre}: media {c['media']:.1f}  max {c['max']}")
+        rss = rep["rss_pico_mb"]
+        if rss["inicio"] is not None and rss["fin"] is not None:
+            print(f"Pico de RSS: {rss['inicio']:.0f} MB al empezar, "
+                  f"{rss['fin']:.0f} MB al terminar")
+        print("=" * 64)
+
+    def guardar(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.reporte(), f, indent=2, ensure_ascii=False)
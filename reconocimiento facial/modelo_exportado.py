@@ -0,0 +1,334 @@
+"""
+Inferencia con el modelo exportado a un runtime optimizado para CPU.
+
+Con --runtime onnx|openvino los pesos de --model se exportan una sola vez
+(ONNX Runtime u OpenVINO) y el archivo queda al lado de los pesos:
+
+    car.pt -> car.onnx, car_int8.onnx, car_openvino_model/, car_int8_openvino_model/
+
+Junto al exportado se guarda un .json con la huella de los pesos y el tamaño
+de entrada: si los pesos cambian se vuelve a exportar. La exportación es con
+ejes dinámicos, así el letterbox es rectangular igual que con PyTorch y se
+aceptan lotes de cualquier tamaño; el tamaño de entrada es el de
+entrenamiento del modelo. El tracking no cambia: es el mismo model.track()
+de ultralytics sobre otro backend.
+
+Con --int8 se cuantiza con calibración estática sobre frames del propio
+video (ONNX Runtime quantize_static, u NNCF para OpenVINO). Que sea más
+rápido depende de la CPU (instrucciones VNNI/AMX): compararlo con
+
+    python modelo_exportado.py --model car.pt --runtime openvino --int8 --clip muestra.mp4
+
+que exporta si hace falta y compara detecciones y tiempos contra los pesos
+originales sobre los primeros frames del clip.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from ultralytics import YOLO, __version__ as version_ultralytics
+from ultralytics.utils import YAML
+
+from cache_detecciones import huella_archivo
+
+FORMATOS = ("torch", "onnx", "openvino")
+
+
+def ruta_exportada(pesos, formato: str, int8: bool = False) -> Path:
+    """Dónde queda el modelo exportado: al lado de los pesos, con el nombre de ultralytics."""
+    pesos = Path(pesos)
+    sufijo = "_int8" if int8 else ""
+    if formato == "onnx":
+        return pesos.with_name(f"{pesos.stem}{sufijo}.onnx")
+    if formato == "openvino":
+        return pesos.with_name(f"{pesos.stem}{sufijo}_openvino_model")
+    raise ValueError(f"Formato de exportación desconocido: {formato}")
+
+
+def _ruta_info(ruta: Path) -> Path:
+    return ruta.with_name(ruta.name + ".json")
+
+
+def _leer_info(ruta: Path):
+    try:
+        with open(_ruta_info(ruta), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _frames_muestra(video, n: int):
+    """Hasta n frames repartidos a lo largo de todo el video."""
+    cap = cv2.VideoCapture(str(video))
+    if not cap.isOpened():
+        raise RuntimeError(f"No pude abrir: {video}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    elegidos = set(np.linspace(0, max(total - 1, 0), n).astype(int).tolist()) if total > 0 else None
+    frames = []
+    i = 0
+    try:
+        while len(frames) < n and cap.grab():
+            if elegidos is None or i in elegidos:
+                ok, frame = cap.retrieve()
+                if ok:
+                    frames.append(frame)
+            i += 1
+    finally:
+        cap.release()
+    if not frames:
+        raise RuntimeError(f"No hay frames para calibrar en: {video}")
+    return frames
+
+
+def _datos_calibracion(video, names, carpeta: Path, muestras: int) -> Path:
+    """Dataset de ultralytics (solo imágenes, sin etiquetas) con frames del video."""
+    imagenes = carpeta / "calibracion" / "images" / "val"
+    imagenes.mkdir(parents=True)
+    for k, frame in enumerate(_frames_muestra(video, muestras)):
+        cv2.imwrite(str(imagenes / f"{k:06d}.png"), frame)
+    yaml = carpeta / "calibracion" / "data.yaml"
+    YAML.save(yaml, {"path": str(yaml.parent), "train": "images/val",
+                     "val": "images/val", "names": dict(names)})
+    return yaml
+
+
+def exportar(pesos, formato: str, int8: bool = False, calibracion=None,
+             muestras: int = 200, forzar: bool = False) -> Path:
+    """
+    Exporta los pesos a `formato` si no hay un exportado vigente y devuelve
+    su ruta. calibracion: video del que se toman `muestras` frames para int8.
+    Se exporta en una carpeta temporal y se mueve al final, así una
+    exportación cortada nunca deja un modelo a medias con el nombre bueno.
+    """
+    modelo = YOLO(pesos)
+    local = Path(modelo.ckpt_path or pesos)  # ultralytics descarga los pesos por nombre
+    destino = ruta_exportada(local, formato, int8)
+    info = {
+        "pesos": huella_archivo(local),
+        "formato": formato,
+        "int8": bool(int8),
+        "imgsz": int(modelo.overrides.get("imgsz", 640)),
+    }
+    previa = _leer_info(destino)
+    if (not forzar and destino.exists() and previa is not None
+            and all(previa.get(k) == v for k, v in info.items())):
+        return destino
+    if int8 and calibracion is None:
+        raise ValueError("La exportación int8 necesita un video para calibrar")
+
+    print(f"Exportando {local.name} a {formato}{' int8' if int8 else ''}...")
+    with tempfile.TemporaryDirectory(dir=destino.parent, prefix=".export_") as tmp:
+        tmp = Path(tmp)
+        copia = tmp / local.name
+        shutil.copy2(local, copia)
+        opciones = {"format": formato, "imgsz": info["imgsz"], "dynamic": True,
+                    "verbose": False}
+        if int8:
+            opciones["quantize"] = 8
+            opciones["data"] = str(_datos_calibracion(calibracion, modelo.names,
+                                                      tmp, muestras))
+            info["calibracion"] = {"video": Path(str(calibracion)).name,
+                                   "frames": muestras}
+        hecho = Path(YOLO(copia).export(**opciones))
+        if destino.is_dir():
+            shutil.rmtree(destino)
+        elif destino.exists():
+            destino.unlink()
+        os.replace(hecho, destino)
+    info["ultralytics"] = version_ultralytics
+    tmp_info = _ruta_info(destino).with_suffix(".tmp")
+    with open(tmp_info, "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+    os.replace(tmp_info, _ruta_info(destino))
+    print(f"Modelo exportado: {destino}")
+    return destino
+
+
+def cargar_exportado(ruta):
+    """YOLO sobre el modelo exportado, con el tamaño de entrada de la exportación."""
+    ruta = Path(ruta)
+    modelo = YOLO(str(ruta), task="detect")
+    info = _leer_info(ruta)
+    if info is not None:
+        # Sin esto ultralytics usa 640 en los modelos exportados
+        modelo.overrides["imgsz"] = info["imgsz"]
+    return modelo
+
+
+def nombre_runtime(args) -> str:
+    """"torch", "onnx", "openvino-int8", ... (para la clave del cache)."""
+    return f"{args.runtime}-int8" if args.int8 else args.runtime
+
+
+def exportar_desde_args(args, calibracion=None):
+    """Ruta del exportado según --runtime/--int8 (exporta si hace falta), o None con torch."""
+    if args.runtime == "torch":
+        return None
+    return exportar(args.model, args.runtime, args.int8,
+                    calibracion=calibracion, muestras=args.calib_frames)
+
+
+def modelo_desde_args(args, calibracion=None):
+    """Modelo listo para track()/predict() según --model/--runtime/--int8."""
+    ruta = exportar_desde_args(args, calibracion)
+    if ruta is None:
+        return YOLO(args.model)
+    return cargar_exportado(ruta)
+
+
+def argumentos_runtime(ap):
+    """Agrega al parser las opciones del runtime de inferencia."""
+    ap.add_argument("--runtime", choices=FORMATOS, default="torch",
+                    help="Backend de inferencia: torch (pesos tal cual), onnx u "
+                         "openvino (se exporta una vez y se guarda junto a los pesos)")
+    ap.add_argument("--int8", action="store_true",
+                    help="Con --runtime onnx/openvino, usa el modelo cuantizado a int8")
+    ap.add_argument("--calib-frames", type=int, default=200,
+                    help="Frames del video usados para calibrar la cuantización int8")
+
+
+# ----------------------------------------------------------------------
+# Comparación contra los pesos originales
+# ----------------------------------------------------------------------
+
+def _iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Matriz de IoU entre cajas xyxy (n x 4) y (m x 4)."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def _emparejar(ref, otra, umbral: float):
+    """Pares (IoU, dif. de confianza) de cajas de la misma clase, el mejor IoU primero."""
+    if not len(ref[0]) or not len(otra[0]):
+        return []
+    iou = _iou(ref[0], otra[0])
+    iou[ref[2][:, None] != otra[2][None, :]] = 0.0
+    pares = []
+    usadas_a, usadas_b = set(), set()
+    for k in np.argsort(-iou, axis=None):
+        i, j = divmod(int(k), iou.shape[1])
+        if iou[i, j] < umbral:
+            break
+        if i in usadas_a or j in usadas_b:
+            continue
+        usadas_a.add(i)
+        usadas_b.add(j)
+        pares.append((float(iou[i, j]), abs(float(ref[1][i]) - float(otra[1][j]))))
+    return pares
+
+
+def _detectar(modelo, frames, conf: float, clases):
+    """[(cajas, conf, clases), ...] por frame y segundos de inferencia."""
+    modelo.predict(source=frames[0], conf=conf, classes=clases, verbose=False)  # calentamiento
+    salida = []
+    t0 = time.perf_counter()
+    for frame in frames:
+        b = modelo.predict(source=frame, conf=conf, classes=clases, verbose=False)[0].boxes
+        salida.append((b.xyxy.cpu().numpy(), b.conf.cpu().numpy(),
+                       b.cls.cpu().numpy().astype(int)))
+    return salida, time.perf_counter() - t0
+
+
+def comparar_modelos(original, exportado, frames, conf: float = 0.25,
+                     clases=None, umbral_iou: float = 0.5) -> dict:
+    """
+    Corre los dos modelos sobre los mismos frames (detección sola, sin
+    tracker) y empareja sus cajas por IoU dentro de cada clase.
+    """
+    ref, t_ref = _detectar(original, frames, conf, clases)
+    exp, t_exp = _detectar(exportado, frames, conf, clases)
+    pares = [p for a, b in zip(ref, exp) for p in _emparejar(a, b, umbral_iou)]
+    n_ref = sum(len(a[0]) for a in ref)
+    n_exp = sum(len(b[0]) for b in exp)
+    return {
+        "frames": len(frames),
+        "detecciones_original": n_ref,
+        "detecciones_exportado": n_exp,
+        "emparejadas": len(pares),
+        "recall": len(pares) / max(n_ref, 1),
+        "precision": len(pares) / max(n_exp, 1),
+        "iou_medio": float(np.mean([p[0] for p in pares])) if pares else 0.0,
+        "dif_conf_media": float(np.mean([p[1] for p in pares])) if pares else 0.0,
+        "dif_conf_max": max((p[1] for p in pares), default=0.0),
+        "ms_original": 1000.0 * t_ref / len(frames),
+        "ms_exportado": 1000.0 * t_exp / len(frames),
+    }
+
+
+def _leer_clip(video, n: int):
+    cap = cv2.VideoCapture(str(video))
+    if not cap.isOpened():
+        raise RuntimeError(f"No pude abrir: {video}")
+    frames = []
+    try:
+        while len(frames) < n:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append(frame)
+    finally:
+        cap.release()
+    if not frames:
+        raise RuntimeError(f"El clip no tiene frames: {video}")
+    return frames
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Exporta el modelo y lo compara contra los pesos originales")
+    ap.add_argument("--model", default="yolo12n.pt", help="Pesos YOLO originales")
+    ap.add_argument("--runtime", choices=FORMATOS[1:], default="openvino",
+                    help="Formato al que se exporta")
+    ap.add_argument("--int8", action="store_true", help="Cuantiza a int8")
+    ap.add_argument("--clip", required=True,
+                    help="Video de muestra para calibrar y comparar")
+    ap.add_argument("--calib-frames", type=int, default=200,
+                    help="Frames del clip usados para calibrar int8")
+    ap.add_argument("--frames", type=int, default=150,
+                    help="Frames del inicio del clip usados en la comparación")
+    ap.add_argument("--conf", type=float, default=0.25, help="Confianza YOLO")
+    ap.add_argument("--iou", type=float, default=0.5,
+                    help="IoU mínimo para considerar la misma detección")
+    ap.add_argument("--force", action="store_true",
+                    help="Vuelve a exportar aunque ya exista")
+    ap.add_argument("--json", default=None, help="Guarda el resultado en JSON")
+    args = ap.parse_args()
+
+    import pruebavideo as pv  # import tardío: pruebavideo importa este módulo
+
+    ruta = exportar(args.model, args.runtime, args.int8, calibracion=args.clip,
+                    muestras=args.calib_frames, forzar=args.force)
+    frames = _leer_clip(args.clip, args.frames)
+    r = comparar_modelos(YOLO(args.model), cargar_exportado(ruta), frames,
+                         conf=args.conf, clases=pv.VEHICLE_CLASSES,
+                         umbral_iou=args.iou)
+    r["modelo"] = str(ruta)
+
+    print(f"\n{r['frames']} frames de {args.clip}")
+    print(f"{'':<14}{'original':>12}{'exportado':>12}")
+    print(f"{'detecciones':<14}{r['detecciones_original']:>12}{r['detecciones_exportado']:>12}")
+    print(f"{'ms/frame':<14}{r['ms_original']:>12.1f}{r['ms_exportado']:>12.1f}")
+    print(f"Coinciden (IoU >= {args.iou}): {r['recall']:.1%} de las originales, "
+          f"{r['precision']:.1%} de las exportadas")
+    print(f"IoU medio {r['iou_medio']:.3f}, diferencia de confianza "
+          f"media {r['dif_conf_media']:.3f} / máx {r['dif_conf_max']:.3f}")
+    print(f"Velocidad: x{r['ms_original'] / max(r['ms_exportado'], 1e-9):.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(r, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compuerta de movimiento para no correr el detector en frames estáticos.
+
+Con cámara fija hay tramos largos donde nada se mueve. Cada frame se reduce
+a una miniatura en gris (lado largo `lado`) y se compara con la miniatura
+del último frame que sí pasó por YOLO: si la fracción de píxeles que
+cambiaron más de `umbral_pixel` es menor que `umbral`, se reusan las
+detecciones anteriores y el tracker no se actualiza en ese frame.
+
+Se compara contra el último frame inferido (no contra el anterior) para
+que un movimiento lento se acumule y termine disparando la inferencia.
+Igual se fuerza una inferencia cada `cada` frames como máximo.
+"""
+import cv2
+import numpy as np
+
+
+class CompuertaMovimiento:
+    def __init__(self, umbral: float = 0.002, umbral_pixel: int = 15,
+                 cada: int = 10, lado: int = 160):
+        self.umbral = umbral
+        self.umbral_pixel = umbral_pixel
+        self.cada = max(1, cada)
+        self.lado = lado
+        self.referencia = None
+        self.sin_inferir = 0
+        self.ultimas = []  # detecciones del último frame inferido
+        self.frames = 0
+        self.saltados = 0
+
+    def _miniatura(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        f = min(1.0, self.lado / float(max(h, w)))
+        chico = cv2.resize(frame, (max(1, int(w * f)), max(1, int(h * f))),
+                           interpolation=cv2.INTER_AREA)
+        gris = cv2.cvtColor(chico, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gris, (5, 5), 0)
+
+    def cambio(self, mini: np.ndarray) -> float:
+        """Fracción de píxeles de la miniatura que cambiaron contra la referencia."""
+        diff = cv2.absdiff(mini, self.referencia)
+        return np.count_nonzero(diff > self.umbral_pixel) / float(diff.size)
+
+    def hay_que_inferir(self, frame: np.ndarray) -> bool:
+        """True si el frame tiene que pasar por el detector."""
+        self.frames += 1
+        mini = self._miniatura(frame)
+        if (self.referencia is not None
+                and self.sin_inferir + 1 < self.cada
+                and self.cambio(mini) < self.umbral):
+            self.sin_inferir += 1
+            self.saltados += 1
+            return False
+        self.referencia = mini
+        self.sin_inferir = 0
+        return True
+
+    def resumen(self) -> str:
+        frac = self.saltados / max(self.frames, 1)
+        return (f"Compuerta de movimiento: {self.saltados}/{self.frames} "
+                f"frames sin inferencia ({frac:.0%})")
+
+
+def compuerta_desde_args(args):
+    """CompuertaMovimiento según los args de pruebavideo, o None si está apagada."""
+    if args.motion_gate <= 0:
+        return None
+    return CompuertaMovimiento(umbral=args.motion_gate,
+                               umbral_pixel=args.motion_diff,
+                               cada=args.keyframe_every)
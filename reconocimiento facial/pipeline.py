@@ -0,0 +1,132 @@
+"""
+Pipeline por etapas para procesar video con hilos.
+
+Cada etapa corre en su propio hilo y se comunica con la siguiente por una
+cola acotada: si una etapa se atrasa, las anteriores se bloquean al llenar
+su cola (backpressure). Como cada etapa es un solo hilo y las colas son FIFO,
+el orden de los frames se conserva.
+"""
+import queue
+import threading
+
+# Marca de fin de stream que recorre todas las colas
+FIN = object()
+
+
+class PipelineError(RuntimeError):
+    """Error ocurrido dentro de una etapa del pipeline."""
+
+
+def _poner(cola, item, parar):
+    """Pone un item en la cola sin quedarse bloqueado si hay que parar."""
+    while not parar.is_set():
+        try:
+            cola.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _sacar(cola, parar):
+    """Saca un item de la cola; devuelve FIN si hay que parar."""
+    while not parar.is_set():
+        try:
+            return cola.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return FIN
+
+
+class Etapa(threading.Thread):
+    """
+    Hilo que aplica `funcion` a cada item de `entrada` y deja el resultado
+    en `salida`. Si `entrada` es None la etapa es una fuente y `funcion`
+    debe ser un iterable. Si `salida` es None la etapa es un sumidero.
+    `al_terminar` (opcional) se llama al llegar el fin del stream y su
+    resultado sale como un último item (para etapas que retienen datos).
+    """
+
+    def __init__(self, nombre, funcion, entrada, salida, parar, al_terminar=None):
+        super().__init__(name=nombre, daemon=True)
+        self.nombre = nombre
+        self.funcion = funcion
+        self.al_terminar = al_terminar
+        self.entrada = entrada
+        self.salida = salida
+        self.parar = parar
+        self.error = None
+
+    def _items(self):
+        if self.entrada is None:
+            yield from self.funcion
+            return
+        while True:
+            item = _sacar(self.entrada, self.parar)
+            if item is FIN:
+                if self.al_terminar is not None and not self.parar.is_set():
+                    yield self.al_terminar()
+                return
+            yield self.funcion(item)
+
+    def run(self):
+        try:
+            for item in self._items():
+                if self.parar.is_set():
+                    break
+                if self.salida is not None and not _poner(self.salida, item, self.parar):
+                    break
+        except BaseException as exc:  # se re-lanza en el hilo principal
+            self.error = exc
+            self.parar.set()
+        finally:
+            if self.salida is not None:
+                _poner(self.salida, FIN, self.parar)
+
+
+class Pipeline:
+    """
+    Encadena una fuente y varias etapas con colas de tamaño `profundidad`.
+
+    fuente: iterable de items (ej: frames decodificados)
+    etapas: lista de (nombre, funcion) o (nombre, funcion, al_terminar);
+            la última funciona como sumidero
+    """
+
+    def __init__(self, fuente, etapas, profundidad=8):
+        self.parar = threading.Event()
+        self.colas = [queue.Queue(maxsize=max(1, profundidad))
+                      for _ in etapas]
+        self.nombres = [etapa[0] for etapa in etapas]
+        self.hilos = [Etapa("decode", fuente, None, self.colas[0], self.parar)]
+        for i, (nombre, funcion, *al_terminar) in enumerate(etapas):
+            salida = self.colas[i + 1] if i + 1 < len(etapas) else None
+            self.hilos.append(
+                Etapa(nombre, funcion, self.colas[i], salida, self.parar,
+                      *al_terminar))
+
+    def profundidades(self):
+        """Items esperando en la cola de entrada de cada etapa."""
+        return {nombre: c.qsize() for nombre, c in zip(self.nombres, self.colas)}
+
+    def detener(self):
+        self.parar.set()
+
+    def ejecutar(self):
+        """Corre el pipeline hasta el final del stream o hasta un error."""
+        for hilo in self.hilos:
+            hilo.start()
+        try:
+            for hilo in self.hilos:
+                while hilo.is_alive():
+                    hilo.join(timeout=0.2)
+        except KeyboardInterrupt:
+            self.detener()
+            for hilo in self.hilos:
+                hilo.join()
+            raise
+
+        for hilo in self.hilos:
+            if hilo.error is not None:
+                raise PipelineError(
+                    f"Falló la etapa '{hilo.nombre}'") from hilo.error
@@ -1,9 +1,26 @@
 import argparse
-from collections import defaultdict, deque
+from itertools import islice
 
 import cv2
 import numpy as np
-from ultralytics import YOLO
+
+from cache_detecciones import (Detecciones, GrabadorDetecciones,
+                               clave_detecciones, ruta_cache)
+from escritor_video import argumentos_escritor, escritor_desde_args
+from eventos import EscritorEventos
+from intercalado import Tramos, interpolar_vehiculos
+from luces_freno import (CacheLuces, ValidacionLut, estadistica_roja,
+                         find_stop_light_boxes, find_stop_light_boxes_frame,
+                         zona_inferior)
+from memoria import ReservaFrames, rss_pico_mb
+from metricas import Metricas
+from modelo_exportado import (argumentos_runtime, exportar_desde_args,
+                              modelo_desde_args, nombre_runtime)
+from movimiento import compuerta_desde_args
+from pipeline import Pipeline
+from recorte import argumentos_recorte, rango_frames, region_desde_args
+from registro_tracks import RegistroTracks
+from segmentos import procesar_por_segmentos
 
 # COCO ids:
 # person=0, bicycle=1, car=2, motorcycle=3, bus=5, truck=7
@@ -21,115 +38,378 @@ FONT_SCALE_STOP = 0.9
 TEXT_THICK = 4
 
 
-def red_mask_hsv(bgr: np.ndarray, s_min: int, v_min: int) -> np.ndarray:
-    """Máscara de rojo en HSV (rojo se parte en dos rangos)."""
-    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
-
-    lower1 = np.array([0,   s_min, v_min], dtype=np.uint8)
-    upper1 = np.array([10,  255,   255], dtype=np.uint8)
-    lower2 = np.array([170, s_min, v_min], dtype=np.uint8)
-    upper2 = np.array([180, 255,   255], dtype=np.uint8)
-
-    m1 = cv2.inRange(hsv, lower1, upper1)
-    m2 = cv2.inRange(hsv, lower2, upper2)
-    mask = cv2.bitwise_or(m1, m2)
-
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
-    return mask
-
-
-def find_stop_light_boxes(vehicle_roi: np.ndarray,
-                          x0: int, y0: int,
-                          bottom_frac: float,
-                          s_min: int, v_min: int,
-                          min_area: int,
-                          max_area_frac: float,
-                          min_solidity: float):
-    """Busca blobs rojos en el % inferior del vehículo."""
-    h, w = vehicle_roi.shape[:2]
-    if h < 8 or w < 8:
-        return [], None
-
-    y_start = int(h * (1.0 - bottom_frac))
-    roi = vehicle_roi[y_start:h, 0:w]
-    if roi.size == 0:
-        return [], None
-
-    mask = red_mask_hsv(roi, s_min=s_min, v_min=v_min)
-
-    contours, _ = cv2.findContours(
-        mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    max_area = int(roi.shape[0] * roi.shape[1] * max_area_frac)
-
-    boxes = []
-    for cnt in contours:
-        area = float(cv2.contourArea(cnt))
-        if area < min_area or area > max_area:
+def leer_frames(cap, metricas=None, reserva=None):
+    """
+    Generador de frames decodificados hasta el final del video.
+    Con `reserva` (ReservaFrames) se decodifica sobre buffers reusados.
+    """
+    if metricas is None:
+        metricas = Metricas()
+    while True:
+        with metricas.medir("decode"):
+            ok, frame = cap.read(reserva.tomar() if reserva is not None else None)
+        if not ok:
+            return
+        yield frame
+
+
+def agrupar(items, n: int):
+    """Agrupa un iterable en listas de hasta n elementos."""
+    lote = []
+    for item in items:
+        lote.append(item)
+        if len(lote) >= n:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def escala_inferencia(W: int, H: int, lado_largo: int = 0, escala: float = 1.0) -> float:
+    """Factor (<= 1) para reducir el frame antes de la inferencia."""
+    if lado_largo > 0:
+        escala = min(escala, lado_largo / float(max(W, H)))
+    return min(max(escala, 1e-3), 1.0)
+
+
+def redimensionar(frame: np.ndarray, escala: float) -> np.ndarray:
+    """Copia reducida del frame (INTER_AREA evita aliasing al achicar)."""
+    if escala == 1.0:
+        return frame
+    h, w = frame.shape[:2]
+    size = (max(1, int(round(w * escala))), max(1, int(round(h * escala))))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def detecciones_de_resultado(r, W: int, H: int, escala: float = 1.0):
+    """
+    Convierte el resultado de model.track() en tuplas
+    (x1, y1, x2, y2, tid, conf, cls_id) ya recortadas al frame.
+    Si la inferencia se hizo sobre un frame reducido por `escala`, las cajas
+    se devuelven en coordenadas del frame original (W x H).
+    """
+    if r.boxes is None or r.boxes.id is None:
+        return []
+
+    boxes_xyxy = r.boxes.xyxy.cpu().numpy()
+    if escala != 1.0:
+        boxes_xyxy = boxes_xyxy / escala
+    boxes_xyxy = boxes_xyxy.astype(int)
+    ids = r.boxes.id.cpu().numpy().astype(int)
+    confs = r.boxes.conf.cpu().numpy()
+    clss = r.boxes.cls.cpu().numpy().astype(int)  # <- CLASES
+
+    dets = []
+    for (x1, y1, x2, y2), tid, cf, cls_id in zip(boxes_xyxy, ids, confs, clss):
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(W - 1, x2), min(H - 1, y2)
+        if x2 <= x1 or y2 <= y1:
             continue
-
-        hull = cv2.convexHull(cnt)
-        hull_area = float(cv2.contourArea(hull)) if hull is not None else 0.0
-        if hull_area > 0:
-            solidity = area / hull_area
-            if solidity < min_solidity:
+        dets.append((int(x1), int(y1), int(x2), int(y2),
+                     int(tid), float(cf), int(cls_id)))
+    return dets
+
+
+def rastrear_lote(model, lote, args, W: int, H: int, escala: float = 1.0,
+                  compuerta=None, region=None):
+    """
+    Corre model.track() sobre un lote de frames y devuelve las detecciones
+    de cada uno. Con una lista de frames YOLO hace una sola inferencia para
+    todo el lote y luego actualiza el tracker frame por frame, en orden.
+    Con `compuerta` (CompuertaMovimiento) solo pasan por YOLO los frames con
+    movimiento; los demás repiten las detecciones del último inferido.
+    Con `region` (RegionInteres) todo lo anterior se hace sobre el recorte
+    del polígono y se devuelven solo las detecciones dentro de él, en
+    coordenadas del frame; `escala` es entonces relativa al recorte.
+    """
+    if region is not None:
+        ancho, alto = region.tamano
+        recortes = [region.recortar(frame) for frame in lote]
+        return [region.al_frame(dets) for dets in
+                rastrear_lote(model, recortes, args, ancho, alto, escala, compuerta)]
+
+    if compuerta is not None:
+        inferir = [compuerta.hay_que_inferir(frame) for frame in lote]
+        elegidos = [frame for frame, si in zip(lote, inferir) if si]
+        nuevas = iter(rastrear_lote(model, elegidos, args, W, H, escala)
+                      if elegidos else [])
+        salida = []
+        for si in inferir:
+            if si:
+                compuerta.ultimas = next(nuevas)
+            salida.append(compuerta.ultimas)
+        return salida
+
+    entrada = [redimensionar(frame, escala) for frame in lote]
+    results = model.track(
+        source=entrada if len(entrada) > 1 else entrada[0],
+        conf=args.conf,
+        classes=VEHICLE_CLASSES,
+        tracker=args.tracker,
+        persist=True,
+        verbose=False,
+        batch=len(lote)
+    )
+    return [detecciones_de_resultado(r, W, H, escala) for r in results]
+
+
+def analizar_vehiculos(frame: np.ndarray, dets, args, cache=None, escala=1.0,
+                       validacion=None):
+    """
+    Etapa de color: busca luces de freno en cada vehículo.
+    Devuelve [(det, light_boxes), ...] y la máscara del último vehículo.
+    Con `cache` (CacheLuces) solo se recalculan los tracks que lo necesitan.
+    Con `escala` < 1 el análisis se hace sobre una copia reducida del frame
+    y las luces se devuelven en coordenadas del frame original.
+    Con `validacion` (ValidacionLut) se compara la tabla BGR contra HSV en
+    cada zona analizada.
+    """
+    rects = [det[:4] for det in dets]
+    min_area = args.min_area
+    if escala != 1.0:
+        frame = redimensionar(frame, escala)
+        h, w = frame.shape[:2]
+        rects = [(int(x1 * escala), int(y1 * escala),
+                  min(w - 1, int(round(x2 * escala))),
+                  min(h - 1, int(round(y2 * escala))))
+                 for x1, y1, x2, y2 in rects]
+        min_area = args.min_area * escala * escala
+
+    params = dict(
+        bottom_frac=args.bottom_frac,
+        s_min=args.s_min,
+        v_min=args.v_min,
+        min_area=min_area,
+        max_area_frac=args.max_area_frac,
+        min_solidity=args.min_solidity,
+        lut=args.red_lut
+    )
+
+    resultados = [([], None)] * len(dets)
+    rojos = {}
+    pendientes = []
+    if cache is not None:
+        cache.nuevo_frame()
+    for i, det in enumerate(dets):
+        if cache is not None:
+            zona = zona_inferior(*rects[i], args.bottom_frac)
+            if zona is None:
                 continue
+            rojos[i] = estadistica_roja(frame, zona)
+            boxes = cache.buscar(det[4], rects[i], rojos[i])
+            if boxes is not None:
+                resultados[i] = (boxes, None)
+                continue
+        pendientes.append(i)
+
+    if validacion is not None:
+        for i in pendientes:
+            zona = zona_inferior(*rects[i], args.bottom_frac)
+            if zona is not None:
+                zx1, zy1, zx2, zy2 = zona
+                validacion.agregar(frame[zy1:zy2, zx1:zx2])
+
+    if args.mask_engine == "frame":
+        calculados = find_stop_light_boxes_frame(
+            frame, [rects[i] for i in pendientes], **params)
+    else:
+        calculados = []
+        for i in pendientes:
+            x1, y1, x2, y2 = rects[i]
+            vehicle_roi = frame[y1:y2, x1:x2]
+            calculados.append(find_stop_light_boxes(
+                vehicle_roi=vehicle_roi, x0=x1, y0=y1, **params))
+
+    for i, resultado in zip(pendientes, calculados):
+        resultados[i] = resultado
+        if cache is not None:
+            cache.guardar(dets[i][4], rects[i], rojos[i], resultado[0])
+    if cache is not None:
+        cache.retener()
+
+    vehiculos = [(det, light_boxes)
+                 for det, (light_boxes, _mask) in zip(dets, resultados)]
+    if escala != 1.0:
+        vehiculos = [(det, [(int(round(lx1 / escala)), int(round(ly1 / escala)),
+                             int(round(lx2 / escala)), int(round(ly2 / escala)),
+                             int(round(area / (escala * escala))))
+                            for lx1, ly1, lx2, ly2, area in light_boxes])
+                     for det, light_boxes in vehiculos]
+    last_mask = resultados[-1][1] if resultados else None
+    return vehiculos, last_mask
+
+
+def dibujar_anotaciones(out: np.ndarray, vehiculos, names, trails=None):
+    """
+    Dibuja cajas de vehículos, luces de freno y trails sobre `out`.
+    trails: RegistroTracks o None.
+    """
+    for (x1, y1, x2, y2, tid, cf, cls_id), light_boxes in vehiculos:
+        cls_name = names.get(int(cls_id), str(int(cls_id)))  # <- nombre
+
+        # BBox vehículo + etiqueta con clase
+        cv2.rectangle(out, (x1, y1), (x2, y2),
+                      (255, 255, 255), VEH_THICK)
+        cv2.putText(out, f"{cls_name} ID {tid}  {cf:.2f}", (x1, max(0, y1 - 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE_VEH, (255, 255, 255), TEXT_THICK)
+
+        for lx1, ly1, lx2, ly2, _area in light_boxes:
+            cv2.rectangle(out, (lx1, ly1), (lx2, ly2),
+                          (0, 255, 0), STOP_THICK)
+            cv2.putText(out, "STOP", (lx1, max(0, ly1 - 10)),
+                        cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE_STOP, (0, 255, 0), TEXT_THICK)
+
+    if trails is not None:
+        trails.dibujar(out, (255, 0, 255), TRAIL_THICK)
+    return out
+
+
+def argumentos_luces(ap):
+    """Agrega al parser los parámetros de la etapa de color (luces de freno)."""
+    ap.add_argument("--bottom-frac", type=float, default=0.45,
+                    help="Zona inferior del coche a analizar (día: 0.40-0.55)")
 
-        x, y, bw, bh = cv2.boundingRect(cnt)
-        if bw <= 0 or bh <= 0:
-            continue
-
-        aspect = bw / float(bh)
-        if aspect < 0.3 or aspect > 10.0:
-            continue
+    ap.add_argument("--s-min", type=int, default=85,
+                    help="S mínimo (día típico 70-120)")
+    ap.add_argument("--v-min", type=int, default=70,
+                    help="V mínimo (día típico 60-110)")
 
-        gx1 = x0 + x
-        gy1 = y0 + y_start + y
-        gx2 = gx1 + bw
-        gy2 = gy1 + bh
-        boxes.append((gx1, gy1, gx2, gy2, int(area)))
+    ap.add_argument("--min-area", type=int, default=60,
+                    help="Área mínima blob")
+    ap.add_argument("--max-area-frac", type=float, default=0.08,
+                    help="Área máxima relativa por blob")
+    ap.add_argument("--min-solidity", type=float, default=0.35,
+                    help="Solidity mínima (0.25-0.60)")
 
-    return boxes, mask
+    ap.add_argument("--mask-engine", choices=["roi", "frame"], default="roi",
+                    help="roi: HSV por vehículo; frame: HSV una vez por frame")
+    ap.add_argument("--red-lut", action="store_true",
+                    help="Clasifica el rojo con una tabla BGR precalculada en vez de HSV")
 
 
-def main():
+def construir_parser():
     ap = argparse.ArgumentParser()
     ap.add_argument("--input", required=True, help="Video de entrada .mp4")
     ap.add_argument("--output", default="out_cars_stop.mp4",
                     help="Video de salida .mp4")
+    argumentos_recorte(ap)
     ap.add_argument("--model", default="yolo12n.pt",
                     help="Modelo YOLO (ej: yolo12n.pt)")
     ap.add_argument("--tracker", default="bytetrack.yaml",
                     help="bytetrack.yaml o botsort.yaml")
+    argumentos_runtime(ap)
     ap.add_argument("--conf", type=float, default=0.25, help="Confianza YOLO")
     ap.add_argument("--trail", type=int, default=0,
                     help="Longitud del trail (0 desactiva)")
-    ap.add_argument("--bottom-frac", type=float, default=0.45,
-                    help="Zona inferior del coche a analizar (día: 0.40-0.55)")
-
-    ap.add_argument("--s-min", type=int, default=85,
-                    help="S mínimo (día típico 70-120)")
-    ap.add_argument("--v-min", type=int, default=70,
-                    help="V mínimo (día típico 60-110)")
-
-    ap.add_argument("--min-area", type=int, default=60,
-                    help="Área mínima blob")
-    ap.add_argument("--max-area-frac", type=float, default=0.08,
-                    help="Área máxima relativa por blob")
-    ap.add_argument("--min-solidity", type=float, default=0.35,
-                    help="Solidity mínima (0.25-0.60)")
+    ap.add_argument("--track-ttl", type=int, default=150,
+                    help="Frames sin ver un track antes de olvidarlo (0 = nunca)")
+    ap.add_argument("--max-tracks", type=int, default=1000,
+                    help="Máximo de tracks vivos en memoria (0 = sin límite)")
+
+    argumentos_luces(ap)
+    ap.add_argument("--validate-lut", action="store_true",
+                    help="Compara la tabla BGR contra HSV e informa los desacuerdos")
+    ap.add_argument("--light-cache", type=int, default=0,
+                    help="Reusa las luces de cada track hasta K frames de video, "
+                         "también con --stride (0 desactiva)")
+    ap.add_argument("--cache-move", type=float, default=0.1,
+                    help="Movimiento relativo de la caja que invalida el cache")
+    ap.add_argument("--cache-red", type=float, default=6.0,
+                    help="Cambio de rojo medio que invalida el cache")
 
     ap.add_argument("--show", action="store_true",
                     help="Muestra ventana en vivo")
     ap.add_argument("--show-mask", action="store_true",
                     help="Muestra máscara del último vehículo (debug)")
-    args = ap.parse_args()
-
-    model = YOLO(args.model)
-    # <- aquí están los nombres: {2:'car', 3:'motorcycle', ...}
-    names = model.names
 
+    ap.add_argument("--pipeline", action="store_true",
+                    help="Decode/tracking/anotación/encode en hilos separados")
+    ap.add_argument("--queue-size", type=int, default=8,
+                    help="Frames máximos en cada cola del pipeline")
+    ap.add_argument("--batch", type=int, default=1,
+                    help="Frames por llamada de inferencia (videos offline)")
+    ap.add_argument("--infer-long-side", type=int, default=0,
+                    help="Reduce el frame a este lado largo antes de YOLO (0 = original)")
+    ap.add_argument("--infer-scale", type=float, default=1.0,
+                    help="Factor de reducción del frame antes de YOLO")
+    ap.add_argument("--color-scale", type=float, default=1.0,
+                    help="Factor de reducción para el análisis de color")
+    ap.add_argument("--zero-copy", action="store_true",
+                    help="Reusa los buffers de los frames y dibuja directo sobre el "
+                         "frame decodificado (sin copia por frame)")
+    ap.add_argument("--stride", type=int, default=1,
+                    help="Tracking y color solo cada N frames; en el medio se "
+                         "interpolan las cajas (1 = todos los frames)")
+    ap.add_argument("--motion-gate", type=float, default=0.0,
+                    help="Fracción de píxeles cambiados por debajo de la cual se "
+                         "reusan las detecciones sin correr YOLO (0 desactiva; ej: 0.002)")
+    ap.add_argument("--motion-diff", type=int, default=15,
+                    help="Diferencia de gris para contar un píxel como cambiado")
+    ap.add_argument("--keyframe-every", type=int, default=10,
+                    help="Con --motion-gate, inferencia completa al menos cada N frames")
+
+    argumentos_escritor(ap)
+
+    ap.add_argument("--events", default=None,
+                    help="Guarda eventos por frame/track (.jsonl o .parquet)")
+    ap.add_argument("--events-chunk", type=int, default=1000,
+                    help="Filas por bloque escrito a disco")
+    ap.add_argument("--analytics-only", action="store_true",
+                    help="Solo eventos: no dibuja ni codifica video")
+
+    ap.add_argument("--det-cache", default=None,
+                    help="Directorio del cache de detecciones: si ya hay uno para "
+                         "este video/modelo/tracker/conf se usa en vez de YOLO")
+    ap.add_argument("--replay", action="store_true",
+                    help="Solo etapa de color desde el cache (error si no existe)")
+
+    ap.add_argument("--segments", type=int, default=0,
+                    help="Parte el video en N segmentos procesados en paralelo")
+    ap.add_argument("--overlap", type=int, default=30,
+                    help="Frames de solape entre segmentos para unir los IDs")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="Procesos para --segments (0 = uno por segmento)")
+
+    ap.add_argument("--profile", action="store_true",
+                    help="Mide latencia por etapa e imprime un resumen al final")
+    ap.add_argument("--metrics", default=None,
+                    help="Guarda el reporte de métricas en JSON (implica --profile)")
+    return ap
+
+
+def validar_args(args):
+    """ValueError con el mensaje para el usuario si las opciones no se combinan."""
+    if args.pipeline and args.show:
+        raise ValueError("--show no está disponible con --pipeline")
+    if args.batch < 1:
+        raise ValueError("--batch debe ser al menos 1")
+    if not 0 < args.infer_scale <= 1 or not 0 < args.color_scale <= 1:
+        raise ValueError("--infer-scale y --color-scale deben estar en (0, 1]")
+    if args.analytics_only and not args.events:
+        raise ValueError("--analytics-only requiere --events")
+    if args.analytics_only and args.show:
+        raise ValueError("--show no está disponible con --analytics-only")
+    if args.replay and not args.det_cache:
+        raise ValueError("--replay requiere --det-cache")
+    if args.stride < 1:
+        raise ValueError("--stride debe ser al menos 1")
+    if args.stride > 1 and args.det_cache:
+        raise ValueError("--stride no se combina con --det-cache (el cache guarda todos los frames)")
+    if args.int8 and args.runtime == "torch":
+        raise ValueError("--int8 requiere --runtime onnx u openvino")
+    if args.segments > 1 and (args.show or args.pipeline or args.profile or args.metrics
+                              or args.det_cache or args.stride > 1
+                              or args.validate_lut or args.zero_copy):
+        raise ValueError("--segments no se combina con --show/--pipeline/--profile/"
+                         "--metrics/--det-cache/--stride/--validate-lut/--zero-copy")
+
+
+def abrir_entrada(args):
+    """
+    Abre el video y resuelve --start/--end/--roi.
+    Devuelve (cap, fps, W, H, inicio, fin, region) con el video ya en el
+    primer frame del rango; ValueError si el rango o la región no sirven.
+    """
     cap = cv2.VideoCapture(args.input)
     if not cap.isOpened():
         raise RuntimeError(f"No pude abrir: {args.input}")
@@ -137,98 +417,232 @@ def main():
     fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
     W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    try:
+        inicio, fin = rango_frames(args.start, args.end, fps,
+                                   int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        region = region_desde_args(args, W, H)
+    except ValueError:
+        cap.release()
+        raise
+    if inicio > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, inicio)
+    return cap, fps, W, H, inicio, fin, region
+
+
+def procesar(args, entrada, model=None, progreso=None):
+    """
+    Procesa el video abierto por abrir_entrada().
+    model: YOLO ya cargado para reusar; si es None se carga según --model.
+    progreso: se llama con la cantidad de frames terminados después de
+    escribir cada uno; si lanza una excepción el procesamiento se corta.
+    """
+    cap, fps, W, H, inicio, fin, region = entrada
+    metricas = Metricas(activo=args.profile or bool(args.metrics))
+    ancho_inf, alto_inf = region.tamano if region is not None else (W, H)
+    escala = escala_inferencia(ancho_inf, alto_inf, args.infer_long_side, args.infer_scale)
+    compuerta = compuerta_desde_args(args)
+
+    detecciones = None  # tracking reproducido desde el cache
+    grabador = None
+    if args.det_cache:
+        clave = clave_detecciones(args.input, args.model, args.tracker,
+                                  args.conf, VEHICLE_CLASSES, escala, compuerta,
+                                  (inicio, fin), region, nombre_runtime(args))
+        ruta = ruta_cache(args.det_cache, clave)
+        if ruta.exists():
+            detecciones = Detecciones(ruta)
+            print(f"Detecciones desde cache: {ruta}")
+        elif args.replay:
+            cap.release()
+            raise RuntimeError(f"No hay cache de detecciones para este video/modelo: {ruta}")
+
+    if detecciones is not None:
+        model = None
+        names = detecciones.names
+    else:
+        if model is None:
+            model = modelo_desde_args(args, calibracion=args.input)
+        # <- aquí están los nombres: {2:'car', 3:'motorcycle', ...}
+        names = model.names
+        if args.det_cache:
+            grabador = GrabadorDetecciones(ruta, clave, names)
+
+    writer = None
+    if not args.analytics_only:
+        writer = escritor_desde_args(args, args.output, fps, (W, H))
+    eventos = None
+    if args.events:
+        eventos = EscritorEventos(args.events, fps, names,
+                                  chunk=args.events_chunk, inicio=inicio)
+
+    trails = RegistroTracks(args.trail, ttl=args.track_ttl,
+                            max_tracks=args.max_tracks)
+    cache = None
+    if args.light_cache > 0:
+        cache = CacheLuces(cada=args.light_cache, umbral_mov=args.cache_move,
+                           umbral_rojo=args.cache_red, paso=args.stride)
+    validacion = ValidacionLut(args.s_min, args.v_min) if args.validate_lut else None
+
+    cacheadas = iter(detecciones) if detecciones is not None else None
+    tramos = Tramos(args.stride)
+    reserva = ReservaFrames() if args.zero_copy else None
+
+    def rastrear(lote):
+        """lote: lista de tramos; solo el primer frame de cada uno se rastrea."""
+        claves = [tramo[0] for tramo in lote]
+        with metricas.medir("track"):
+            if cacheadas is not None:
+                dets = [next(cacheadas, []) for _ in claves]
+            else:
+                dets = rastrear_lote(model, claves, args, W, H, escala,
+                                     compuerta, region)
+                if grabador is not None:
+                    for d in dets:
+                        grabador.agregar(d)
+        return tramos.agregar(list(zip(lote, dets)))
+
+    def anotar(item):
+        """Anota todos los frames de un tramo; devuelve una lista por frame."""
+        frames, dets, dets_siguientes = item
+        with metricas.medir("color"):
+            vehiculos, last_mask = analizar_vehiculos(
+                frames[0], dets, args, cache, escala=args.color_scale,
+                validacion=validacion)
+        salida = [anotar_frame(frames[0], vehiculos, last_mask)]
+        for j, frame in enumerate(frames[1:], 1):
+            intermedios = interpolar_vehiculos(vehiculos, dets_siguientes,
+                                               j / float(args.stride))
+            salida.append(anotar_frame(frame, intermedios, None))
+        return salida
+
+    def anotar_frame(frame, vehiculos, last_mask):
+        if args.trail > 0:
+            trails.actualizar(vehiculos)
+        out = None
+        if writer is not None:
+            with metricas.medir("draw"):
+                # El color de este frame ya se analizó: se puede dibujar encima
+                out = frame if reserva is not None else frame.copy()
+                dibujar_anotaciones(out, vehiculos, names,
+                                    trails if args.trail > 0 else None)
+                if region is not None:
+                    region.dibujar(out)
+        elif reserva is not None:
+            reserva.devolver(frame)
+        return out, last_mask, vehiculos
+
+    pipeline = None
+    hechos = 0
+
+    def escribir(item):
+        nonlocal hechos
+        out, _last_mask, vehiculos = item
+        if eventos is not None:
+            with metricas.medir("events"):
+                eventos.agregar(vehiculos)
+        if writer is not None:
+            with metricas.medir("encode"):
+                writer.write(out)
+            if reserva is not None:
+                reserva.devolver(out)
+        metricas.frame(len(vehiculos),
+                       pipeline.profundidades() if pipeline is not None else None)
+        hechos += 1
+        if progreso is not None:
+            progreso(hechos)
+
+    completo = False
+    try:
+        metricas.empezar()
+        frames = leer_frames(cap, metricas, reserva)
+        if fin is not None:
+            frames = islice(frames, fin - inicio)
+        lotes = agrupar(agrupar(frames, args.stride), args.batch)
+        if args.pipeline:
+            pipeline = Pipeline(lotes, [
+                ("track", rastrear, tramos.terminar),
+                ("anotar", lambda lote: [x for item in lote for x in anotar(item)]),
+                ("encode", lambda lote: [escribir(x) for x in lote]),
+            ], profundidad=args.queue_size)
+            pipeline.ejecutar()
+            completo = True
+        else:
+            def rastreados():
+                for lote in lotes:
+                    yield from rastrear(lote)
+                yield from tramos.terminar()
+
+            anotados = (x for item in rastreados() for x in anotar(item))
+            for out, last_mask, vehiculos in anotados:
+                escribir((out, last_mask, vehiculos))
+
+                if args.show:
+                    cv2.imshow("Cars + Stop Lights", out)
+                    if args.show_mask and last_mask is not None:
+                        cv2.imshow("Red mask (vehicle bottom ROI)", last_mask)
+                    key = cv2.waitKey(1) & 0xFF
+                    if key in (27, ord("q")):
+                        break
+            else:
+                completo = True
+        # Solo se guarda el cache de un video recorrido completo
+        if grabador is not None and completo:
+            grabador.cerrar()
+            print(f"Detecciones guardadas: {grabador.path}")
+    finally:
+        cap.release()
+        # Si ffmpeg falla al cerrar, los eventos pendientes igual se escriben
+        try:
+            if writer is not None:
+                writer.release()
+        finally:
+            if eventos is not None:
+                eventos.cerrar()
+            if args.show:
+                cv2.destroyAllWindows()
+    metricas.terminar()
+    if metricas.activo:
+        metricas.imprimir()
+    if args.metrics:
+        metricas.guardar(args.metrics)
+    if reserva is not None:
+        pico = rss_pico_mb()
+        print(f"Buffers de frame: {reserva.creados}"
+              + (f", pico de RSS {pico:.0f} MB" if pico is not None else ""))
+    if cache is not None:
+        total = max(cache.aciertos + cache.fallos, 1)
+        print(f"Cache de luces: {cache.aciertos}/{total} análisis evitados"
+              + (f" (solo keyframes, 1 de cada {args.stride} frames)"
+                 if args.stride > 1 else ""))
+    if validacion is not None:
+        print(validacion.resumen())
+    if compuerta is not None and detecciones is None:
+        print(compuerta.resumen())
+    if eventos is not None:
+        print(f"Eventos: {eventos.total} registros en {args.events}")
+    if writer is not None:
+        print(f"Listo: {args.output}")
 
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    writer = cv2.VideoWriter(args.output, fourcc, fps, (W, H))
-
-    trails = defaultdict(lambda: deque(maxlen=max(args.trail, 1)))
-    last_mask = None
 
-    while True:
-        ok, frame = cap.read()
-        if not ok:
-            break
-
-        results = model.track(
-            source=frame,
-            conf=args.conf,
-            classes=VEHICLE_CLASSES,
-            tracker=args.tracker,
-            persist=True,
-            verbose=False
-        )
-
-        out = frame.copy()
-
-        r = results[0]
-        if r.boxes is not None and r.boxes.id is not None:
-            boxes_xyxy = r.boxes.xyxy.cpu().numpy().astype(int)
-            ids = r.boxes.id.cpu().numpy().astype(int)
-            confs = r.boxes.conf.cpu().numpy()
-            clss = r.boxes.cls.cpu().numpy().astype(int)  # <- CLASES
-
-            for (x1, y1, x2, y2), tid, cf, cls_id in zip(boxes_xyxy, ids, confs, clss):
-                x1, y1 = max(0, x1), max(0, y1)
-                x2, y2 = min(W - 1, x2), min(H - 1, y2)
-                if x2 <= x1 or y2 <= y1:
-                    continue
-
-                cls_name = names.get(
-                    int(cls_id), str(int(cls_id)))  # <- nombre
-
-                if args.trail > 0:
-                    cx = int((x1 + x2) / 2)
-                    cy = int((y1 + y2) / 2)
-                    trails[tid].append((cx, cy))
-
-                vehicle_roi = frame[y1:y2, x1:x2]
-
-                light_boxes, mask = find_stop_light_boxes(
-                    vehicle_roi=vehicle_roi,
-                    x0=x1, y0=y1,
-                    bottom_frac=args.bottom_frac,
-                    s_min=args.s_min,
-                    v_min=args.v_min,
-                    min_area=args.min_area,
-                    max_area_frac=args.max_area_frac,
-                    min_solidity=args.min_solidity
-                )
-                last_mask = mask
-
-                # BBox vehículo + etiqueta con clase
-                cv2.rectangle(out, (x1, y1), (x2, y2),
-                              (255, 255, 255), VEH_THICK)
-                cv2.putText(out, f"{cls_name} ID {tid}  {cf:.2f}", (x1, max(0, y1 - 10)),
-                            cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE_VEH, (255, 255, 255), TEXT_THICK)
-
-                for lx1, ly1, lx2, ly2, _area in light_boxes:
-                    cv2.rectangle(out, (lx1, ly1), (lx2, ly2),
-                                  (0, 255, 0), STOP_THICK)
-                    cv2.putText(out, "STOP", (lx1, max(0, ly1 - 10)),
-                                cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE_STOP, (0, 255, 0), TEXT_THICK)
-
-        if args.trail > 0:
-            for tid, pts in trails.items():
-                if len(pts) < 2:
-                    continue
-                for i in range(1, len(pts)):
-                    cv2.line(out, pts[i - 1], pts[i],
-                             (255, 0, 255), TRAIL_THICK)
-        writer.write(out)
-
-        if args.show:
-            cv2.imshow("Cars + Stop Lights", out)
-            if args.show_mask and last_mask is not None:
-                cv2.imshow("Red mask (vehicle bottom ROI)", last_mask)
-            key = cv2.waitKey(1) & 0xFF
-            if key in (27, ord("q")):
-                break
-
-    cap.release()
-    writer.release()
-    if args.show:
-        cv2.destroyAllWindows()
-    print(f"Listo: {args.output}")
+def main():
+    ap = construir_parser()
+    args = ap.parse_args()
+    try:
+        validar_args(args)
+    except ValueError as exc:
+        ap.error(str(exc))
+
+    if args.segments > 1:
+        # Se exporta una sola vez antes de lanzar los procesos
+        exportar_desde_args(args, calibracion=args.input)
+        procesar_por_segmentos(args)
+        return
+
+    try:
+        entrada = abrir_entrada(args)
+    except ValueError as exc:
+        ap.error(str(exc))
+    procesar(args, entrada)
 
 
 if __name__ == "__main__":
@@ -1,16 +1,5 @@
-import cv2
+from detector_cascada import ejecutar
 
-face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
-cap = cv2.VideoCapture(0)
-
-while True:
-    _, img = cap.read()
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-    for (x, y, w, h) in faces:
-        cv2.rectangle(img, (x, y), (x+w, y+h), (255, 0, 0), 2)
-        cv2.imshow('img', img)
-    k = cv2.waitKey(30)
-    if k == 27:
-        break
-cap.release()
+if __name__ == "__main__":
+    ejecutar("haarcascade_frontalface_default.xml", camara=0,
+             descripcion="Detección de caras en vivo (Haar)")
@@ -0,0 +1,130 @@
+"""
+Recorte temporal y espacial del procesamiento.
+
+- Rango de tiempo (--start / --end): se salta directo al primer frame con
+  un seek del decoder en vez de decodificar desde el frame 0, y se corta
+  al llegar al final del rango.
+- Región de interés (--roi): polígono (carriles que interesan) en
+  coordenadas del frame. La inferencia se hace solo sobre el rectángulo
+  que lo contiene, y los vehículos cuyo punto de apoyo (centro del borde
+  inferior de la caja) cae fuera del polígono se descartan antes de la
+  etapa de color.
+"""
+import argparse
+import math
+
+import cv2
+import numpy as np
+
+
+def _numero(texto: str, que: str) -> float:
+    """float finito de `texto`; ValueError en castellano que nombra `que`."""
+    try:
+        valor = float(texto)
+    except ValueError:
+        raise ValueError(f"{que}: '{texto}' no es un número") from None
+    if not math.isfinite(valor):
+        raise ValueError(f"{que}: '{texto}' no es un número finito")
+    return valor
+
+
+def parsear_tiempo(texto: str) -> float:
+    """Segundos desde "90", "1:30" o "0:01:30.5" (ninguna parte negativa)."""
+    segundos = 0.0
+    for parte in str(texto).strip().split(":"):
+        valor = _numero(parte, f"Tiempo {texto}")
+        if valor < 0:
+            raise ValueError(f"Tiempo negativo: {texto}")
+        segundos = segundos * 60 + valor
+    return segundos
+
+
+def rango_frames(inicio_s, fin_s, fps: float, total: int = 0):
+    """
+    (primer frame, frame final exclusivo o None) para el rango en segundos.
+    inicio_s/fin_s pueden ser None. total <= 0 si no se conoce.
+    """
+    inicio = int(round(inicio_s * fps)) if inicio_s else 0
+    fin = int(round(fin_s * fps)) if fin_s is not None else None
+    if total > 0:
+        if inicio >= total:
+            raise ValueError(f"El inicio ({inicio_s} s) está después del final del video")
+        if fin is not None:
+            fin = min(fin, total)
+    if fin is not None and fin <= inicio:
+        raise ValueError("El final del rango debe ser posterior al inicio")
+    return inicio, fin
+
+
+def parsear_poligono(texto: str):
+    """Puntos [(x, y), ...] desde "x1,y1 x2,y2 x3,y3 ..." (también con ';')."""
+    puntos = []
+    for par in texto.replace(";", " ").split():
+        coordenadas = par.split(",")
+        if len(coordenadas) != 2:
+            raise ValueError(f"Punto '{par}' de --roi: se esperaba x,y")
+        x, y = (_numero(v, f"Punto '{par}' de --roi") for v in coordenadas)
+        puntos.append((int(round(x)), int(round(y))))
+    if len(puntos) < 3:
+        raise ValueError("El polígono de --roi necesita al menos 3 puntos")
+    return puntos
+
+
+class RegionInteres:
+    def __init__(self, puntos, W: int, H: int):
+        self.puntos = [(min(max(x, 0), W), min(max(y, 0), H)) for x, y in puntos]
+        self.poligono = np.array(self.puntos, dtype=np.int32).reshape(-1, 1, 2)
+        x, y, w, h = cv2.boundingRect(self.poligono)
+        self.rect = (x, y, min(x + w, W), min(y + h, H))
+        if self.rect[2] - self.rect[0] < 2 or self.rect[3] - self.rect[1] < 2:
+            raise ValueError("El polígono de --roi queda fuera del frame o es vacío")
+
+    @property
+    def tamano(self):
+        x1, y1, x2, y2 = self.rect
+        return x2 - x1, y2 - y1
+
+    def recortar(self, frame: np.ndarray) -> np.ndarray:
+        x1, y1, x2, y2 = self.rect
+        return frame[y1:y2, x1:x2]
+
+    def contiene(self, det) -> bool:
+        """¿El punto de apoyo del vehículo está dentro del polígono?"""
+        x1, _y1, x2, y2 = det[:4]
+        punto = ((x1 + x2) / 2.0, float(y2))
+        return cv2.pointPolygonTest(self.poligono, punto, False) >= 0
+
+    def al_frame(self, dets):
+        """Pasa detecciones del recorte a coordenadas del frame y filtra."""
+        ox, oy = self.rect[:2]
+        movidas = [(x1 + ox, y1 + oy, x2 + ox, y2 + oy, *resto)
+                   for x1, y1, x2, y2, *resto in dets]
+        return [det for det in movidas if self.contiene(det)]
+
+    def dibujar(self, out: np.ndarray, color=(0, 255, 255), grosor: int = 2):
+        cv2.polylines(out, [self.poligono], True, color, grosor)
+
+
+def region_desde_args(args, W: int, H: int):
+    """RegionInteres de --roi, o None si no se pidió."""
+    if not args.roi:
+        return None
+    return RegionInteres(parsear_poligono(args.roi), W, H)
+
+
+def _tiempo_arg(texto: str) -> float:
+    """parsear_tiempo para argparse (que solo muestra el mensaje de ArgumentTypeError)."""
+    try:
+        return parsear_tiempo(texto)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def argumentos_recorte(ap):
+    """Agrega al parser las opciones de rango de tiempo y región."""
+    ap.add_argument("--start", type=_tiempo_arg, default=None,
+                    help="Inicio del rango a procesar (segundos o mm:ss)")
+    ap.add_argument("--end", type=_tiempo_arg, default=None,
+                    help="Final del rango a procesar (segundos o mm:ss)")
+    ap.add_argument("--roi", default=None,
+                    help='Polígono de interés en píxeles: "x1,y1 x2,y2 x3,y3 ..."')
@@ -0,0 +1,57 @@
+"""
+Registro de tracks con ciclo de vida acotado.
+
+Guarda el trail (centros recientes) y el último frame visto de cada ID.
+Los tracks que no aparecen en `ttl` frames se eliminan, y si hay más de
+`max_tracks` vivos se eliminan los vistos hace más tiempo. Así la memoria
+y el costo de dibujar no crecen con la duración del video.
+"""
+from collections import OrderedDict, deque
+
+import cv2
+import numpy as np
+
+
+class RegistroTracks:
+    def __init__(self, largo_trail: int, ttl: int = 150, max_tracks: int = 1000):
+        self.largo_trail = max(largo_trail, 1)
+        self.ttl = ttl
+        self.max_tracks = max_tracks
+        self.frame = 0
+        # tid -> (último frame visto, deque de centros); ordenado por último visto
+        self.tracks = OrderedDict()
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def actualizar(self, vehiculos):
+        """Agrega el centro de cada vehículo a su trail y purga los viejos."""
+        self.frame += 1
+        for (x1, y1, x2, y2, tid, _cf, _cls), _lights in vehiculos:
+            cx = int((x1 + x2) / 2)
+            cy = int((y1 + y2) / 2)
+            if tid in self.tracks:
+                pts = self.tracks.pop(tid)[1]
+            else:
+                pts = deque(maxlen=self.largo_trail)
+            pts.append((cx, cy))
+            self.tracks[tid] = (self.frame, pts)
+        self.purgar()
+
+    def purgar(self):
+        """Elimina tracks vencidos por TTL y los más viejos si sobran."""
+        while self.tracks:
+            tid, (visto, _pts) = next(iter(self.tracks.items()))
+            vencido = self.ttl > 0 and self.frame - visto > self.ttl
+            sobra = self.max_tracks > 0 and len(self.tracks) > self.max_tracks
+            if not (vencido or sobra):
+                break
+            del self.tracks[tid]
+
+    def dibujar(self, out: np.ndarray, color=(255, 0, 255), grosor: int = 5):
+        """Dibuja todos los trails con una sola llamada a cv2.polylines."""
+        lineas = [np.array(pts, dtype=np.int32).reshape(-1, 1, 2)
+                  for _visto, pts in self.tracks.values() if len(pts) >= 2]
+        if lineas:
+            cv2.polylines(out, lineas, False, color, grosor)
+        return out
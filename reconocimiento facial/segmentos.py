@@ -0,0 +1,287 @@
+"""
+Procesamiento de un video largo en paralelo, por segmentos de tiempo.
+
+1. El video se parte en N segmentos. Cada uno empieza `solape` frames antes
+   de su núcleo para que el tracker llegue "caliente" al primer frame propio.
+2. Cada segmento corre en su propio proceso con su propia instancia de YOLO
+   y devuelve los vehículos (cajas, IDs locales, luces) de cada frame.
+3. Los IDs locales se traducen a IDs globales comparando, en los frames de
+   solape, las cajas del segmento anterior con las del nuevo (votos por IoU).
+4. Cada proceso dibuja su núcleo en un .mp4 temporal (con el encoder elegido
+   en los args), y al final se unen en un solo video (ffmpeg -c copy si está
+   disponible, si no reescribiendo) y se escribe un solo stream de eventos.
+"""
+import multiprocessing as mp
+import os
+import subprocess
+import tempfile
+from itertools import islice
+from pathlib import Path
+
+import cv2
+
+from escritor_video import buscar_ffmpeg, escritor_desde_args
+from recorte import rango_frames, region_desde_args
+
+# IoU mínima para que dos cajas del solape voten por el mismo vehículo
+IOU_SOLAPE = 0.5
+
+
+def dividir(total: int, n: int, solape: int):
+    """
+    [(inicio, nucleo, fin), ...]: cada segmento procesa [inicio, fin) y se
+    queda con [nucleo, fin); inicio = nucleo - solape (menos en el primero).
+    """
+    n = max(1, min(n, total))
+    cortes = [total * k // n for k in range(n + 1)]
+    return [(max(0, cortes[k] - solape if k else 0), cortes[k], cortes[k + 1])
+            for k in range(n)]
+
+
+def _hilos_por_proceso(procesos: int) -> int:
+    return max(1, (os.cpu_count() or 1) // max(1, procesos))
+
+
+def _abrir(path, inicio: int):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"No pude abrir: {path}")
+    if inicio > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, inicio)
+    return cap
+
+
+def _analizar_segmento(tarea):
+    """Proceso hijo: tracking + color de [inicio, fin) con un YOLO propio."""
+    args, inicio, fin, hilos = tarea
+    # Import tardío: pruebavideo importa este módulo
+    import torch
+
+    import pruebavideo as pv
+    from luces_freno import CacheLuces
+    from modelo_exportado import modelo_desde_args
+    from movimiento import compuerta_desde_args
+
+    torch.set_num_threads(hilos)
+    cv2.setNumThreads(hilos)
+
+    model = modelo_desde_args(args)  # ya exportado por el proceso principal
+    cap = _abrir(args.input, inicio)
+    W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    region = region_desde_args(args, W, H)
+    ancho, alto = region.tamano if region is not None else (W, H)
+    escala = pv.escala_inferencia(ancho, alto, args.infer_long_side, args.infer_scale)
+    cache = None
+    if args.light_cache > 0:
+        cache = CacheLuces(cada=args.light_cache, umbral_mov=args.cache_move,
+                           umbral_rojo=args.cache_red)
+    compuerta = compuerta_desde_args(args)
+
+    frames = []
+    try:
+        for lote in pv.agrupar(islice(pv.leer_frames(cap), fin - inicio), args.batch):
+            dets_lote = pv.rastrear_lote(model, lote, args, W, H, escala,
+                                         compuerta, region)
+            for frame, dets in zip(lote, dets_lote):
+                vehiculos, _mask = pv.analizar_vehiculos(
+                    frame, dets, args, cache, escala=args.color_scale)
+                frames.append(vehiculos)
+    finally:
+        cap.release()
+    return {"inicio": inicio, "fin": fin, "frames": frames,
+            "names": dict(model.names)}
+
+
+def _iou(a, b) -> float:
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def emparejar(previos, nuevos):
+    """
+    Empareja IDs del segmento anterior con IDs del nuevo usando los frames
+    de solape. previos/nuevos: listas alineadas de vehiculos por frame.
+    Un par vota en cada frame donde sus cajas se solapan (IoU >= IOU_SOLAPE)
+    y se acepta si coincide en al menos la mitad de los frames donde aparece
+    el ID nuevo. Devuelve {id_nuevo: id_previo}.
+    """
+    votos = {}
+    apariciones = {}
+    for veh_a, veh_b in zip(previos, nuevos):
+        for det_b, _lb in veh_b:
+            apariciones[det_b[4]] = apariciones.get(det_b[4], 0) + 1
+        for det_a, _la in veh_a:
+            for det_b, _lb in veh_b:
+                if _iou(det_a[:4], det_b[:4]) >= IOU_SOLAPE:
+                    par = (det_a[4], det_b[4])
+                    votos[par] = votos.get(par, 0) + 1
+
+    usados_a, usados_b, pares = set(), set(), {}
+    for (a, b), v in sorted(votos.items(), key=lambda kv: -kv[1]):
+        if 2 * v < apariciones[b] or a in usados_a or b in usados_b:
+            continue
+        usados_a.add(a)
+        usados_b.add(b)
+        pares[b] = a
+    return pares
+
+
+def _con_ids(vehiculos, mapa):
+    return [((*det[:4], mapa[det[4]], *det[5:]), luces)
+            for det, luces in vehiculos]
+
+
+def unir_segmentos(resultados, segmentos):
+    """
+    Traduce los IDs locales a globales y devuelve la lista de vehículos de
+    cada frame del video (solo núcleos, sin repetir el solape).
+    """
+    siguiente = 1
+    salida = []  # frames [0, nucleo) ya con IDs globales
+    for res, (inicio, nucleo, _fin) in zip(resultados, segmentos):
+        frames = res["frames"]
+        warmup, propios = frames[:nucleo - inicio], frames[nucleo - inicio:]
+
+        # El solape puede ser más largo que el núcleo anterior (muchos
+        # segmentos en un video corto) y abarcar varios núcleos: se compara
+        # contra los mismos frames [inicio, nucleo) de la salida ya unida
+        pares = {}
+        if warmup:
+            pares = emparejar(salida[inicio:nucleo], warmup)
+
+        mapa = {}
+        for vehiculos in frames:
+            for det, _luces in vehiculos:
+                tid = det[4]
+                if tid in mapa:
+                    continue
+                if tid in pares:
+                    mapa[tid] = pares[tid]
+                else:
+                    mapa[tid] = siguiente
+                    siguiente += 1
+
+        salida.extend(_con_ids(v, mapa) for v in propios)
+    return salida
+
+
+def _renderizar_segmento(tarea):
+    """Proceso hijo: dibuja los vehículos (IDs globales) de su núcleo."""
+    args, nucleo, fin, previos, vehiculos, names, salida, hilos = tarea
+    import pruebavideo as pv
+    from registro_tracks import RegistroTracks
+
+    cv2.setNumThreads(hilos)
+    cap = _abrir(args.input, nucleo)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    writer = escritor_desde_args(args, salida, fps, (W, H))
+    region = region_desde_args(args, W, H)
+
+    trails = None
+    if args.trail > 0:
+        trails = RegistroTracks(args.trail, ttl=args.track_ttl,
+                                max_tracks=args.max_tracks)
+        for v in previos:  # continuidad de los trails entre segmentos
+            trails.actualizar(v)
+    try:
+        for frame, v in zip(islice(pv.leer_frames(cap), fin - nucleo), vehiculos):
+            if trails is not None:
+                trails.actualizar(v)
+            out = pv.dibujar_anotaciones(frame, v, names, trails)
+            if region is not None:
+                region.dibujar(out)
+            writer.write(out)
+    finally:
+        cap.release()
+        writer.release()
+    return salida
+
+
+def concatenar(partes, salida, args):
+    """Une los .mp4 de cada segmento en `salida`."""
+    ffmpeg = buscar_ffmpeg(args.ffmpeg)
+    if ffmpeg:
+        lista = Path(partes[0]).with_name("partes.txt")
+        lista.write_text("".join(f"file '{Path(p).resolve()}'\n" for p in partes))
+        r = subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "concat",
+                            "-safe", "0", "-i", str(lista), "-c", "copy", str(salida)])
+        if r.returncode == 0:
+            return
+
+    writer = None
+    for parte in partes:
+        cap = cv2.VideoCapture(parte)
+        if writer is None:
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                    int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            writer = escritor_desde_args(args, salida, fps, size)
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            writer.write(frame)
+        cap.release()
+    if writer is not None:
+        writer.release()
+
+
+def procesar_por_segmentos(args):
+    """Corre todo el flujo por segmentos según los args de pruebavideo."""
+    from eventos import EscritorEventos
+
+    cap = cv2.VideoCapture(args.input)
+    if not cap.isOpened():
+        raise RuntimeError(f"No pude abrir: {args.input}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+    if total <= 0:
+        raise RuntimeError("No se pudo leer la cantidad de frames del video")
+    # Con --start/--end se parte solo el rango; los índices de `segmentos`
+    # son relativos a su inicio y se pasan a absolutos para los procesos
+    inicio, fin = rango_frames(args.start, args.end, fps, total)
+    fin = total if fin is None else fin
+
+    segmentos = dividir(fin - inicio, args.segments, args.overlap)
+    procesos = min(args.workers or len(segmentos), len(segmentos))
+    hilos = _hilos_por_proceso(procesos)
+    print(f"{len(segmentos)} segmentos, {procesos} procesos, {hilos} hilos c/u")
+
+    # spawn: cada proceso arranca limpio (torch/OpenCV no se llevan bien con fork)
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(procesos) as pool:
+        resultados = pool.map(
+            _analizar_segmento,
+            [(args, inicio + a, inicio + b, hilos) for a, _nucleo, b in segmentos],
+            chunksize=1)
+        names = resultados[0]["names"]
+        vehiculos = unir_segmentos(resultados, segmentos)
+        del resultados
+
+        if args.events:
+            with EscritorEventos(args.events, fps, names, chunk=args.events_chunk,
+                                 inicio=inicio) as eventos:
+                for v in vehiculos:
+                    eventos.agregar(v)
+            print(f"Eventos: {eventos.total} registros en {args.events}")
+
+        if args.analytics_only:
+            return
+
+        with tempfile.TemporaryDirectory(dir=Path(args.output).resolve().parent) as tmp:
+            tareas = []
+            for k, (_a, nucleo, b) in enumerate(segmentos):
+                previos = vehiculos[max(0, nucleo - args.trail):nucleo] if args.trail > 0 else []
+                tareas.append((args, inicio + nucleo, inicio + b, previos,
+                               vehiculos[nucleo:b], names,
+                               os.path.join(tmp, f"seg_{k:04d}.mp4"), hilos))
+            partes = pool.map(_renderizar_segmento, tareas, chunksize=1)
+            concatenar(partes, args.output, args)
+    print(f"Listo: {args.output}")
@@ -0,0 +1,399 @@
+"""
+Servidor de varios streams con un solo modelo YOLO cargado.
+
+    python3 servidor_streams.py --input cam1.mp4 --input cam2.mp4 ... \\
+        --model yolo12n.pt --realtime --max-age 500 --output-dir salidas
+
+- Cada fuente tiene un hilo lector (con --realtime reproduce el archivo a su
+  fps, como si fuera una cámara) y un hilo de salida (color, dibujo,
+  encoder y eventos), cada uno con su cola acotada.
+- El hilo principal junta el frame más antiguo pendiente de cada stream y
+  los pasa por YOLO en una sola llamada (model.predict en lote); después
+  actualiza el tracker propio de cada stream, así los IDs no se mezclan.
+- Con --realtime no se acumula latencia: si la cola de un stream se llena
+  se descarta el frame más viejo, y los frames con más de --max-age ms
+  desde su captura se descartan antes de la inferencia. En el video de
+  salida cada frame descartado se reemplaza por el último anotado, así el
+  video dura lo mismo que la fuente. Sin --realtime las colas bloquean
+  (backpressure) y no se pierde ningún frame.
+- Con --loop los archivos vuelven a empezar al terminar (servicio continuo
+  hasta Ctrl+C).
+"""
+import argparse
+import queue
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.trackers.track import TRACKER_MAP
+from ultralytics.utils import YAML, IterableSimpleNamespace
+from ultralytics.utils.checks import check_yaml
+
+import pruebavideo as pv
+from escritor_video import argumentos_escritor, escritor_desde_args
+from eventos import EscritorEventos
+from metricas import Histograma
+from modelo_exportado import argumentos_runtime, modelo_desde_args
+from pipeline import FIN
+from registro_tracks import RegistroTracks
+
+
+def crear_tracker(nombre: str):
+    """Tracker de ultralytics (bytetrack/botsort) independiente del modelo."""
+    cfg = IterableSimpleNamespace(**YAML.load(check_yaml(nombre)))
+    if cfg.tracker_type not in ("bytetrack", "botsort"):
+        raise ValueError(f"Tracker no soportado en el servidor: {cfg.tracker_type}")
+    if getattr(cfg, "with_reid", False):
+        raise ValueError("El servidor no soporta trackers con ReID (with_reid: True)")
+    return TRACKER_MAP[cfg.tracker_type](args=cfg)
+
+
+def aplicar_tracker(tracker, result):
+    """
+    Actualiza `tracker` con las detecciones de `result` y devuelve el
+    resultado con IDs, igual que hace model.track() internamente.
+    """
+    tracks = tracker.update(result.boxes.cpu().numpy(), result.orig_img)
+    if len(tracks) == 0:
+        return result[:0]
+    rastreado = result[tracks[:, -1].astype(int)]
+    rastreado.update(boxes=torch.as_tensor(tracks[:, :-1],
+                                           device=result.boxes.data.device))
+    return rastreado
+
+
+class Stream:
+    """Una fuente de video con su lector, su tracker y su salida."""
+
+    def __init__(self, k: int, path: str, args, names, parar):
+        self.path = path
+        self.nombre = f"{k:02d}_{Path(path).stem}"
+        self.args = args
+        self.names = names
+        self.parar = parar
+
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"No pude abrir: {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.W = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.H = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.escala = pv.escala_inferencia(self.W, self.H, args.infer_long_side,
+                                           args.infer_scale)
+        self.tracker = crear_tracker(args.tracker)
+
+        salida = Path(args.output_dir)
+        self.writer = None
+        if not args.no_video:
+            self.writer = escritor_desde_args(args, salida / f"{self.nombre}.mp4",
+                                              self.fps, (self.W, self.H))
+        self.eventos = None
+        if args.events:
+            self.eventos = EscritorEventos(salida / f"{self.nombre}.{args.events}",
+                                           self.fps, names)
+        self.trails = RegistroTracks(args.trail, ttl=args.track_ttl,
+                                     max_tracks=args.max_tracks)
+
+        self.entrada = queue.Queue(maxsize=max(1, args.queue_size))
+        self.salida = queue.Queue(maxsize=max(1, args.queue_size))
+        self.leido = False  # el lector terminó
+        self.leidos = 0
+        self.procesados = 0
+        self.descartados = 0
+        self.repetidos = 0  # frames descartados que en el video son el anterior
+        self.latencia = Histograma()
+        self.error = None
+        self._hilos = [threading.Thread(target=self._leer, name=f"leer-{self.nombre}",
+                                        daemon=True),
+                       threading.Thread(target=self._anotar, name=f"anotar-{self.nombre}",
+                                        daemon=True)]
+
+    def iniciar(self):
+        for hilo in self._hilos:
+            hilo.start()
+
+    def _encolar(self, cola, item) -> bool:
+        """Con --realtime descarta el item más viejo si la cola está llena."""
+        if self.args.realtime:
+            while True:
+                try:
+                    cola.put_nowait(item)
+                    return True
+                except queue.Full:
+                    try:
+                        cola.get_nowait()
+                        self.descartados += 1
+                    except queue.Empty:
+                        pass
+        while not self.parar.is_set():
+            try:
+                cola.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _leer(self):
+        periodo = 1.0 / self.fps
+        inicio = time.monotonic()
+        n = 0
+        try:
+            while not self.parar.is_set():
+                ok, frame = self.cap.read()
+                if not ok:
+                    if self.args.loop and n > 0:
+                        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    break
+                if self.args.realtime:
+                    # Una cámara entrega el frame n en inicio + n * periodo
+                    espera = inicio + n * periodo - time.monotonic()
+                    if espera > 0:
+                        time.sleep(espera)
+                self.leidos += 1
+                if not self._encolar(self.entrada, (time.monotonic(), n, frame)):
+                    break
+                n += 1
+        except BaseException as exc:
+            self.error = exc
+            self.parar.set()
+        finally:
+            self.leido = True
+
+    def tomar(self, max_edad: float):
+        """El frame pendiente más antiguo que no esté vencido, o None."""
+        ahora = time.monotonic()
+        while True:
+            try:
+                item = self.entrada.get_nowait()
+            except queue.Empty:
+                return None
+            if max_edad > 0 and ahora - item[0] > max_edad:
+                self.descartados += 1
+                continue
+            return item
+
+    def terminado(self) -> bool:
+        return self.leido and self.entrada.empty()
+
+    def entregar(self, t_captura, indice, frame, dets):
+        self._encolar(self.salida, (t_captura, indice, frame, dets))
+
+    def cerrar_entrada(self):
+        """Avisa al hilo de salida que no vienen más frames."""
+        while self._hilos[1].is_alive():
+            try:
+                self.salida.put(FIN, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _rellenar(self, out, hasta):
+        """Repite `out` en el video por los frames descartados antes de `hasta`."""
+        if self.writer is not None and out is not None:
+            for _ in range(hasta - self.escritos):
+                self.writer.write(out)
+            self.repetidos += max(hasta - self.escritos, 0)
+        self.escritos = max(self.escritos, hasta)
+
+    def _anotar(self):
+        args = self.args
+        self.escritos = 0  # índice del próximo frame de la fuente en el video
+        out = None
+        try:
+            while True:
+                try:
+                    item = self.salida.get(timeout=0.1)
+                except queue.Empty:
+                    if self.parar.is_set():
+                        return
+                    continue
+                if item is FIN:
+                    # Los descartados al final también ocupan su lugar
+                    self._rellenar(out, self.leidos)
+                    return
+                t_captura, indice, frame, dets = item
+                self._rellenar(out, indice)
+                vehiculos, _mask = pv.analizar_vehiculos(frame, dets, args,
+                                                         escala=args.color_scale)
+                if args.trail > 0:
+                    self.trails.actualizar(vehiculos)
+                if self.writer is not None:
+                    out = pv.dibujar_anotaciones(frame, vehiculos, self.names,
+                                                 self.trails if args.trail > 0 else None)
+                    self.writer.write(out)
+                self.escritos = indice + 1
+                if self.eventos is not None:
+                    self.eventos.agregar(vehiculos)
+                self.procesados += 1
+                self.latencia.agregar(time.monotonic() - t_captura)
+        except BaseException as exc:
+            self.error = exc
+            self.parar.set()
+
+    def cerrar(self):
+        for hilo in self._hilos:
+            hilo.join()
+        self.cap.release()
+        try:
+            if self.writer is not None:
+                self.writer.release()
+        finally:
+            if self.eventos is not None:
+                self.eventos.cerrar()
+
+
+def servir(model, streams, args, parar, cuenta):
+    """
+    Bucle de inferencia: un frame por stream y por llamada a YOLO, en orden
+    round-robin para que ningún stream acapare el lote.
+    cuenta (Counter): acumula "lotes" y "inferidos".
+    """
+    max_edad = args.max_age / 1000.0 if args.realtime else 0.0
+    vivos = list(streams)
+    turno = 0
+    while vivos and not parar.is_set():
+        lote = []
+        for s in vivos[turno:] + vivos[:turno]:
+            if len(lote) >= args.max_batch:
+                break
+            item = s.tomar(max_edad)
+            if item is not None:
+                lote.append((s, item))
+
+        if lote:
+            entrada = [pv.redimensionar(frame, s.escala) for s, (_t, _i, frame) in lote]
+            results = model.predict(
+                source=entrada if len(entrada) > 1 else entrada[0],
+                conf=args.conf,
+                classes=pv.VEHICLE_CLASSES,
+                verbose=False,
+                batch=len(entrada),
+            )
+            for (s, (t_captura, indice, frame)), r in zip(lote, results):
+                dets = pv.detecciones_de_resultado(aplicar_tracker(s.tracker, r),
+                                                   s.W, s.H, s.escala)
+                s.entregar(t_captura, indice, frame, dets)
+            cuenta["lotes"] += 1
+            cuenta["inferidos"] += len(lote)
+
+        # Después de entregar el lote, así el FIN llega detrás del último frame
+        for s in [s for s in vivos if s.terminado()]:
+            s.cerrar_entrada()
+            vivos.remove(s)
+        turno = (turno + 1) % max(len(vivos), 1)
+        if not lote:
+            time.sleep(0.002)
+
+
+def construir_parser():
+    ap = argparse.ArgumentParser(
+        description="Varios streams con un solo modelo YOLO compartido")
+    ap.add_argument("--input", action="append", required=True,
+                    help="Video de entrada (repetir para cada stream)")
+    ap.add_argument("--output-dir", default="salidas",
+                    help="Carpeta para los videos/eventos de cada stream")
+    ap.add_argument("--no-video", action="store_true",
+                    help="No dibuja ni codifica video (solo eventos)")
+    ap.add_argument("--events", choices=["jsonl", "parquet"], default=None,
+                    help="Guarda eventos de cada stream en este formato")
+    ap.add_argument("--model", default="yolo12n.pt", help="Modelo YOLO")
+    argumentos_runtime(ap)
+    ap.add_argument("--tracker", default="bytetrack.yaml",
+                    help="bytetrack.yaml o botsort.yaml (sin ReID)")
+    ap.add_argument("--conf", type=float, default=0.25, help="Confianza YOLO")
+    ap.add_argument("--trail", type=int, default=0,
+                    help="Longitud del trail (0 desactiva)")
+    ap.add_argument("--track-ttl", type=int, default=150,
+                    help="Frames sin ver un track antes de olvidarlo (0 = nunca)")
+    ap.add_argument("--max-tracks", type=int, default=1000,
+                    help="Máximo de tracks vivos en memoria (0 = sin límite)")
+    pv.argumentos_luces(ap)
+    ap.add_argument("--infer-long-side", type=int, default=0,
+                    help="Reduce el frame a este lado largo antes de YOLO (0 = original)")
+    ap.add_argument("--infer-scale", type=float, default=1.0,
+                    help="Factor de reducción del frame antes de YOLO")
+    ap.add_argument("--color-scale", type=float, default=1.0,
+                    help="Factor de reducción para el análisis de color")
+    argumentos_escritor(ap)
+
+    ap.add_argument("--realtime", action="store_true",
+                    help="Reproduce los archivos a su fps como si fueran cámaras "
+                         "y descarta frames viejos en vez de acumular latencia")
+    ap.add_argument("--max-age", type=float, default=500.0,
+                    help="Con --realtime, ms máximos desde la captura para inferir un frame")
+    ap.add_argument("--loop", action="store_true",
+                    help="Vuelve a empezar cada archivo al terminar (hasta Ctrl+C)")
+    ap.add_argument("--max-batch", type=int, default=16,
+                    help="Máximo de frames (uno por stream) por llamada a YOLO")
+    ap.add_argument("--queue-size", type=int, default=4,
+                    help="Frames máximos en las colas de cada stream")
+    return ap
+
+
+def main():
+    ap = construir_parser()
+    args = ap.parse_args()
+    if args.no_video and not args.events:
+        ap.error("--no-video requiere --events")
+    if args.max_batch < 1:
+        ap.error("--max-batch debe ser al menos 1")
+    if not 0 < args.infer_scale <= 1 or not 0 < args.color_scale <= 1:
+        ap.error("--infer-scale y --color-scale deben estar en (0, 1]")
+    if args.int8 and args.runtime == "torch":
+        ap.error("--int8 requiere --runtime onnx u openvino")
+
+    # una sola carga para todos los streams
+    model = modelo_desde_args(args, calibracion=args.input[0])
+    names = model.names
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+
+    parar = threading.Event()
+    streams = [Stream(k, path, args, names, parar)
+               for k, path in enumerate(args.input)]
+    # La primera inferencia es varias veces más lenta (inicialización):
+    # se hace antes de arrancar los lectores para no descartar por eso
+    s = streams[0]
+    model.predict(source=np.zeros((int(s.H * s.escala), int(s.W * s.escala), 3), np.uint8),
+                  conf=args.conf, verbose=False)
+    cuenta = Counter()
+    t0 = time.monotonic()
+    for s in streams:
+        s.iniciar()
+    try:
+        servir(model, streams, args, parar, cuenta)
+    except KeyboardInterrupt:
+        print("\nDeteniendo...")
+    finally:
+        # Los hilos de salida terminan de vaciar su cola antes de salir
+        parar.set()
+        for s in streams:
+            s.cerrar()
+    segundos = time.monotonic() - t0
+
+    for s in streams:
+        if s.error is not None:
+            raise RuntimeError(f"Falló el stream {s.nombre}") from s.error
+
+    print(f"\n{'stream':<24}{'leídos':>8}{'procesados':>12}{'descartados':>13}"
+          f"{'lat p50 ms':>12}{'lat p95 ms':>12}")
+    for s in streams:
+        lat = s.latencia.resumen(1000.0)
+        print(f"{s.nombre:<24}{s.leidos:>8}{s.procesados:>12}{s.descartados:>13}"
+              f"{lat.get('p50', 0.0):>12.1f}{lat.get('p95', 0.0):>12.1f}")
+    for s in streams:
+        if s.repetidos:
+            print(f"{s.nombre}: {s.repetidos} frames descartados se reemplazaron "
+                  "en el video por el último frame anotado")
+    total = sum(s.procesados for s in streams)
+    print(f"{len(streams)} streams, 1 modelo, {cuenta['lotes']} llamadas a YOLO "
+          f"({cuenta['inferidos'] / max(cuenta['lotes'], 1):.1f} frames/llamada), "
+          f"{total / segundos:.1f} frames/s en total")
+
+
+if __name__ == "__main__":
+    main()
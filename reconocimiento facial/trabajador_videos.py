@@ -0,0 +1,407 @@
+"""
+Procesos de trabajo persistentes para procesar muchos videos seguidos.
+
+Lanzar `python pruebavideo.py` por video paga cada vez el arranque del
+intérprete, el import de ultralytics y la carga del modelo; en clips cortos
+eso es la mayor parte del tiempo. Un proceso de trabajo hace todo eso una
+sola vez y después procesa los videos que le llegan con el modelo ya
+cargado (solo se reinicia el tracker entre uno y otro).
+
+Cada proceso procesa un video a la vez: el contador de IDs de los tracks
+de ultralytics es global al proceso, así que dos videos en paralelo en el
+mismo proceso mezclarían sus IDs. La concurrencia se logra con varios
+procesos (ColaTrabajos).
+
+Protocolo: una línea JSON por mensaje por stdin/stdout.
+    -> {"tipo": "procesar", "id": 1, "argv": ["--input", "a.mp4", ...]}
+    -> {"tipo": "cancelar", "id": 1}
+    -> {"tipo": "salir"}
+    <- {"tipo": "listo"}                     (modelo cargado, esperando)
+    <- {"tipo": "inicio", "id": 1, "total": 900}
+    <- {"tipo": "progreso", "id": 1, "hechos": 450, "total": 900,
+        "fps": 24.8, "eta": 18.1}
+    <- {"tipo": "fin", "id": 1, "estado": "ok"|"cancelado"|"error",
+        "mensaje": "...", "segundos": 37.2}
+Los argv son los mismos argumentos de línea de comandos de pruebavideo.py.
+Lo que imprime pruebavideo va a stderr para no mezclarse con el protocolo.
+"""
+import argparse
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+RUTA = Path(__file__).resolve().parent
+
+# Segundos mínimos entre dos mensajes de progreso del mismo trabajo
+INTERVALO_PROGRESO = 0.25
+
+
+class Cancelado(Exception):
+    """El trabajo se canceló a mitad de camino."""
+
+
+# ----------------------------------------------------------------------
+# Lado del proceso de trabajo
+# ----------------------------------------------------------------------
+
+class _Canal:
+    """Salida del protocolo; la usan el hilo lector y el que procesa."""
+
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self.lock = threading.Lock()
+
+    def enviar(self, **mensaje):
+        linea = json.dumps(mensaje, ensure_ascii=False)
+        with self.lock:
+            self.archivo.write(linea + "\n")
+            self.archivo.flush()
+
+
+def _reiniciar_tracking(model):
+    """Deja el tracker del modelo como recién cargado para otro video."""
+    from ultralytics.trackers.basetrack import BaseTrack
+
+    predictor = getattr(model, "predictor", None)
+    if predictor is not None and hasattr(predictor, "trackers"):
+        del predictor.trackers  # track(persist=True) crea uno nuevo
+    BaseTrack.reset_id()
+
+
+class _Modelos:
+    """El último modelo usado, para no recargarlo entre videos."""
+
+    def __init__(self):
+        self.clave = None
+        self.model = None
+
+    def obtener(self, args):
+        from modelo_exportado import modelo_desde_args
+
+        clave = (args.model, args.runtime, args.int8)
+        if clave != self.clave:
+            self.model = None  # se libera antes de cargar el otro
+            self.model = modelo_desde_args(args, calibracion=args.input)
+            self.clave = clave
+        _reiniciar_tracking(self.model)
+        return self.model
+
+
+def _borrar_parciales(args):
+    """Un trabajo cancelado no deja un video ni eventos a medias."""
+    for path in (args.output, args.events):
+        if path and Path(path).is_file():
+            Path(path).unlink()
+
+
+def _correr(trabajo, modelos, canal, cancelar):
+    import cv2
+
+    import pruebavideo as pv
+    from segmentos import procesar_por_segmentos
+
+    ap = pv.construir_parser()
+    try:
+        args = ap.parse_args(trabajo["argv"])
+    except SystemExit:
+        raise ValueError(f"Argumentos inválidos: {' '.join(trabajo['argv'])}") from None
+    pv.validar_args(args)
+    if args.show:
+        raise ValueError("--show no está disponible en el proceso de trabajo")
+
+    if args.segments > 1:  # sin progreso por frame: cada segmento es otro proceso
+        canal.enviar(tipo="inicio", id=trabajo["id"], total=0)
+        pv.exportar_desde_args(args, calibracion=args.input)
+        procesar_por_segmentos(args)
+        return
+
+    entrada = pv.abrir_entrada(args)
+    cap, inicio, fin = entrada[0], entrada[4], entrada[5]
+    total = (fin if fin is not None else int(cap.get(cv2.CAP_PROP_FRAME_COUNT))) - inicio
+    total = max(total, 0)
+    try:
+        model = modelos.obtener(args) if not args.replay else None
+    except BaseException:
+        cap.release()
+        raise
+    canal.enviar(tipo="inicio", id=trabajo["id"], total=total)
+
+    t0 = time.monotonic()
+    ultimo = 0.0
+
+    def progreso(hechos):
+        nonlocal ultimo
+        if cancelar.is_set():
+            raise Cancelado()
+        ahora = time.monotonic()
+        if ahora - ultimo < INTERVALO_PROGRESO and hechos != total:
+            return
+        ultimo = ahora
+        fps = hechos / max(ahora - t0, 1e-9)
+        eta = (total - hechos) / fps if total > 0 else None
+        canal.enviar(tipo="progreso", id=trabajo["id"], hechos=hechos,
+                     total=total, fps=round(fps, 2),
+                     eta=None if eta is None else round(max(eta, 0.0), 1))
+
+    try:
+        pv.procesar(args, entrada, model=model, progreso=progreso)
+    except Exception as exc:
+        # En el pipeline la excepción llega envuelta en PipelineError
+        if isinstance(exc, Cancelado) or isinstance(exc.__cause__, Cancelado):
+            _borrar_parciales(args)
+            raise Cancelado() from None
+        raise
+
+
+def servir(canal, modelo_inicial=None):
+    """Bucle del proceso de trabajo: lee comandos y procesa de a un video."""
+    import pruebavideo as pv  # el import pesado (ultralytics) se paga acá, una vez
+
+    modelos = _Modelos()
+    if modelo_inicial:
+        modelos.obtener(pv.construir_parser().parse_args(
+            ["--input", "", "--model", modelo_inicial]))
+    pendientes = queue.Queue()
+    actual = {"id": None, "cancelar": threading.Event()}
+    cancelados = set()
+    lock = threading.Lock()
+
+    def leer_comandos():
+        for linea in sys.stdin:
+            try:
+                msg = json.loads(linea)
+            except ValueError:
+                continue
+            if msg.get("tipo") == "procesar":
+                pendientes.put(msg)
+            elif msg.get("tipo") == "cancelar":
+                with lock:
+                    if msg.get("id") == actual["id"]:
+                        actual["cancelar"].set()
+                    else:
+                        cancelados.add(msg.get("id"))
+            elif msg.get("tipo") == "salir":
+                break
+        # stdin cerrado (la GUI se fue) o "salir": no se empieza nada más
+        # y lo que esté corriendo se corta
+        with lock:
+            actual["cancelar"].set()
+        pendientes.put(None)
+
+    threading.Thread(target=leer_comandos, daemon=True).start()
+    canal.enviar(tipo="listo")
+    while True:
+        trabajo = pendientes.get()
+        if trabajo is None:
+            return
+        with lock:
+            if trabajo["id"] in cancelados:
+                cancelados.discard(trabajo["id"])
+                canal.enviar(tipo="fin", id=trabajo["id"], estado="cancelado",
+                             mensaje="", segundos=0.0)
+                continue
+            actual["id"] = trabajo["id"]
+            actual["cancelar"] = threading.Event()
+            cancelar = actual["cancelar"]
+        t0 = time.monotonic()
+        estado, mensaje = "ok", ""
+        try:
+            _correr(trabajo, modelos, canal, cancelar)
+        except Cancelado:
+            estado = "cancelado"
+        except Exception as exc:
+            estado, mensaje = "error", f"{type(exc).__name__}: {exc}"
+            print(f"Falló el trabajo {trabajo['id']}: {mensaje}", file=sys.stderr)
+        with lock:
+            actual["id"] = None
+        canal.enviar(tipo="fin", id=trabajo["id"], estado=estado, mensaje=mensaje,
+                     segundos=round(time.monotonic() - t0, 2))
+
+
+# ----------------------------------------------------------------------
+# Lado del cliente (la GUI)
+# ----------------------------------------------------------------------
+
+class Trabajador:
+    """
+    Un proceso de trabajo visto desde el cliente. `al_mensaje(trabajador,
+    mensaje)` se llama desde un hilo lector por cada mensaje recibido; al
+    terminar el proceso llega {"tipo": "terminado"}.
+    """
+
+    def __init__(self, al_mensaje, modelo=None):
+        cmd = [sys.executable, str(RUTA / "trabajador_videos.py")]
+        if modelo:
+            cmd += ["--model", modelo]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, text=True,
+                                     encoding="utf-8", bufsize=1)
+        self.al_mensaje = al_mensaje
+        self.listo = False
+        self.trabajo = None  # id del trabajo en curso
+        threading.Thread(target=self._leer, daemon=True).start()
+
+    def _leer(self):
+        for linea in self.proc.stdout:
+            try:
+                msg = json.loads(linea)
+            except ValueError:
+                continue
+            self.al_mensaje(self, msg)
+        self.proc.wait()
+        self.al_mensaje(self, {"tipo": "terminado"})
+
+    def enviar(self, **mensaje):
+        try:
+            self.proc.stdin.write(json.dumps(mensaje, ensure_ascii=False) + "\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            pass  # el proceso ya terminó: llega "terminado" por el lector
+
+    def cerrar(self):
+        self.enviar(tipo="salir")
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+
+
+class ColaTrabajos:
+    """
+    Reparte una cola de trabajos entre `concurrencia` procesos de trabajo,
+    un trabajo por proceso a la vez. `al_evento(mensaje)` recibe (desde
+    hilos lectores) los mensajes de los trabajos: inicio, progreso y fin.
+    """
+
+    def __init__(self, al_evento, concurrencia: int = 1, modelo=None):
+        self.al_evento = al_evento
+        self.modelo = modelo
+        self.concurrencia = max(1, concurrencia)
+        self.trabajadores = []
+        self.pendientes = deque()
+        self.siguiente_id = 1
+        self.lock = threading.Lock()
+        self.cerrada = False
+        with self.lock:
+            self._completar_trabajadores()
+
+    def _completar_trabajadores(self):
+        while len(self.trabajadores) < self.concurrencia:
+            self.trabajadores.append(Trabajador(self._al_mensaje, self.modelo))
+
+    def _despachar(self):
+        """Asigna trabajos pendientes a los procesos libres (con el lock tomado)."""
+        for t in self.trabajadores[:self.concurrencia]:
+            if not self.pendientes:
+                return
+            if t.listo and t.trabajo is None:
+                trabajo_id, argv = self.pendientes.popleft()
+                t.trabajo = trabajo_id
+                t.enviar(tipo="procesar", id=trabajo_id, argv=argv)
+
+    def _al_mensaje(self, trabajador, msg):
+        tipo = msg.get("tipo")
+        eventos = [msg] if tipo in ("inicio", "progreso", "fin") else []
+        with self.lock:
+            if tipo == "listo":
+                trabajador.listo = True
+            elif tipo == "fin":
+                trabajador.trabajo = None
+                if (trabajador in self.trabajadores
+                        and self.trabajadores.index(trabajador) >= self.concurrencia):
+                    self.trabajadores.remove(trabajador)  # sobra tras ajustar()
+                    trabajador.cerrar()
+            elif tipo == "terminado":
+                if trabajador in self.trabajadores:
+                    self.trabajadores.remove(trabajador)
+                if trabajador.trabajo is not None:
+                    eventos.append(self._fallido(
+                        trabajador.trabajo, "El proceso de trabajo terminó inesperadamente"))
+                    trabajador.trabajo = None
+                if not self.cerrada:
+                    if trabajador.listo:
+                        self._completar_trabajadores()
+                    elif not self.trabajadores:
+                        # No llegó a arrancar (ej: falta ultralytics): no se reintenta
+                        eventos += [self._fallido(i, "No arrancó el proceso de trabajo")
+                                    for i, _argv in self.pendientes]
+                        self.pendientes.clear()
+            self._despachar()
+        for evento in eventos:
+            self.al_evento(evento)
+
+    @staticmethod
+    def _fallido(trabajo_id, mensaje):
+        return {"tipo": "fin", "id": trabajo_id, "estado": "error",
+                "mensaje": mensaje, "segundos": 0.0}
+
+    def agregar(self, argv) -> int:
+        """Encola un trabajo (argumentos de pruebavideo.py) y devuelve su id."""
+        with self.lock:
+            trabajo_id = self.siguiente_id
+            self.siguiente_id += 1
+            self.pendientes.append((trabajo_id, list(argv)))
+            self._despachar()
+        return trabajo_id
+
+    def cancelar(self, trabajo_id: int):
+        """Cancela un trabajo en espera o en curso."""
+        with self.lock:
+            for item in list(self.pendientes):
+                if item[0] == trabajo_id:
+                    self.pendientes.remove(item)
+                    break
+            else:
+                for t in self.trabajadores:
+                    if t.trabajo == trabajo_id:
+                        t.enviar(tipo="cancelar", id=trabajo_id)
+                return
+        self.al_evento({"tipo": "fin", "id": trabajo_id, "estado": "cancelado",
+                        "mensaje": "", "segundos": 0.0})
+
+    def ajustar(self, concurrencia: int):
+        """Cambia cuántos trabajos corren a la vez; los procesos que sobran se cierran al quedar libres."""
+        with self.lock:
+            self.concurrencia = max(1, concurrencia)
+            sobrantes = [t for t in self.trabajadores[self.concurrencia:] if t.trabajo is None]
+            for t in sobrantes:
+                self.trabajadores.remove(t)
+                t.cerrar()
+            self._completar_trabajadores()
+            self._despachar()
+
+    def cerrar(self):
+        """Cancela lo que esté corriendo y cierra todos los procesos."""
+        with self.lock:
+            self.cerrada = True
+            self.pendientes.clear()
+            trabajadores = list(self.trabajadores)
+        for t in trabajadores:
+            if t.trabajo is not None:
+                t.enviar(tipo="cancelar", id=t.trabajo)
+            t.cerrar()
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Proceso de trabajo persistente (lo lanza gui_pruebavideo.py)")
+    ap.add_argument("--model", default=None,
+                    help="Modelo a cargar al arrancar, antes del primer trabajo")
+    args = ap.parse_args()
+
+    # stdout queda solo para el protocolo; todo lo demás (prints de
+    # pruebavideo, logs de ultralytics) sale por stderr
+    canal = _Canal(os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8"))
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    servir(canal, args.model)
+
+
+if __name__ == "__main__":
+    main()